@@ -0,0 +1,269 @@
+/** nor_flash_model.v
+ *
+ * Behavioral x16 NOR flash model, the Verilog counterpart of
+ * nor_flash_behavioral_x16 (test_helpers/nor.py) with the same command set,
+ * CFI table, status data and timing, for simulations where the Python
+ * model's per-edge wake-ups dominate. VT mode reads are not modelled.
+ *
+ * The timing regs (ns) can be changed from Python. The array is loaded and
+ * read back in bulk through files: set load_file and toggle load_req for
+ * $readmemh, or set dump_file, dump_start, dump_end and toggle dump_req for
+ * $writememh (see nor_flash_verilog in nor.py).
+ *
+ */
+
+`default_nettype none
+`timescale 1ns/10ps
+
+module nor_flash_model #(
+    parameter ABITS        = 20, // 2**ABITS words, higher address bits alias
+    parameter SECTOR_ABITS = 16, // 2**SECTOR_ABITS words per erase sector
+    parameter PAGE_ABITS   = 3
+) (
+    input  wire        ce_n, oe_n, we_n,
+    input  wire [25:0] addr,
+    input  wire [15:0] data_i, // from the bridge
+    output wire [15:0] data_o, // 0 unless read data is valid
+    output reg         ry = 1'b1
+);
+
+    localparam WORDS   = 1 << ABITS;
+    localparam T_WP    = 35; // command cycles are sampled this long after the WE fall
+    localparam T_BUSY  = 90; // last command cycle to RY low
+
+    // timing, ns
+    reg [63:0] tacc = 180, tpacc = 25, tce = 180, toe = 25;
+    reg [63:0] tbusy_program = 60*1000;
+    reg [63:0] tbusy_erase_sector = 500*1000*1000;
+    reg [63:0] tbusy_erase_chip = 64'd30*1000*1000*1000;
+    reg [63:0] tsuspend_erase = 20*1000;
+
+    reg [15:0] mem [0:WORDS-1];
+    reg [15:0] cfi [0:'h77];
+
+    integer i;
+    initial begin
+        for (i = 0; i < WORDS; i = i + 1)
+            mem[i] = 16'hFFFF;
+        for (i = 0; i <= 'h77; i = i + 1)
+            cfi[i] = 16'h0000;
+        cfi['h10] = 16'h0051;
+        cfi['h11] = 16'h0052;
+        cfi['h12] = 16'h0059;
+        cfi['h13] = 16'h0002;
+    end
+
+    // backdoor
+    reg [8*256-1:0] load_file = 0, dump_file = 0;
+    reg      [31:0] dump_start = 0, dump_end = 0;
+    reg             load_req = 1'b0, dump_req = 1'b0;
+
+    always @(load_req) if (load_file != 0) $readmemh(load_file, mem);
+    always @(dump_req) if (dump_file != 0) $writememh(dump_file, mem, dump_start, dump_end);
+
+    // command state
+    localparam CMD_CYCLE_1 = 1, CMD_CYCLE_2 = 2, CMD_SELECT = 3, CMD_PROGRAM = 4,
+               CMD_WRITE_BUF = 5, CMD_ERASE_1 = 7, CMD_ERASE_2 = 8, CMD_ERASE_SEL = 9;
+
+    integer    state = CMD_CYCLE_1;
+    reg        cfi_mode = 1'b0;
+    reg        busy = 1'b0;
+    reg        erasing = 1'b0;  // sector erase started, not finished
+    reg [31:0] erase_sector = 0;
+    reg        suspended = 1'b0;
+    realtime   erase_left = 0;
+    reg  [7:0] dq7 = 8'h00;
+    reg        toggle = 1'b0;
+
+    // RY/busy updates are scheduled with the busy period number; starting
+    // or suspending a period drops the updates still pending
+    integer    busy_gen = 0;
+    reg        busy_erase = 1'b0;
+    realtime   busy_end = 0;
+
+    task automatic busy_after(input integer gen, input realtime t_set, input realtime t_clr);
+        fork
+            if (t_set >= 0) begin
+                /* verilator lint_off ZERODLY */ // delays come from the timing regs, 0 is allowed
+                #(t_set);
+                /* verilator lint_on ZERODLY */
+                if (gen == busy_gen) begin
+                    busy = 1'b1;
+                    ry = 1'b0;
+                end
+            end
+            begin
+                /* verilator lint_off ZERODLY */ // as above
+                #(t_clr);
+                /* verilator lint_on ZERODLY */
+                if (gen == busy_gen) begin
+                    ry = 1'b1;
+                    busy = 1'b0;
+                    if (busy_erase)
+                        erasing = 1'b0;
+                end
+            end
+        join_none
+    endtask
+
+    function in_erase(input [25:0] a);
+        in_erase = erasing && (({6'b0, a} & (WORDS - 1)) >> SECTOR_ABITS) == erase_sector;
+    endfunction
+
+    task start_busy(input realtime wait_ns, input erase);
+    begin
+        busy_gen = busy_gen + 1;
+        busy_erase = erase;
+        busy_end = $realtime + wait_ns;
+        busy_after(busy_gen, T_BUSY, wait_ns > T_BUSY ? wait_ns : T_BUSY);
+    end
+    endtask
+
+    task command(input [25:0] a, input [15:0] d);
+        reg [31:0] base;
+    begin
+        case (state)
+        CMD_CYCLE_1: begin
+            state = CMD_CYCLE_1;
+            if (d == 16'h00F0) begin // reset
+                busy = 1'b0;
+                cfi_mode = 1'b0;
+            end else if (a == 'h55 && d == 16'h0098) begin // CFI enter
+                cfi_mode = 1'b1;
+            end else if (d == 16'h00B0) begin // erase suspend
+                if (erasing && !suspended && busy_end - $realtime > tsuspend_erase) begin
+                    suspended = 1'b1;
+                    erase_left = busy_end - $realtime - tsuspend_erase;
+                    // the part goes ready after tsuspend_erase, the erase is not done
+                    busy_gen = busy_gen + 1;
+                    busy_erase = 1'b0;
+                    busy_after(busy_gen, -1, tsuspend_erase);
+                end
+            end else if (d == 16'h0030) begin // erase resume
+                if (suspended) begin
+                    suspended = 1'b0;
+                    start_busy(erase_left, 1'b1);
+                end
+            end else if (a == 'h555 && d == 16'h00AA) begin
+                state = CMD_CYCLE_2;
+            end
+        end
+        CMD_CYCLE_2:
+            state = (a == 'h2AA && d == 16'h0055) ? CMD_SELECT : CMD_CYCLE_1;
+        CMD_SELECT:
+            state = (a == 'h555 && d == 16'h00A0) ? CMD_PROGRAM   :
+                    (d == 16'h0025)               ? CMD_WRITE_BUF :
+                    (a == 'h555 && d == 16'h0080) ? CMD_ERASE_1   : CMD_CYCLE_1;
+        CMD_PROGRAM: begin
+            mem[a & (WORDS - 1)] = mem[a & (WORDS - 1)] & d;
+            dq7 = ~d[7:0] & 8'h80;
+            start_busy(tbusy_program, 1'b0);
+            state = CMD_CYCLE_1;
+        end
+        CMD_WRITE_BUF: ; // not implemented, as in nor.py
+        CMD_ERASE_1:
+            state = (a == 'h555 && d == 16'h00AA) ? CMD_ERASE_2 : CMD_CYCLE_1;
+        CMD_ERASE_2:
+            state = (a == 'h2AA && d == 16'h0055) ? CMD_ERASE_SEL : CMD_CYCLE_1;
+        CMD_ERASE_SEL: begin
+            if (a == 'h555 && d == 16'h0010) begin // chip erase
+                for (base = 0; base < WORDS; base = base + 1)
+                    mem[base] = 16'hFFFF;
+                start_busy(tbusy_erase_chip, 1'b0);
+            end else if (d == 16'h0030) begin // sector erase
+                erase_sector = ({6'b0, a} & (WORDS - 1)) >> SECTOR_ABITS;
+                for (base = 0; base < (1 << SECTOR_ABITS); base = base + 1)
+                    mem[(erase_sector << SECTOR_ABITS) | base] = 16'hFFFF;
+                erasing = 1'b1;
+                suspended = 1'b0;
+                start_busy(tbusy_erase_sector, 1'b1);
+            end
+            state = CMD_CYCLE_1;
+        end
+        default:
+            state = CMD_CYCLE_1;
+        endcase
+    end
+    endtask
+
+    // command cycles: WE low with CE low and OE high (WE and OE low is a VT read)
+    wire wr = !ce_n && !we_n && oe_n;
+
+    always @(posedge wr) begin
+        #(T_WP);
+        // while busy only an erase may be suspended
+        if (wr && !(busy && !(data_i == 16'h00B0 && erasing)))
+            command(addr, data_i);
+    end
+
+    // reads: data is valid tACC (tPACC within the open page) after the
+    // address, tCE after CE and tOE after OE fall, whichever is last
+    wire     rd = !ce_n && !oe_n;
+    reg      ce_q = 1'b1, oe_q = 1'b1;
+    reg [25:0] addr_q = 0;
+    realtime t_addr = 0, t_ce = 0, t_oe = 0, t_valid = 0;
+    reg      page_open = 1'b0;
+    reg      valid = 1'b0;
+    reg [15:0] dout = 0;
+    integer  upd = 0;
+
+    task automatic read_after(input realtime t);
+        fork
+            begin
+                /* verilator lint_off ZERODLY */ // t is 0 when the data is already valid
+                #(t);
+                /* verilator lint_on ZERODLY */
+                upd = upd + 1;
+            end
+        join_none
+    endtask
+
+    always @(addr or ce_n or oe_n) begin
+        if (ce_q && !ce_n)
+            t_ce = $realtime;
+        if (oe_q && !oe_n)
+            t_oe = $realtime;
+        if (!rd)
+            page_open = 1'b0;
+        if (addr != addr_q)
+            t_addr = $realtime + ((page_open && (addr >> PAGE_ABITS) == (addr_q >> PAGE_ABITS)) ? tpacc : tacc);
+        ce_q = ce_n;
+        oe_q = oe_n;
+        addr_q = addr;
+        valid = 1'b0;
+        t_valid = t_addr;
+        if (t_ce + tce > t_valid)
+            t_valid = t_ce + tce;
+        if (t_oe + toe > t_valid)
+            t_valid = t_oe + toe;
+        if (rd)
+            read_after(t_valid > $realtime ? t_valid - $realtime : 0);
+    end
+
+    always @(upd) begin
+        if (rd && !valid && $realtime + 0.005 >= t_valid) begin
+            valid = 1'b1;
+            page_open = 1'b1;
+            if (busy || (suspended && in_erase(addr))) begin
+                toggle = !toggle;
+                dout = 16'h0000;
+                if (busy) begin
+                    dout[6] = toggle;
+                    if (erasing && !suspended)
+                        dout[3] = 1'b1;
+                    else
+                        dout[7:0] = dout[7:0] | dq7;
+                end else
+                    dout[7] = 1'b1; // erase suspended
+                if (in_erase(addr))
+                    dout[2] = toggle;
+            end else if (cfi_mode)
+                dout = (addr <= 'h77) ? cfi[addr[6:0]] : 16'h0000;
+            else
+                dout = mem[addr & (WORDS - 1)];
+        end
+    end
+
+    assign data_o = (rd && valid) ? dout : 16'h0000;
+
+endmodule
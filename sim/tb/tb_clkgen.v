@@ -0,0 +1,56 @@
+/** tb_clkgen.v
+ *
+ * Clock generator for the cocotb testbench wrappers
+ *
+ * Python sets the registers (test_helpers/clock.py), the edges are made
+ * here without waking up the test. While en is set the clock runs: the
+ * first rising edge phase_ps after en rises, then high_ps high and low_ps
+ * low, with the times read again every half period so that a new period
+ * takes effect at the next edge. When en falls the current half period
+ * ends and the clock then stays at level. If en falls and rises again
+ * within a half period, the clock goes to level at its end and the first
+ * rising edge comes phase_ps after that.
+ *
+ */
+
+`default_nettype none
+`timescale 1ns/1ps
+
+module tb_clkgen (
+    output reg clk
+);
+
+    reg        en       = 1'b0;
+    reg        level    = 1'b0; // clk while stopped
+    reg [31:0] high_ps  = 32'd5000;
+    reg [31:0] low_ps   = 32'd5000;
+    reg [31:0] phase_ps = 32'd0;  // en to the first rising edge
+
+    initial clk = 1'b0;
+
+    always @(level) if (!en) clk = level;
+
+    // en rising edges, so that a restart within a half period is seen
+    integer starts = 0;
+    always @(posedge en) starts = starts + 1;
+
+    integer run;
+    always begin
+        wait (en);
+        run = starts;
+        // the delays are set from Python, phase_ps is 0 unless a phase is asked for
+        /* verilator lint_off ZERODLY */
+        #(phase_ps / 1000.0);
+        while (en && run == starts) begin
+            clk = 1'b1;
+            #(high_ps / 1000.0);
+            if (en && run == starts) begin
+                clk = 1'b0;
+                #(low_ps / 1000.0);
+            end
+        end
+        /* verilator lint_on ZERODLY */
+        clk = level;
+    end
+
+endmodule
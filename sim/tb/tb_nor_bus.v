@@ -8,11 +8,13 @@
 `timescale 1ns/100ps
 
 module tb_nor_bus (
-    input rst_i, clk_i,
+    input rst_i,
 
     input      [25:0] memwb_adr_i,
     input      [15:0] memwb_dat_i,
     input             memwb_we_i, memwb_stb_i, memwb_cyc_i,
+    input       [2:0] memwb_cti_i,
+    input       [1:0] memwb_bte_i,
     output            memwb_ack_o,
     output     [15:0] memwb_dat_o,
     output            memwb_stall_o,
@@ -57,13 +59,18 @@ module tb_nor_bus (
 `endif // !defined(VERILATOR)
     end
 
-    nor_bus norbus (
+    // clock, made by a generator set from Python (test_helpers/clock.py)
+    wire clk_i;
+    tb_clkgen clk_i_gen (.clk(clk_i));
+
+    nor_bus #(.NORCHIPS(1)) norbus (
         // system
         .sys_rst_i(rst_i), .sys_clk_i(clk_i),
         // mem wb
         .memwb_rst_i(rst_i),
         .memwb_adr_i(memwb_adr_i), .memwb_dat_i(memwb_dat_i),
         .memwb_we_i(memwb_we_i), .memwb_stb_i(memwb_stb_i), .memwb_cyc_i(memwb_cyc_i),
+        .memwb_cti_i(memwb_cti_i), .memwb_bte_i(memwb_bte_i),
         .memwb_err_o(memwb_err_o),
         .memwb_ack_o(memwb_ack_o), .memwb_dat_o(memwb_dat_o), .memwb_stall_o(memwb_stall_o),
         // cfg wb
@@ -76,7 +83,9 @@ module tb_nor_bus (
         .nor_ry_i(nor_ry_i), .nor_data_i(nor_data_i),
         .nor_data_o(nor_data_o), .nor_addr_o(nor_addr_o),
         .nor_ce_o(nor_ce_o), .nor_we_o(nor_we_o), .nor_oe_o(nor_oe_o),
-        .nor_data_oe(nor_data_oe)
+        .nor_data_oe(nor_data_oe),
+        // perf events
+        .perf_rd_o(), .perf_rdpg_o(), .perf_wr_o()
     );
 
 endmodule
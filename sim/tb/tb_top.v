@@ -4,17 +4,22 @@
  *
  */
 
+`include "busmap.vh"
+
+`ifndef NOR_MODEL_ABITS
+`define NOR_MODEL_ABITS 20
+`endif
+
 `default_nettype none
 `timescale 1ns/10ps
 
 module tb_top (
-    input rst_i, clk_i,
+    input rst_i,
 
     // QSPI interface
     input               [3:0] pad_spi_io_i,
     output              [3:0] pad_spi_io_o,
     output                    pad_spi_io_oe,
-    input                     pad_spi_sck_i,
     input                     pad_spi_sce_i,
 
     // wishbone
@@ -26,11 +31,12 @@ module tb_top (
     output [15:0] wb_dat_o,
     output        wb_stall_o,
 
-    input         nor_ry_i,
+    input  [`NOR_CHIPS-1:0] nor_ry_i,
     input  [15:0] nor_data_i,
     output [15:0] nor_data_o,
     output [25:0] nor_addr_o,
-    output        nor_ce_o, nor_we_o, nor_oe_o, nor_data_oe,
+    output [`NOR_CHIPS-1:0] nor_ce_o,
+    output        nor_we_o, nor_oe_o, nor_data_oe,
 
     output        passthrough_en_o
 );
@@ -52,13 +58,50 @@ module tb_top (
     end
 `endif
 
+    // clocks, made by generators set from Python (test_helpers/clock.py)
+    wire clk_i, pad_spi_sck_i;
+    tb_clkgen clk_i_gen (.clk(clk_i));
+    tb_clkgen pad_spi_sck_i_gen (.clk(pad_spi_sck_i));
+
+    // per device chip select and ready/busy line, for one device model per chip:
+    // nor_chip[c].ce and nor_chip[c].ry (AND'ed into nor_ry_i)
+    //
+    // nor_chip[c].model is the Verilog NOR model of the chip; with
+    // nor_model_en set it replaces the nor_data_i and nor_ry_i pads, without it
+    // the model is deselected and ignores the bus
+    reg                       nor_model_en = 1'b0;
+    wire     [`NOR_CHIPS-1:0] chip_ry;
+    wire [16*`NOR_CHIPS-1:0] model_data;
+    genvar c;
+    generate for (c = 0; c < `NOR_CHIPS; c = c + 1) begin : nor_chip
+        wire ce = nor_ce_o[c];
+        reg  ry = 1'b1;
+        wire model_ry;
+        nor_flash_model #(.ABITS(`NOR_MODEL_ABITS)) model (
+            .ce_n(ce || !nor_model_en), .oe_n(nor_oe_o), .we_n(nor_we_o),
+            .addr(nor_addr_o), .data_i(nor_data_o), .data_o(model_data[16*c +: 16]),
+            .ry(model_ry)
+        );
+        assign chip_ry[c] = ry && (model_ry || !nor_model_en);
+    end endgenerate
+
+    // unselected models drive 0
+    reg [15:0] model_data_or;
+    integer k;
+    always @(*) begin
+        model_data_or = 16'h0000;
+        for (k = 0; k < `NOR_CHIPS; k = k + 1)
+            model_data_or = model_data_or | model_data[16*k +: 16];
+    end
+
     top top (
         .reset_i(rst_i), .clk_i(clk_i),
         // qspi
         .pad_spi_io_i(pad_spi_io_i), .pad_spi_io_o(pad_spi_io_o), .pad_spi_io_oe(pad_spi_io_oe),
         .pad_spi_sck_i(pad_spi_sck_i), .pad_spi_sce_i(pad_spi_sce_i),
         // nor
-        .nor_ry_i(nor_ry_i), .nor_data_i(nor_data_i),
+        .nor_ry_i((nor_ry_i | {`NOR_CHIPS{nor_model_en}}) & chip_ry),
+        .nor_data_i(nor_model_en ? model_data_or : nor_data_i),
         .nor_data_o(nor_data_o), .nor_addr_o(nor_addr_o),
         .nor_ce_o(nor_ce_o), .nor_we_o(nor_we_o), .nor_oe_o(nor_oe_o),
         .nor_data_oe(nor_data_oe),
@@ -15,9 +15,8 @@ module tb_xspi_phy #(
 )(
     input t_dumpb, // 1 = stop dump, 0 = dump
 
-    input rst_i, clk_i,
+    input rst_i,
 
-    input                     sck_i,
     input                     sce_i,
     input               [3:0] sio_i,
     output              [3:0] sio_o,
@@ -62,6 +61,11 @@ module tb_xspi_phy #(
 `endif // !defined(VERILATOR)
     end
 
+    // clocks, made by generators set from Python (test_helpers/clock.py)
+    wire clk_i, sck_i;
+    tb_clkgen clk_i_gen (.clk(clk_i));
+    tb_clkgen sck_i_gen (.clk(sck_i));
+
     // dump control
     reg [1:0] r_dumpb;
     initial r_dumpb = 2'b00;
@@ -84,7 +88,8 @@ module tb_xspi_phy #(
     ) xspi_phy_slave (
         .sck_i(sck_i), .sce_i(spi_ce_nrst), .sio_i(sio_i), .sio_o(sio_o), .sio_oe(sio_oe),
         .txnbc_i(txnbc), .txndir_i(txndir), .txndone_o(txndone),
-        .txndata_i(txndata_mosi), .txndata_o(txndata_miso)
+        .txndata_i(txndata_mosi), .txndata_o(txndata_miso),
+        .sdly_i(1'b0)
     );
 
     //qspi_ctrl qspi_ctrl (
@@ -95,13 +100,16 @@ module tb_xspi_phy #(
         .txnbc_o(txnbc), .txndir_o(txndir), .txndone_i(txndone),
         .txndata_o(txndata_mosi), .txndata_i(txndata_miso), .txnreset_i(!sce_i),
         // control
-        .vt_mode(vt_mode_o),
+        .vt_mode(vt_mode_o), .passthrough_en_o(),
+        // nor_check DIFF stream, perf events (not in this testbench)
+        .diff_rd_o(), .diff_end_o(), .diff_dat_i({MEMWBDATABITS{1'b0}}),
+        .perf_frame_o(), .perf_cmd_o(),
         // debug
         .d_wstb(),
         // wb
         .memwb_cyc_o(memwb_cyc_o), .memwb_stb_o(memwb_stb_o), .memwb_we_o(memwb_we_o), .memwb_err_i(memwb_err_i),
         .memwb_adr_o(memwb_adr_o), .memwb_dat_o(memwb_dat_o), .memwb_ack_i(memwb_ack_i), .memwb_stall_i(memwb_stall_i),
-        .memwb_dat_i(memwb_dat_i),
+        .memwb_dat_i(memwb_dat_i), .memwb_cti_o(), .memwb_bte_o(),
         // cfg wb
         .cfgwb_rst_o(cfgwb_rst_o),
         .cfgwb_adr_o(cfgwb_adr_o), .cfgwb_dat_o(cfgwb_dat_o),
@@ -0,0 +1,147 @@
+"""Detector readout analysis
+
+Compares NOR array dumps (16-bit words, little-endian) against the reference
+pattern they were programmed with and reduces them to bit flip statistics:
+flips per sector and per bit position, flip direction, and clustered events
+(flipped words no more than `gap` words apart, counted as one hit).
+
+Dumps are processed in chunks so a full 64 Mword array can be analyzed
+from a memory map without holding intermediate arrays for all of it.
+"""
+
+import argparse
+import os
+import numpy as np
+from dataclasses import dataclass
+from typing import Union
+
+CHUNK_WORDS = 1 << 22
+
+cluster_dtype = np.dtype([('addr', np.int64), ('words', np.int64), ('bits', np.int64)])
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(a: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(a)
+else:
+    _popcount_lut = np.array([bin(i).count('1') for i in range(1 << 16)], dtype=np.uint8)
+    def popcount(a: np.ndarray) -> np.ndarray:
+        return _popcount_lut[a]
+
+@dataclass
+class flip_summary:
+    """Bit flip statistics of one dump"""
+    base: int              # address of the first word
+    words: int             # words compared
+    sector_words: int
+    flipped_bits: int
+    flipped_words: int
+    flips_1to0: int        # reference 1, read 0
+    flips_0to1: int        # reference 0, read 1
+    per_sector: np.ndarray # flipped bits per sector, index 0 is the sector containing base
+    per_bit: np.ndarray    # flipped bits per bit position (16)
+    clusters: np.ndarray   # cluster_dtype: first address, span in words, flipped bits
+
+    @property
+    def events(self) -> int:
+        return len(self.clusters)
+
+    @property
+    def multi_bit_events(self) -> int:
+        return int(np.count_nonzero(self.clusters['bits'] > 1))
+
+    def report(self) -> str:
+        lines = [
+            f"{self.words} words from {self.base:07X}h: {self.flipped_bits} bits flipped in {self.flipped_words} words "
+            f"(1->0 {self.flips_1to0}, 0->1 {self.flips_0to1})",
+            f"events: {self.events} ({self.multi_bit_events} multi-bit)",
+            "per bit: " + ' '.join(str(int(c)) for c in self.per_bit),
+        ]
+        hot = np.flatnonzero(self.per_sector)
+        lines += [f"sector {(self.base // self.sector_words) + s:4d}: {int(self.per_sector[s])}" for s in hot]
+        return '\n'.join(lines)
+
+def load_dump(path: str, count: int = -1, offset: int = 0) -> np.ndarray:
+    """Memory map a dump file of little-endian 16-bit words"""
+    return np.memmap(path, dtype='<u2', mode='r', offset=2*offset, shape=None if count < 0 else (count,))
+
+def analyze(dump: np.ndarray, ref: Union[int, np.ndarray] = 0x0000, base: int = 0, sector_words: int = 65536,
+            gap: int = 1, chunk_words: int = CHUNK_WORDS) -> flip_summary:
+    """Compare dump against ref (one word for every address, or an array like dump)
+
+    base is the NOR address of dump[0] and sets the sector boundaries.
+    """
+    dump = np.asarray(dump)
+    scalar_ref = np.ndim(ref) == 0
+    if not scalar_ref and len(ref) != len(dump):
+        raise ValueError(f"Reference length ({len(ref)}) does not match dump length ({len(dump)})")
+
+    n = len(dump)
+    first_sector = base // sector_words
+    n_sectors = (base + n - 1) // sector_words - first_sector + 1 if n else 0
+    per_sector = np.zeros(n_sectors, dtype=np.int64)
+    per_bit = np.zeros(16, dtype=np.int64)
+    f10 = f01 = 0
+    nz_addr, nz_bits = [], []
+
+    for c0 in range(0, n, chunk_words):
+        d = dump[c0:c0+chunk_words].astype(np.uint16, copy=False)
+        r = np.uint16(ref) if scalar_ref else np.asarray(ref[c0:c0+chunk_words], dtype=np.uint16)
+        x = d ^ r
+        nz = np.flatnonzero(x)
+        if len(nz) == 0:
+            continue
+        xn = x[nz]
+        rn = r if scalar_ref else r[nz]
+        bits = popcount(xn).astype(np.int64)
+        f10 += int(popcount(xn & rn).sum(dtype=np.int64))
+        f01 += int(popcount(xn & ~rn).sum(dtype=np.int64))
+        addr = base + c0 + nz
+        per_sector += np.bincount(addr // sector_words - first_sector, weights=bits, minlength=n_sectors).astype(np.int64)
+        for b in range(16):
+            per_bit[b] += np.count_nonzero(xn & np.uint16(1 << b))
+        nz_addr.append(addr)
+        nz_bits.append(bits)
+
+    if nz_addr:
+        addr = np.concatenate(nz_addr)
+        bits = np.concatenate(nz_bits)
+        starts = np.flatnonzero(np.concatenate(([True], np.diff(addr) > gap)))
+        ends = np.append(starts[1:], len(addr)) - 1
+        clusters = np.empty(len(starts), dtype=cluster_dtype)
+        clusters['addr'] = addr[starts]
+        clusters['words'] = addr[ends] - addr[starts] + 1
+        clusters['bits'] = np.add.reduceat(bits, starts)
+        flipped_words = len(addr)
+    else:
+        clusters = np.empty(0, dtype=cluster_dtype)
+        flipped_words = 0
+
+    return flip_summary(base=base, words=n, sector_words=sector_words, flipped_bits=int(per_bit.sum()),
+                        flipped_words=flipped_words, flips_1to0=f10, flips_0to1=f01,
+                        per_sector=per_sector, per_bit=per_bit, clusters=clusters)
+
+def main():
+    ap = argparse.ArgumentParser(description="Bit flip analysis of NOR array dumps")
+    ap.add_argument('dump', help="dump file, little-endian 16-bit words, or a readout store (store.py)")
+    ap.add_argument('--readout', type=int, default=-1, help="readout of a store (default: the last one)")
+    ap.add_argument('--ref', type=lambda s: int(s, 0), default=0x0000, help="reference word (default 0x0000)")
+    ap.add_argument('--ref-file', help="reference dump instead of a single word")
+    ap.add_argument('--base', type=lambda s: int(s, 0), default=0, help="NOR address of the first word")
+    ap.add_argument('--sector-words', type=lambda s: int(s, 0), default=65536)
+    ap.add_argument('--gap', type=int, default=1, help="max word distance within one event")
+    args = ap.parse_args()
+
+    if os.path.isdir(args.dump):
+        from .store import load
+        s = load(args.dump)
+        if not len(s):
+            ap.error(f"{args.dump}: no readouts in the store")
+        r = args.readout % len(s)
+        dump, args.base, args.sector_words = s.readout(r), s.base(r), s.sector_words
+    else:
+        dump = load_dump(args.dump)
+    ref = load_dump(args.ref_file) if args.ref_file else args.ref
+    print(analyze(dump, ref, base=args.base, sector_words=args.sector_words, gap=args.gap).report())
+
+if __name__ == '__main__':
+    main()
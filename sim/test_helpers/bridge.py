@@ -0,0 +1,537 @@
+"""Bridge protocol driver
+
+Encodes the QSPI frames the bridge understands (cmd_defs.vh) independently of
+how they get to the bridge. A Transport moves whole frames; three are
+provided:
+
+    CocotbTransport  drives the tb_top pads in simulation
+    ModelTransport   in-process model of the bridge and NOR flash, no simulator
+    SpidevTransport  Linux spidev style device (xfer2), for hardware
+
+All frames are quad SPI, MSB nibble first, so two SCK cycles carry one byte:
+command (1 byte), address (4 bytes), dummy cycles (SPI_WAIT_CYC/2 bytes) and
+16-bit data words (2 bytes each). A frame is one CS assertion.
+
+WAIT_READY frames wait for a NOR program or erase to complete: the bridge
+returns zero words until R_NBUSSTAT.DONE is set (or the timeout in the
+address phase expires), so the frame is read until the first nonzero word.
+Transports that can end a frame early (Frame.until_nonzero) do so.
+
+DIFF_READ frames shift out the records of a nor_check DIFF scan (see
+diff.py); Bridge.diff_scan starts one and reads frames until the end record.
+
+Multi-frame sequences (NOR command cycles, register setup) can be collected
+in a Batch and sent in one transport call. Consecutive write-through frames
+in a batch are merged into a single CS assertion, since the bridge returns
+to the address phase after each write-through data word.
+
+With several NOR devices on the bus (NOR_CHIPS), a chip_map tells the NOR
+command sequences which device an address belongs to, so that the unlock
+cycles go to the same chip as the program or erase address.
+"""
+
+import abc
+import asyncio
+import sys
+import time
+import zlib
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+from . import vh, regmap, vote, diff
+from .chips import chip_map
+
+_defs = vh.load('cmd_defs.vh', 'busmap.vh')
+
+CMD_READ              = _defs['SPI_COMMAND_READ']
+CMD_FAST_READ         = _defs['SPI_COMMAND_FAST_READ']
+CMD_WRITE_THRU        = _defs['SPI_COMMAND_WRITE_THRU']
+CMD_WAIT_READY        = _defs['SPI_COMMAND_WAIT_READY']
+CMD_LOOPBACK          = _defs['SPI_COMMAND_LOOPBACK']
+CMD_DET_VT            = _defs['SPI_COMMAND_DET_VT']
+CMD_ENTER_PASSTHROUGH = _defs['SPI_COMMAND_ENTER_PASSTHROUGH']
+CMD_DIFF_READ         = _defs['SPI_COMMAND_DIFF_READ']
+
+WAIT_BYTES = _defs['SPI_WAIT_CYC'] // 2
+CFG        = 1 << _defs['CTRLBIT']
+NOR_MASK   = (1 << _defs['NORADDRBITS']) - 1
+CFG_MASK   = (1 << _defs['CFGWBADDRBITS']) - 1
+
+# NOR status, R_NBUSSTAT bits are also the WAIT_READY result
+R_NBUSSTAT  = _defs['R_NBUSSTAT']
+R_NBUSBUSYL = _defs['R_NBUSBUSYL']
+R_NBUSBUSYH = _defs['R_NBUSBUSYH']
+R_NBUSVOTEERR = _defs['R_NBUSVOTEERR']
+STAT_RY     = _defs['R_NBUSSTAT_RY_MASK']
+STAT_DONE   = _defs['R_NBUSSTAT_DONE_MASK']
+STAT_TOUT   = _defs['R_NBUSSTAT_TOUT_MASK']
+
+# write-through data that also leaves VT mode when it ends a frame (ctrl.v)
+VT_EXIT_DATA = 0x00F0
+
+@dataclass
+class Frame:
+    """One CS assertion: tx bytes are clocked out, then rx_len bytes are clocked in"""
+    tx: bytes
+    rx_len: int = 0
+    until_nonzero: bool = False # rx may end after the first nonzero word, rx_len is the limit
+
+    @property
+    def cmd(self) -> int:
+        return self.tx[0]
+
+def _addr(addr: int) -> bytes:
+    return (addr & 0xFFFFFFFF).to_bytes(4, 'big')
+
+def _word(data: int) -> bytes:
+    return (data & 0xFFFF).to_bytes(2, 'big')
+
+def words_from_bytes(b: bytes) -> List[int]:
+    return [(b[i] << 8) | b[i+1] for i in range(0, len(b) - 1, 2)]
+
+def read_frame(addr: int, count: int) -> Frame:
+    return Frame(bytes([CMD_READ]) + _addr(addr), 2*count)
+
+def read_fast_frame(addr: int, count: int) -> Frame:
+    return Frame(bytes([CMD_FAST_READ]) + _addr(addr) + bytes(WAIT_BYTES), 2*count)
+
+def write_through_frame(addr: int, data: int) -> Frame:
+    return Frame(bytes([CMD_WRITE_THRU]) + _addr(addr) + _word(data))
+
+def wait_ready_frame(timeout_clk: int, max_words: int) -> Frame:
+    return Frame(bytes([CMD_WAIT_READY]) + _addr(timeout_clk) + bytes(WAIT_BYTES), 2*max_words, until_nonzero=True)
+
+def wait_ready_status(b: bytes) -> int:
+    """First nonzero word of a WAIT_READY frame (R_NBUSSTAT, TOUT on timeout), 0 if none"""
+    return next((w for w in words_from_bytes(b) if w), 0)
+
+def diff_read_frame(count: int) -> Frame:
+    return Frame(bytes([CMD_DIFF_READ]) + _addr(0) + bytes(WAIT_BYTES), 2*count)
+
+def loopback_frame(addr: int) -> Frame:
+    return Frame(bytes([CMD_LOOPBACK]) + _addr(addr), 2)
+
+def cmd_frame(cmd: int) -> Frame:
+    return Frame(bytes([cmd]))
+
+def addr_frame(cmd: int, addr: int) -> Frame:
+    """Command and address only, e.g. a command the bridge does not implement"""
+    return Frame(bytes([cmd]) + _addr(addr))
+
+class Transport(abc.ABC):
+    """Moves frames to and from the bridge"""
+
+    @abc.abstractmethod
+    async def xfer(self, frames: Sequence[Frame]) -> List[bytes]:
+        """Send frames in order, one CS assertion each. Returns the rx bytes of each frame."""
+
+class Batch:
+    """Frame sequence sent with a single Transport.xfer call
+
+    Each method queues a frame and returns its index in the run() result.
+    """
+
+    def __init__(self, bridge: 'Bridge'):
+        self.bridge = bridge
+        self.ops: List[tuple] = [] # (frame, decode)
+        self.cfg: Dict[int, int] = {} # CFG writes queued, register -> last value; shadowed after run()
+
+    def _add(self, frame: Frame, decode: Optional[Callable] = None) -> int:
+        self.ops.append((frame, decode))
+        return len(self.ops) - 1
+
+    def read(self, addr: int, count: int) -> int:
+        return self._add(read_frame(addr, count), words_from_bytes)
+
+    def read_fast(self, addr: int, count: int) -> int:
+        return self._add(read_fast_frame(addr, count), words_from_bytes)
+
+    def write_through(self, addr: int, data: int) -> int:
+        if addr & CFG:
+            self.cfg[addr & CFG_MASK] = data
+        return self._add(write_through_frame(addr, data))
+
+    def cfg_read(self, reg: int) -> int:
+        return self._add(read_fast_frame(CFG | (reg & CFG_MASK), 1), lambda b: words_from_bytes(b)[0])
+
+    def cfg_write(self, reg: int, data: int) -> int:
+        return self.write_through(CFG | (reg & CFG_MASK), data)
+
+    def loopback(self, addr: int) -> int:
+        return self._add(loopback_frame(addr), lambda b: words_from_bytes(b)[0])
+
+    def wait_ready(self, timeout_clk: int = 0, max_words: int = 1 << 16) -> int:
+        return self._add(wait_ready_frame(timeout_clk, max_words), wait_ready_status)
+
+    def diff_read(self, count: int) -> int:
+        return self._add(diff_read_frame(count), words_from_bytes)
+
+    def enter_vt(self) -> int:
+        return self._add(cmd_frame(CMD_DET_VT))
+
+    def exit_vt(self) -> int:
+        return self.write_through(0, VT_EXIT_DATA)
+
+    def enter_passthrough(self) -> int:
+        return self._add(cmd_frame(CMD_ENTER_PASSTHROUGH))
+
+    # NOR command sequences, sent as write-through cycles to one chip
+    def nor_reset(self, chip: int = 0) -> int:
+        return self.write_through(self.bridge.chips.host(chip, 0), 0xF0)
+
+    def nor_program(self, addr: int, data: int) -> int:
+        chip = self.bridge.chips.chip(addr)
+        for a,d in [(0x555, 0xAA), (0x2AA, 0x55), (0x555, 0xA0)]:
+            self.write_through(self.bridge.chips.host(chip, a), d)
+        return self.write_through(addr & NOR_MASK, data)
+
+    def nor_erase_sector(self, addr: int) -> int:
+        chip = self.bridge.chips.chip(addr)
+        for a,d in [(0x555, 0xAA), (0x2AA, 0x55), (0x555, 0x80), (0x555, 0xAA), (0x2AA, 0x55)]:
+            self.write_through(self.bridge.chips.host(chip, a), d)
+        return self.write_through(addr & NOR_MASK, 0x30)
+
+    def nor_erase_chip(self, chip: int = 0) -> int:
+        for a,d in [(0x555, 0xAA), (0x2AA, 0x55), (0x555, 0x80), (0x555, 0xAA), (0x2AA, 0x55)]:
+            self.write_through(self.bridge.chips.host(chip, a), d)
+        return self.write_through(self.bridge.chips.host(chip, 0x555), 0x10)
+
+    def nor_erase_suspend(self, chip: int = 0) -> int:
+        return self.write_through(self.bridge.chips.host(chip, 0), 0xB0)
+
+    def nor_erase_resume(self, chip: int = 0) -> int:
+        return self.write_through(self.bridge.chips.host(chip, 0), 0x30)
+
+    def frames(self) -> List[Frame]:
+        """Frames to send, with runs of write-through frames merged"""
+        out = []
+        for f,_ in self.ops:
+            # VT exit acts at CS release and the sampling edge switches right after its write: keep both last in a frame
+            if (self.bridge.merge_writes and out and f.cmd == CMD_WRITE_THRU and out[-1].cmd == CMD_WRITE_THRU and
+                    int.from_bytes(out[-1].tx[-2:], 'big') != VT_EXIT_DATA and
+                    int.from_bytes(out[-1].tx[-6:-2], 'big') != CFG | _defs['R_QSPICTRL']):
+                out[-1] = Frame(out[-1].tx + f.tx[1:])
+            else:
+                out.append(f)
+        return out
+
+    async def run(self) -> list:
+        """Send the batch. Returns one entry per queued op: decoded data, or None."""
+        frames = self.frames()
+        rx = await self.bridge.transport.xfer(frames)
+        res = []
+        # only write-through frames are merged, so frames with rx data map 1:1 to ops
+        it = iter([r for f,r in zip(frames, rx) if f.rx_len])
+        for f,dec in self.ops:
+            if f.rx_len:
+                b = next(it)
+                res.append(dec(b) if dec else b)
+            else:
+                res.append(None)
+        for a,d in self.cfg.items():
+            self.bridge.regs.wrote(a, d)
+        return res
+
+class Bridge:
+    """Bridge commands over a Transport"""
+
+    def __init__(self, transport: Transport, merge_writes: bool = True, chips: chip_map = None):
+        self.transport = transport
+        self.merge_writes = merge_writes
+        self.chips = chips or chip_map()
+        self.regs = regmap.cfg_regs(self) # shadowed CFG registers by name
+
+    def batch(self) -> Batch:
+        return Batch(self)
+
+    async def _one(self, name: str, *args):
+        b = self.batch()
+        idx = getattr(b, name)(*args)
+        return (await b.run())[idx]
+
+    async def read(self, addr: int, count: int) -> List[int]:
+        return await self._one('read', addr, count)
+
+    async def read_fast(self, addr: int, count: int) -> List[int]:
+        return await self._one('read_fast', addr, count)
+
+    async def write_through(self, addr: int, data: int) -> None:
+        await self._one('write_through', addr, data)
+
+    async def cfg_read(self, reg: int) -> int:
+        return await self._one('cfg_read', reg)
+
+    async def cfg_write(self, reg: int, data: int) -> None:
+        await self._one('cfg_write', reg, data)
+
+    async def loopback(self, addr: int) -> int:
+        return await self._one('loopback', addr)
+
+    async def wait_ready(self, timeout_clk: int = 0, max_words: int = 1 << 16) -> int:
+        """Wait for the NOR to complete its operation. Returns R_NBUSSTAT, with
+        TOUT set if timeout_clk bridge clocks passed first, or 0 if max_words
+        words were read without either"""
+        return await self._one('wait_ready', timeout_clk, max_words)
+
+    async def busy_cycles(self) -> int:
+        """Bridge clocks of the last NOR busy period (R_NBUSBUSY)"""
+        b = self.batch()
+        lo, hi = b.cfg_read(R_NBUSBUSYL), b.cfg_read(R_NBUSBUSYH)
+        res = await b.run()
+        return (res[hi] << 16) | res[lo]
+
+    async def diff_scan(self, addr: int, count: int, pata: int = 0xFFFF, patb: Optional[int] = None,
+                        patm: int = 0, chunk: int = 256) -> diff.result:
+        """Words of [addr, addr+count) that differ from a pattern (see diff.py),
+        found by nor_check DIFF mode and read in DIFF_READ frames of chunk words"""
+        b = self.batch()
+        for name, value in [('NCHKPATA', pata), ('NCHKPATB', pata if patb is None else patb), ('NCHKPATM', patm),
+                            ('NCHKADDRL', addr & 0xFFFF), ('NCHKADDRH', (addr >> 16) & 0xFFFF),
+                            ('NCHKLENL', count & 0xFFFF), ('NCHKLENH', (count >> 16) & 0xFFFF),
+                            ('NCHKCTRL', self.regs.regs['NCHKCTRL'].encode(0, MODE='DIFF', START=1))]:
+            await self.regs.write(name, value, b)
+        first = b.diff_read(chunk)
+        dec = diff.decoder()
+        dec.feed((await b.run())[first])
+        while not dec.done:
+            dec.feed(await self._one('diff_read', chunk))
+        return dec.result
+
+    async def enter_vt(self) -> None:
+        await self._one('enter_vt')
+
+    async def exit_vt(self) -> None:
+        await self._one('exit_vt')
+
+    async def enter_passthrough(self) -> None:
+        await self._one('enter_passthrough')
+
+    async def nor_reset(self, chip: int = 0) -> None:
+        await self._one('nor_reset', chip)
+
+    async def nor_program(self, addr: int, data: int) -> None:
+        await self._one('nor_program', addr, data)
+
+    async def nor_erase_sector(self, addr: int) -> None:
+        await self._one('nor_erase_sector', addr)
+
+    async def nor_erase_chip(self, chip: int = 0) -> None:
+        await self._one('nor_erase_chip', chip)
+
+    async def nor_erase_suspend(self, chip: int = 0) -> None:
+        await self._one('nor_erase_suspend', chip)
+
+    async def nor_erase_resume(self, chip: int = 0) -> None:
+        await self._one('nor_erase_resume', chip)
+
+class CocotbTransport(Transport):
+    """Drives the QSPI pads of tb_top (see qspi.py)"""
+
+    def __init__(self, sio_i, sio_o, sio_oe, sck, sce, freq: float = 20, sce_pol=0, gap_ns: float = 100, log=lambda s: None):
+        self.sio_i, self.sio_o, self.sio_oe, self.sck, self.sce = sio_i, sio_o, sio_oe, sck, sce
+        self.freq = freq
+        self.sce_pol = sce_pol
+        self.gap_ns = gap_ns
+        self.log = log
+
+    async def xfer(self, frames: Sequence[Frame]) -> List[bytes]:
+        from cocotb.triggers import RisingEdge, Timer
+        from . import qspi
+
+        rx = []
+        for f in frames:
+            frame = await qspi.spi_frame_begin(self.freq, self.sce, self.sck, self.sce_pol)
+            await qspi.spi_write(self.sio_i, self.sck, int.from_bytes(f.tx, 'big'), qspi.SPI_MODE.QUAD, 2*len(f.tx), init_wait=1)
+            nibbles = []
+            for i in range(2*f.rx_len):
+                await RisingEdge(self.sck)
+                assert self.sio_oe.value
+                nibbles.append(int(self.sio_o.value) & 0xF)
+                if f.until_nonzero and i % 4 == 3 and any(nibbles[-4:]):
+                    break
+            await qspi.spi_frame_end(frame, self.sce, self.sck, self.sce_pol)
+            await Timer(self.gap_ns, 'ns')
+            rx.append(bytes((nibbles[i] << 4) | nibbles[i+1] for i in range(0, len(nibbles), 2)))
+            self.log(f"[bridge] {f.tx.hex()} -> {rx[-1].hex()}")
+        return rx
+
+class SpidevTransport(Transport):
+    """spidev style device: anything with xfer2(list) -> list, set up for quad SPI
+
+    With no device given, opens /dev/spidev<bus>.<dev> with the spidev package.
+    The SPI controller has to run the transfers in quad mode (SPI_TX_QUAD |
+    SPI_RX_QUAD), which py-spidev cannot set; configure it in the device tree.
+
+    A transfer is limited to bufsiz bytes (the spidev module parameter, 4096
+    by default). WAIT_READY frames are sent as a loop of frames of that size
+    until a nonzero word, max_words in all or wait_timeout_s of wall clock;
+    timeout_clk applies to each frame of the loop.
+
+    xfer2 blocks, so xfer runs the transfers in a worker thread and the event
+    loop keeps going; xfer_sync is the same without an event loop.
+    """
+
+    def __init__(self, dev=None, bus: int = 0, cs: int = 0, speed_hz: int = 20000000,
+                 bufsiz: int = 4096, wait_timeout_s: float = 10.0):
+        if dev is None:
+            import spidev
+            dev = spidev.SpiDev()
+            dev.open(bus, cs)
+            dev.max_speed_hz = speed_hz
+            dev.mode = 0
+        self.dev = dev
+        self.bufsiz = bufsiz
+        self.wait_timeout_s = wait_timeout_s
+
+    def _frame(self, tx: bytes, rx_len: int) -> bytes:
+        r = self.dev.xfer2(list(tx) + [0]*rx_len)
+        return bytes(r[len(tx):])
+
+    def _wait_ready(self, f: Frame) -> bytes:
+        chunk = (self.bufsiz - len(f.tx)) // 2 * 2
+        deadline = time.monotonic() + self.wait_timeout_s
+        rx = b''
+        while len(rx) < f.rx_len:
+            r = self._frame(f.tx, min(chunk, f.rx_len - len(rx)))
+            rx += r
+            if any(words_from_bytes(r)):
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"WAIT_READY: no status after {len(rx)//2} words, {self.wait_timeout_s} s")
+        return rx
+
+    def xfer_sync(self, frames: Sequence[Frame]) -> List[bytes]:
+        """xfer for callers without an event loop, blocks until done"""
+        return [self._wait_ready(f) if f.until_nonzero else self._frame(f.tx, f.rx_len) for f in frames]
+
+    async def xfer(self, frames: Sequence[Frame]) -> List[bytes]:
+        return await asyncio.to_thread(self.xfer_sync, frames)
+
+class ModelTransport(Transport):
+    """In-process bridge model over nor_flash_behavioral_x16, no simulator needed
+
+    Models what the RTL does with each frame: NOR reads and write-through
+    cycles, the nor_bus and nor_check CFG registers, VT and passthrough entry.
+    NOR reads in VT mode use the flash VT model once its vt_level is set.
+    NOR busy times are not modelled; command cycles take effect immediately,
+    so WAIT_READY returns at once with R_NBUSSTAT.DONE set. Majority-vote
+    reads (R_NBUSCTRL.VOTE) sample the flash model as nor_bus does.
+    Multi-word CFG reads read consecutive registers. Unmapped CFG registers
+    and the performance counters read as 0.
+    """
+
+    def __init__(self, flash=None, size: int = 1024*1024*64, erase_size: int = 1024*64, log=lambda s: None):
+        if flash is None:
+            from .nor import nor_flash_behavioral_x16
+            flash = nor_flash_behavioral_x16(size, erase_size)
+        self.flash = flash
+        self.log = log
+        self.vt = False
+        self.passthrough = False
+        self.frames = 0
+        self.regs = {r.addr: r.reset or 0 for r in regmap.regs.values()}
+        self.regs[R_NBUSSTAT] = STAT_RY
+        self.diff_words: List[int] = [] # DIFF_READ stream not read yet
+
+    def _nor_check(self, ctrl: int) -> None:
+        mode  = (ctrl & _defs['R_NCHKCTRL_MODE_MASK']) >> _defs['R_NCHKCTRL_MODE_SHIFT']
+        addr  = (self.regs[_defs['R_NCHKADDRH']] << 16) | self.regs[_defs['R_NCHKADDRL']]
+        count = (self.regs[_defs['R_NCHKLENH']] << 16) | self.regs[_defs['R_NCHKLENL']]
+        words = self.flash.mem.mem[addr:addr+count]
+        stat, res = _defs['R_NCHKSTAT_DONE_MASK'], 0
+        self.diff_words = []
+        if mode == _defs['R_NCHKCTRL_MODE_DIFF']:
+            p = [self.regs[_defs[f'R_NCHKPAT{x}']] for x in 'ABM']
+            recs = diff.records(words, addr, *p)
+            self.diff_words = diff.stream(recs)
+            stat |= _defs['R_NCHKSTAT_FOUND_MASK'] if recs else 0
+            res = len(recs)
+        elif mode == _defs['R_NCHKCTRL_MODE_CRC']:
+            a = array('H', words)
+            if sys.byteorder != 'little':
+                a.byteswap()
+            res = zlib.crc32(a) & 0xFFFFFFFF if count else 0
+        else:
+            for i,w in enumerate(words):
+                if w != self.flash.mem.erase_val:
+                    stat |= _defs['R_NCHKSTAT_FOUND_MASK']
+                    res = addr + i
+                    break
+        self.regs[_defs['R_NCHKSTAT']] = stat
+        self.regs[_defs['R_NCHKRESL']] = res & 0xFFFF
+        self.regs[_defs['R_NCHKRESH']] = res >> 16
+
+    def _cfg_write(self, reg: int, data: int) -> None:
+        if reg == _defs['R_NCHKCTRL']:
+            self.regs[reg] = data & _defs['R_NCHKCTRL_MODE_MASK']
+            if data & _defs['R_NCHKCTRL_START_MASK']:
+                self._nor_check(data)
+        elif reg == _defs['R_QSPICTRL']:
+            self.regs[reg] = data & _defs['R_QSPICTRL_SDLY_MASK']
+        elif reg == R_NBUSSTAT:
+            self.regs[reg] &= ~(data & STAT_DONE)
+        elif reg == R_NBUSVOTEERR:
+            self.regs[reg] = 0
+        elif reg == _defs['R_PERFCTRL']:
+            self.regs[reg] = data & _defs['R_PERFCTRL_STOP_MASK']
+        elif reg in self.regs and reg not in (_defs['R_NCHKSTAT'], _defs['R_NCHKRESL'], _defs['R_NCHKRESH'],
+                                              R_NBUSBUSYL, R_NBUSBUSYH):
+            self.regs[reg] = data
+
+    def _write(self, addr: int, data: int) -> None:
+        if addr & CFG:
+            self._cfg_write(addr & CFG_MASK, data)
+        else:
+            self.flash._handle_cmd_cycle(addr & NOR_MASK, data)
+            # a program or erase would be complete by now
+            self.regs[R_NBUSSTAT] |= STAT_DONE
+
+    def _read(self, addr: int, count: int) -> bytes:
+        ctrl = regmap.regs['NBUSCTRL']
+        n = ctrl.fields['VOTE'].get(self.regs[ctrl.addr])
+        if addr & CFG:
+            words = [self.regs.get((addr + i) & CFG_MASK, 0) for i in range(count)]
+        elif self.vt and self.flash.vt_level is not None:
+            words = self.flash.read_vt_range(addr & NOR_MASK, count).tolist()
+        elif n:
+            words, bad = vote.vote_read(lambda a: self.flash.read(a & NOR_MASK), addr, count, n)
+            words = words.tolist()
+            self.regs[R_NBUSVOTEERR] = min(self.regs[R_NBUSVOTEERR] + bad, 0xFFFF)
+        else:
+            words = [self.flash.read((addr + i) & NOR_MASK) for i in range(count)]
+        return b''.join(_word(w) for w in words)
+
+    async def xfer(self, frames: Sequence[Frame]) -> List[bytes]:
+        rx = []
+        for f in frames:
+            self.frames += 1
+            r = bytes(f.rx_len)
+            if self.passthrough:
+                pass
+            elif f.cmd in (CMD_READ, CMD_FAST_READ):
+                r = self._read(int.from_bytes(f.tx[1:5], 'big'), f.rx_len // 2)
+            elif f.cmd == CMD_DIFF_READ:
+                n = f.rx_len // 2
+                words, self.diff_words = self.diff_words[:n], self.diff_words[n:]
+                r = b''.join(_word(w) for w in words + [0] * (n - len(words)))
+            elif f.cmd == CMD_LOOPBACK:
+                r = _word(int.from_bytes(f.tx[3:5], 'big')) * (f.rx_len // 2)
+            elif f.cmd == CMD_WAIT_READY:
+                stat = self.regs[R_NBUSSTAT]
+                if not stat & STAT_DONE:
+                    # without DONE the timeout, if there is one, expires at once
+                    stat = stat | STAT_TOUT if int.from_bytes(f.tx[1:5], 'big') else 0
+                r = _word(stat) if stat else r
+            elif f.cmd == CMD_WRITE_THRU:
+                # addr, data, then addr, data ... until CS is released
+                for i in range(1, len(f.tx) - 5, 6):
+                    self._write(int.from_bytes(f.tx[i:i+4], 'big'), int.from_bytes(f.tx[i+4:i+6], 'big'))
+                if int.from_bytes(f.tx[-2:], 'big') == VT_EXIT_DATA:
+                    self.vt = False
+            elif f.cmd == CMD_DET_VT:
+                self.vt = True
+            elif f.cmd == CMD_ENTER_PASSTHROUGH:
+                self.passthrough = True
+            self.log(f"[bridge model] {f.tx.hex()} -> {r.hex()}")
+            rx.append(r)
+        return rx
@@ -0,0 +1,104 @@
+"""QSPI link calibration
+
+Sweeps SCK frequency, SCK phase relative to the bridge clock and the sampling
+edge (R_QSPICTRL.SDLY) with the LOOPBACK command, which echoes the low 16
+address bits back as continuous read data. The pass rates form an eye map
+per sampling edge; the chosen setting is the fastest frequency that passes at
+every phase and still has `margin` passing frequency points above it.
+"""
+
+import numpy as np
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Sequence
+
+from . import qspi, vh
+
+_defs = vh.load('cmd_defs.vh', 'busmap.vh')
+CMD_LOOPBACK = _defs['SPI_COMMAND_LOOPBACK']
+R_QSPICTRL = _defs['R_QSPICTRL']
+R_QSPICTRL_SDLY_MASK = _defs['R_QSPICTRL_SDLY_MASK']
+CFG = 1 << _defs['CTRLBIT']
+
+PATTERNS = [0x0000, 0xFFFF, 0xA5A5, 0x5A5A, 0x1248, 0x8421, 0xF00F, 0x0FF0]
+
+# loopback(addr, count, freq, toff) -> words read back
+Loopback = Callable[[int, int, float, float], Awaitable[List[int]]]
+# set_sdly(enable)
+SetSdly = Callable[[bool], Awaitable[None]]
+
+@dataclass
+class eye_map:
+    """Pass rates of a calibration sweep"""
+    freqs: np.ndarray  # MHz, ascending
+    phases: np.ndarray # SCK start offset in ns
+    sdlys: np.ndarray  # sampling edge settings
+    rate: np.ndarray   # [sdly, freq, phase] fraction of patterns read back correctly
+
+    def passing(self) -> np.ndarray:
+        """[sdly, freq]: every phase passed"""
+        return np.all(self.rate == 1.0, axis=2)
+
+    def choose(self, margin: int = 1):
+        """Return (freq, sdly) of the fastest setting with margin, or None"""
+        ok = self.passing()
+        best = None
+        for si, sdly in enumerate(self.sdlys):
+            # first failing point bounds the usable range; stay margin points below it
+            fail = np.flatnonzero(~ok[si])
+            limit = fail[0] if len(fail) else len(self.freqs) + margin
+            fi = limit - 1 - margin
+            if fi < 0:
+                continue
+            if best is None or self.freqs[fi] > best[0]:
+                best = (float(self.freqs[fi]), bool(sdly))
+        return best
+
+    def report(self) -> str:
+        lines = []
+        for si, sdly in enumerate(self.sdlys):
+            lines.append(f"sdly={int(sdly)}  phase(ns): " + ' '.join(f"{p:5.1f}" for p in self.phases))
+            for fi, f in enumerate(self.freqs):
+                row = ''.join('  ok  ' if r == 1.0 else f" {r:4.2f} " for r in self.rate[si, fi])
+                lines.append(f"  {f:6.1f} MHz {row}")
+        return '\n'.join(lines)
+
+async def sweep(loopback: Loopback, set_sdly: SetSdly, freqs: Sequence[float], phases: Sequence[float],
+                sdlys: Sequence[bool] = (False, True), patterns: Sequence[int] = PATTERNS,
+                count: int = 2, log=lambda s: None) -> eye_map:
+    """Run loopback for every (sdly, freq, phase) point and pattern"""
+    freqs = np.sort(np.asarray(freqs, dtype=float))
+    rate = np.zeros((len(sdlys), len(freqs), len(phases)))
+    for si, sdly in enumerate(sdlys):
+        await set_sdly(sdly)
+        for fi, f in enumerate(freqs):
+            for pi, toff in enumerate(phases):
+                good = 0
+                for p in patterns:
+                    words = await loopback(p, count, f, toff)
+                    good += words == [p] * count
+                rate[si, fi, pi] = good / len(patterns)
+            log(f"[calibrate] sdly={int(sdly)} {f:.1f} MHz: {rate[si, fi].min():.2f}")
+    return eye_map(freqs, np.asarray(phases, dtype=float), np.asarray(sdlys), rate)
+
+class CocotbLink:
+    """Loopback and SDLY callables for a simulated bridge. SDLY writes are
+    shadowed in regs (a regmap.cfg_regs, e.g. Bridge.regs) if given."""
+
+    def __init__(self, sio_i, sio_o, sio_oe, sck, sce, safe_freq: float = 5, sce_pol=0, regs=None, log=lambda s: None):
+        self.sio_i, self.sio_o, self.sio_oe, self.sck, self.sce = sio_i, sio_o, sio_oe, sck, sce
+        self.safe_freq = safe_freq
+        self.sce_pol = sce_pol
+        self.regs = regs
+        self.log = log
+
+    async def loopback(self, addr: int, count: int, freq: float, toff: float) -> List[int]:
+        return await qspi.read_txn(self.sio_i, self.sio_o, self.sio_oe, self.sck, self.sce, addr, count, freq,
+                                   cmd=CMD_LOOPBACK, stall=0, toff=toff, sce_pol=self.sce_pol)
+
+    async def set_sdly(self, enable: bool) -> None:
+        # the sampling edge switches as soon as the write lands, so write it alone and slowly
+        value = R_QSPICTRL_SDLY_MASK if enable else 0
+        await qspi.write_through(self.sio_i, self.sck, self.sce, CFG | R_QSPICTRL, value,
+                                 freq=self.safe_freq, sce_pol=self.sce_pol)
+        if self.regs is not None:
+            self.regs.wrote(R_QSPICTRL, value)
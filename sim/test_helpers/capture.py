@@ -0,0 +1,283 @@
+"""Logic analyzer captures of QSPI traffic
+
+Parses CSV exports (sigrok-cli -O csv, or any CSV with a header row of channel
+names and 0/1 columns, optionally a time column) of SCK, CS# and IO0-3, and
+decodes them into bridge frames: IO is sampled on SCK rising edges while CS#
+is asserted and split into the host (tx) and bridge (rx) parts by command.
+
+Files are read in chunks and decoded with numpy, so captures of any size
+stream through in bounded memory. Decoded transactions can be replayed into
+tb_top over bridge.CocotbTransport at their original or compressed spacing.
+"""
+
+import argparse
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .bridge import Frame, CMD_READ, CMD_FAST_READ, CMD_LOOPBACK, CMD_WAIT_READY, CMD_DIFF_READ, CMD_WRITE_THRU, words_from_bytes, _defs
+
+CHUNK_BYTES = 1 << 24
+
+CHANNELS = ['sck', 'cs', 'io0', 'io1', 'io2', 'io3']
+
+# host nibbles before the bridge drives IO, per command (cmd + addr + stall)
+RX_START = {
+    CMD_READ:       10,
+    CMD_LOOPBACK:   10,
+    CMD_FAST_READ:  10 + _defs['SPI_WAIT_CYC'],
+    CMD_WAIT_READY: 10 + _defs['SPI_WAIT_CYC'],
+    CMD_DIFF_READ:  10 + _defs['SPI_WAIT_CYC'],
+}
+
+@dataclass
+class capture_txn:
+    """One decoded CS assertion"""
+    t_ns: float   # CS asserted
+    dur_ns: float # until CS released
+    sck_ns: float # mean SCK period, 0 if fewer than two edges
+    frame: Frame  # host bytes, rx_len bytes read back
+    rx: bytes     # bytes driven by the bridge
+
+    @property
+    def cmd(self) -> int:
+        return self.frame.tx[0] if self.frame.tx else -1
+
+    @property
+    def addr(self) -> Optional[int]:
+        return int.from_bytes(self.frame.tx[1:5], 'big') if len(self.frame.tx) >= 5 else None
+
+    @property
+    def data(self) -> List[int]:
+        """Words read back, or written (one per addr+data pair) for write-through"""
+        if self.cmd == CMD_WRITE_THRU:
+            return [int.from_bytes(self.frame.tx[i+4:i+6], 'big') for i in range(1, len(self.frame.tx) - 5, 6)]
+        return words_from_bytes(self.rx)
+
+    def __str__(self) -> str:
+        a = f"{self.addr:08X}" if self.addr is not None else '-'
+        return f"{self.t_ns:14.1f} ns  cmd {self.cmd:02X}  addr {a}  " + ' '.join(f"{w:04X}" for w in self.data[:8]) + \
+            (' ...' if len(self.data) > 8 else '')
+
+def _pack(nibbles: np.ndarray) -> bytes:
+    n = nibbles[:len(nibbles) & ~1].astype(np.uint8)
+    return ((n[0::2] << 4) | n[1::2]).tobytes()
+
+def frame_from_nibbles(nibbles: np.ndarray) -> Tuple[Frame, bytes]:
+    """Split the nibbles of one frame into host and bridge bytes"""
+    cmd = int(nibbles[0]) << 4 | int(nibbles[1]) if len(nibbles) >= 2 else -1
+    split = min(RX_START.get(cmd, len(nibbles)), len(nibbles))
+    tx, rx = _pack(nibbles[:split]), _pack(nibbles[split:])
+    return Frame(tx, len(rx)), rx
+
+class frame_decoder:
+    """Turns sample chunks into capture_txn; keeps the partial frame between chunks"""
+
+    def __init__(self, sce_pol: int = 0):
+        self.sce_pol = sce_pol
+        self.prev_sck = 0
+        self.prev_cs = 1 - sce_pol
+        self.nibbles: List[np.ndarray] = []
+        self.rises: List[np.ndarray] = []
+        self.t_start: Optional[float] = None
+
+    def _emit(self, t_end: float) -> capture_txn:
+        nib = np.concatenate(self.nibbles) if self.nibbles else np.empty(0, np.uint8)
+        r = np.concatenate(self.rises) if self.rises else np.empty(0)
+        sck = float((r[-1] - r[0]) / (len(r) - 1)) if len(r) > 1 else 0.0
+        frame, rx = frame_from_nibbles(nib)
+        txn = capture_txn(self.t_start, t_end - self.t_start, sck, frame, rx)
+        self.nibbles, self.rises, self.t_start = [], [], None
+        return txn
+
+    def feed(self, t: np.ndarray, sck: np.ndarray, cs: np.ndarray, io: np.ndarray) -> List[capture_txn]:
+        """t in ns, sck/cs 0/1, io the IO3..IO0 nibble, all per sample"""
+        act = cs == self.sce_pol
+        prev_act = np.empty_like(act)
+        prev_act[0] = self.prev_cs == self.sce_pol
+        prev_act[1:] = act[:-1]
+        prev_sck = np.empty_like(sck)
+        prev_sck[0] = self.prev_sck
+        prev_sck[1:] = sck[:-1]
+
+        rise = np.flatnonzero((sck == 1) & (prev_sck == 0) & act)
+        starts = np.flatnonzero(act & ~prev_act)
+        ends = np.flatnonzero(~act & prev_act)
+        self.prev_sck, self.prev_cs = sck[-1], cs[-1]
+
+        out = []
+        # walk the CS edges in order; nibbles between them belong to the open frame
+        edges = sorted([(i, True) for i in starts] + [(i, False) for i in ends])
+        pos = 0
+        for i, is_start in edges:
+            k = np.searchsorted(rise, i)
+            if self.t_start is not None:
+                self.nibbles.append(io[rise[pos:k]])
+                self.rises.append(t[rise[pos:k]])
+            pos = k
+            if is_start:
+                self.t_start = float(t[i])
+            elif self.t_start is not None:
+                out.append(self._emit(float(t[i])))
+        if self.t_start is not None:
+            self.nibbles.append(io[rise[pos:]])
+            self.rises.append(t[rise[pos:]])
+        return out
+
+_rate_re = re.compile(rb'samplerate\s*[:=]\s*([\d.]+(?:e[+-]?\d+)?)\s*([kmg]?)hz', re.I)
+_rate_mul = {b'': 1, b'K': 1e3, b'M': 1e6, b'G': 1e9}
+
+def read_csv(path: str, channels: Optional[Dict[str, Union[str, int]]] = None, samplerate: Optional[float] = None,
+             chunk_bytes: int = CHUNK_BYTES) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """Yield (t_ns, sck, cs, io) per chunk of a CSV capture
+
+    channels maps sck, cs, io0..io3 to header names or column numbers; by
+    default the header names are matched case-insensitively (CS# and CE# too).
+    The time comes from a column named time/t (seconds), or from samplerate
+    (Hz, else read from a '; Samplerate: ...' comment).
+    """
+    with open(path, 'rb') as f:
+        header = None
+        while header is None:
+            line = f.readline()
+            if not line:
+                raise ValueError(f"{path}: no header row")
+            if line.startswith((b';', b'#')):
+                m = _rate_re.search(line)
+                if m and samplerate is None:
+                    samplerate = float(m.group(1)) * _rate_mul[m.group(2).upper()]
+            elif line.strip():
+                header = [h.strip().decode() for h in line.split(b',')]
+
+        norm = [re.sub(r'[#\s_/]|\[.*\]', '', h).lower() for h in header]
+        aliases = {'cs': ['cs', 'csn', 'ce', 'cen', 'sce']}
+        cols = {}
+        for ch in CHANNELS:
+            sel = (channels or {}).get(ch)
+            if isinstance(sel, int):
+                cols[ch] = sel
+            elif sel is not None:
+                cols[ch] = header.index(sel)
+            else:
+                cand = [i for i,h in enumerate(norm) if h in aliases.get(ch, [ch])]
+                if not cand:
+                    raise ValueError(f"{path}: no column for {ch} in {header}")
+                cols[ch] = cand[0]
+        tcol = next((i for i,h in enumerate(norm) if h in ('time', 't', 'times')), None)
+        if tcol is None and samplerate is None:
+            raise ValueError(f"{path}: no time column and no samplerate")
+
+        ncol = len(header)
+        sample = 0
+        rest = b''
+        while True:
+            block = f.read(chunk_bytes)
+            data = rest + block
+            if not block:
+                rest = b''
+            else:
+                cut = data.rfind(b'\n') + 1
+                data, rest = data[:cut], data[cut:]
+            if data.strip():
+                width = 2 * ncol
+                if tcol is None and len(data) % width == 0 and np.all(np.frombuffer(data, np.uint8)[width-1::width] == ord('\n')):
+                    # 0,1,...\n rows: fixed width, take every other byte
+                    v = (np.frombuffer(data, np.uint8).reshape(-1, width)[:, 0:width:2] - ord('0')).astype(np.uint8)
+                else:
+                    v = np.loadtxt(data.decode().splitlines(), delimiter=',', ndmin=2)
+                n = len(v)
+                if tcol is None:
+                    t = (sample + np.arange(n)) * (1e9 / samplerate)
+                else:
+                    t = v[:, tcol] * 1e9
+                io = sum(v[:, cols[f'io{b}']].astype(np.uint8) << b for b in range(4)).astype(np.uint8)
+                yield t, v[:, cols['sck']].astype(np.uint8), v[:, cols['cs']].astype(np.uint8), io
+                sample += n
+            if not block:
+                break
+
+def decode(path: str, sce_pol: int = 0, **kw) -> Iterator[capture_txn]:
+    """Stream the transactions of a CSV capture"""
+    dec = frame_decoder(sce_pol)
+    for chunk in read_csv(path, **kw):
+        yield from dec.feed(*chunk)
+
+def write_csv(path: str, frames: Sequence[Tuple[Frame, bytes]], freq: float, samplerate: float,
+              gap_ns: float = 200, sce_pol: int = 0) -> None:
+    """Write frames as a sigrok style CSV capture (SCK changes every half period)"""
+    half = max(1, int(round(samplerate / freq / 2e6)))
+    gap = max(1, int(round(gap_ns * 1e-9 * samplerate)))
+    rows = [np.array([[0, 1 - sce_pol, 0]], dtype=np.uint8).repeat(gap, 0)]
+    for frame, rx in frames:
+        b = np.frombuffer(frame.tx + rx, np.uint8)
+        nib = np.empty(2 * len(b), np.uint8)
+        nib[0::2], nib[1::2] = b >> 4, b & 0xF
+        n = len(nib)
+        # low half period with the nibble set up, then high half period
+        sck = np.tile(np.repeat(np.array([0, 1], np.uint8), half), n)
+        io = np.repeat(nib, 2 * half)
+        rows.append(np.stack([sck, np.full(len(sck), sce_pol, np.uint8), io], axis=1))
+        rows.append(np.array([[0, sce_pol, 0]], dtype=np.uint8).repeat(half, 0))
+        rows.append(np.array([[0, 1 - sce_pol, 0]], dtype=np.uint8).repeat(gap, 0))
+    s = np.concatenate(rows)
+    cols = np.stack([s[:, 0], s[:, 1]] + [(s[:, 2] >> b) & 1 for b in range(4)], axis=1)
+    with open(path, 'wb') as f:
+        f.write(f"; Samplerate: {samplerate:.0f} Hz\nSCK,CS#,IO0,IO1,IO2,IO3\n".encode())
+        txt = np.empty((len(cols), 12), np.uint8)
+        txt[:, 0::2] = cols + ord('0')
+        txt[:, 1::2] = ord(',')
+        txt[:, 11] = ord('\n')
+        f.write(txt.tobytes())
+
+async def replay(txns, transport, timing: str = 'original', compress: float = 1.0, min_gap_ns: float = 100,
+                 log=lambda s: None) -> List[Tuple[capture_txn, bytes]]:
+    """Send captured frames over a transport (e.g. bridge.CocotbTransport)
+
+    timing='original' keeps the capture's frame spacing scaled by compress,
+    'compressed' sends back to back with min_gap_ns between frames. Returns
+    (txn, rx) for every frame whose read back data differs from the capture.
+    """
+    from cocotb.triggers import Timer
+    from cocotb.utils import get_sim_time
+
+    if timing not in ('original', 'compressed'):
+        raise ValueError(f"Unknown timing {timing}")
+    t0 = None
+    sim0 = get_sim_time('ns')
+    mismatches = []
+    for txn in txns:
+        if t0 is None:
+            t0 = txn.t_ns
+        if timing == 'original':
+            wait = sim0 + (txn.t_ns - t0) * compress - get_sim_time('ns')
+            if wait > 0:
+                await Timer(round(wait, 3), 'ns')
+        rx, = await transport.xfer([txn.frame])
+        if rx != txn.rx:
+            log(f"[capture.replay] {txn}: read {rx.hex()}")
+            mismatches.append((txn, rx))
+        if timing == 'compressed':
+            await Timer(min_gap_ns, 'ns')
+    return mismatches
+
+def main():
+    ap = argparse.ArgumentParser(description="Decode QSPI transactions from a logic analyzer CSV capture")
+    ap.add_argument('capture')
+    ap.add_argument('--samplerate', type=float, help="Hz, if there is no time column or samplerate comment")
+    ap.add_argument('--map', action='append', default=[], metavar='CH=COLUMN',
+                    help="channel to column name, e.g. sck=D0 (channels: " + ', '.join(CHANNELS) + ")")
+    ap.add_argument('--sce-pol', type=int, default=0, help="CS asserted level")
+    args = ap.parse_args()
+
+    channels = dict(m.split('=', 1) for m in args.map)
+    channels = {k: int(v) if v.isdigit() else v for k,v in channels.items()}
+    counts: Dict[int, int] = {}
+    for txn in decode(args.capture, sce_pol=args.sce_pol, channels=channels, samplerate=args.samplerate):
+        print(txn)
+        counts[txn.cmd] = counts.get(txn.cmd, 0) + 1
+    print(', '.join(f"{c:02X}h: {n}" for c,n in sorted(counts.items())))
+
+if __name__ == '__main__':
+    main()
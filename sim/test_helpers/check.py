@@ -0,0 +1,117 @@
+"""In-bridge NOR range check (nor_check) reference model and QSPI helpers"""
+
+import sys
+import zlib
+from array import array
+from typing import Iterable, Optional, Tuple
+from cocotb.triggers import Timer
+from . import qspi, vh
+from .nor import nor_flash_array
+
+_defs = vh.load('busmap.vh')
+
+# CFG space select bit (CTRLBIT)
+CFG = 1 << _defs['CTRLBIT']
+
+# nor_check registers
+R_NCHKCTRL  = _defs['R_NCHKCTRL']
+R_NCHKSTAT  = _defs['R_NCHKSTAT']
+R_NCHKADDRL = _defs['R_NCHKADDRL']
+R_NCHKADDRH = _defs['R_NCHKADDRH']
+R_NCHKLENL  = _defs['R_NCHKLENL']
+R_NCHKLENH  = _defs['R_NCHKLENH']
+R_NCHKRESL  = _defs['R_NCHKRESL']
+R_NCHKRESH  = _defs['R_NCHKRESH']
+R_NCHKPATA  = _defs['R_NCHKPATA']
+R_NCHKPATB  = _defs['R_NCHKPATB']
+R_NCHKPATM  = _defs['R_NCHKPATM']
+
+# R_NCHKCTRL
+CTRL_START = _defs['R_NCHKCTRL_START_MASK']
+MODE_SHIFT = _defs['R_NCHKCTRL_MODE_SHIFT']
+MODE_CRC   = _defs['R_NCHKCTRL_MODE_CRC']
+MODE_BLANK = _defs['R_NCHKCTRL_MODE_BLANK']
+MODE_DIFF  = _defs['R_NCHKCTRL_MODE_DIFF'] # see diff.py
+
+# R_NCHKSTAT
+STAT_BUSY  = _defs['R_NCHKSTAT_BUSY_MASK']
+STAT_DONE  = _defs['R_NCHKSTAT_DONE_MASK']
+STAT_FOUND = _defs['R_NCHKSTAT_FOUND_MASK']
+
+def crc32_words(words: Iterable[int]) -> int:
+    """CRC-32 of 16-bit words sent as little-endian bytes, as computed by nor_check"""
+    a = words if isinstance(words, array) and words.typecode == 'H' else array('H', words)
+    if sys.byteorder != 'little':
+        a = array('H', a)
+        a.byteswap()
+    return zlib.crc32(a) & 0xFFFFFFFF
+
+def blank_check(words: Iterable[int], base: int = 0, erase_val: int = 0xFFFF) -> Optional[int]:
+    """Address of the first word that is not erase_val, or None"""
+    for i, w in enumerate(words):
+        if w != erase_val:
+            return base + i
+    return None
+
+def crc32_range(mem: nor_flash_array, addr: int, count: int) -> int:
+    """Reference CRC-32 over mem[addr:addr+count]"""
+    return crc32_words(mem.mem[addr:addr+count])
+
+def blank_check_range(mem: nor_flash_array, addr: int, count: int) -> Optional[int]:
+    """Reference blank check over mem[addr:addr+count]"""
+    return blank_check(mem.mem[addr:addr+count], base=addr, erase_val=mem.erase_val)
+
+async def cfg_write(sio_i, sck, sce, reg: int, data: int, freq: float = 20, sce_pol=0, regs=None, log=lambda s: None) -> None:
+    """CFG register write at pin level; regs (a regmap.cfg_regs) shadows it"""
+    await qspi.write_through(sio_i, sck, sce, CFG | reg, data, freq=freq, sce_pol=sce_pol, log=log)
+    if regs is not None:
+        regs.wrote(reg, data)
+    await Timer(100, 'ns')
+
+async def cfg_read(sio_i, sio_o, sio_oe, sck, sce, reg: int, freq: float = 20, sce_pol=0, log=lambda s: None) -> int:
+    ret_val = await qspi.read_fast(sio_i, sio_o, sio_oe, sck, sce, CFG | reg, 1, freq=freq, sce_pol=sce_pol, log=log)
+    await Timer(100, 'ns')
+    return ret_val[0]
+
+async def run(sio_i, sio_o, sio_oe, sck, sce, addr: int, count: int, mode: int, freq: float = 20, sce_pol=0,
+              poll_ns: float = 1000, timeout_ns: float = 0, log=lambda s: None) -> Tuple[int, int]:
+    """Run a check over count words at addr and wait for it. Returns (status, result)."""
+
+    regs = [
+        (R_NCHKADDRL, addr & 0xFFFF),
+        (R_NCHKADDRH, (addr >> 16) & 0xFFFF),
+        (R_NCHKLENL,  count & 0xFFFF),
+        (R_NCHKLENH,  (count >> 16) & 0xFFFF),
+        (R_NCHKCTRL,  (mode << MODE_SHIFT) | CTRL_START),
+    ]
+    for r,d in regs:
+        await cfg_write(sio_i, sck, sce, r, d, freq=freq, sce_pol=sce_pol, log=log)
+
+    waited = 0
+    while True:
+        stat = await cfg_read(sio_i, sio_o, sio_oe, sck, sce, R_NCHKSTAT, freq=freq, sce_pol=sce_pol, log=log)
+        if stat & STAT_DONE:
+            break
+        if timeout_ns > 0 and waited > timeout_ns:
+            raise TimeoutError(f"nor_check did not finish in {timeout_ns} ns (stat={stat:04X}h)")
+        await Timer(poll_ns, 'ns')
+        waited += poll_ns
+
+    res_l = await cfg_read(sio_i, sio_o, sio_oe, sck, sce, R_NCHKRESL, freq=freq, sce_pol=sce_pol, log=log)
+    res_h = await cfg_read(sio_i, sio_o, sio_oe, sck, sce, R_NCHKRESH, freq=freq, sce_pol=sce_pol, log=log)
+    log(f"[check.run] mode={mode} {addr:07X}h+{count} stat={stat:04X}h res={res_h:04X}{res_l:04X}h")
+    return stat, (res_h << 16) | res_l
+
+async def crc_range(sio_i, sio_o, sio_oe, sck, sce, addr: int, count: int, freq: float = 20, sce_pol=0,
+                    poll_ns: float = 1000, timeout_ns: float = 0, log=lambda s: None) -> int:
+    """CRC-32 of count NOR words at addr, computed in the bridge"""
+    _, res = await run(sio_i, sio_o, sio_oe, sck, sce, addr, count, MODE_CRC, freq=freq, sce_pol=sce_pol,
+                       poll_ns=poll_ns, timeout_ns=timeout_ns, log=log)
+    return res
+
+async def blank_check_bridge(sio_i, sio_o, sio_oe, sck, sce, addr: int, count: int, freq: float = 20, sce_pol=0,
+                             poll_ns: float = 1000, timeout_ns: float = 0, log=lambda s: None) -> Optional[int]:
+    """First non-blank NOR address in [addr, addr+count), checked in the bridge, or None"""
+    stat, res = await run(sio_i, sio_o, sio_oe, sck, sce, addr, count, MODE_BLANK, freq=freq, sce_pol=sce_pol,
+                          poll_ns=poll_ns, timeout_ns=timeout_ns, log=log)
+    return res if stat & STAT_FOUND else None
@@ -0,0 +1,54 @@
+"""NOR chip select decode
+
+Host addresses map to (chip, device address) pairs as nor_bus decodes its
+chip selects. Both the host driver (bridge.py) and the multi-chip device
+model (nor.py) use it.
+"""
+
+from dataclasses import dataclass
+from . import vh
+
+_defs = vh.load('busmap.vh')
+
+NOR_MASK = (1 << _defs['NORADDRBITS']) - 1
+
+@dataclass
+class chip_map:
+    """Host address <-> (chip, device address), as nor_bus decodes its chip selects
+
+    Banks (ilv False) take the chip from the top address bits, interleave (ilv
+    True, R_NBUSCTRL.ILV) from the bits just above the page.
+    """
+    chips: int = 1
+    ilv: bool = False
+    addr_bits: int = _defs['NORADDRBITS']
+    page_bits: int = 3
+
+    @property
+    def chip_bits(self) -> int:
+        return (self.chips - 1).bit_length()
+
+    def _shift(self) -> int:
+        return self.page_bits if self.ilv else self.addr_bits - self.chip_bits
+
+    def chip(self, addr: int) -> int:
+        return ((addr & NOR_MASK) >> self._shift()) & (self.chips - 1) if self.chips > 1 else 0
+
+    def device(self, addr: int) -> int:
+        """Address seen by the device"""
+        addr &= NOR_MASK
+        if self.chips == 1:
+            return addr
+        if self.ilv:
+            page = (1 << self.page_bits) - 1
+            return ((addr >> (self.page_bits + self.chip_bits)) << self.page_bits) | (addr & page)
+        return addr & (NOR_MASK >> self.chip_bits)
+
+    def host(self, chip: int, addr: int) -> int:
+        """Host address of device address addr on chip"""
+        if self.chips == 1:
+            return addr & NOR_MASK
+        if self.ilv:
+            page = (1 << self.page_bits) - 1
+            return ((((addr >> self.page_bits) << self.chip_bits) | chip) << self.page_bits | (addr & page)) & NOR_MASK
+        return (chip << self._shift()) | (addr & (NOR_MASK >> self.chip_bits))
@@ -0,0 +1,80 @@
+"""Clocks generated in the testbench wrappers
+
+A clock input of a tb wrapper driven by a tb_clkgen instance named
+<signal>_gen (tb/tb_clkgen.v) runs in the simulator: starting, stopping or
+retiming it writes the generator registers and its edges cost no Python
+wake-ups, only the triggers that wait for them do. Signals without a
+generator (the gate-level wrapper) get a cocotb Clock task instead, with the
+same start/stop behavior.
+
+    clk = clock.get(dut.clk_i).start(11.9, 'ns')
+"""
+
+from decimal import Decimal
+from typing import Dict
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import Timer
+from cocotb.utils import get_sim_steps, get_time_from_sim_steps
+
+def generator(sig):
+    """The tb_clkgen instance driving sig, or None"""
+    try:
+        return getattr(cocotb.top, sig._name + '_gen')
+    except AttributeError:
+        return None
+
+async def _delayed(coro, delay_steps: int):
+    await Timer(delay_steps, 'step')
+    await coro
+
+class tb_clock:
+    """Clock on sig, from its generator if it has one"""
+
+    def __init__(self, sig):
+        self.sig = sig
+        self.gen = generator(sig)
+        self.task = None # cocotb Clock, without a generator
+
+    def start(self, period, units: str = 'ns', phase=0) -> 'tb_clock':
+        """Run with period from phase (same units) from now to the first
+        rising edge. Restarting a running generator clock only retimes it,
+        from its next edge."""
+        steps = get_sim_steps(Decimal(str(period)), units, round_mode='round')
+        phase = get_sim_steps(Decimal(str(phase)), units, round_mode='round')
+        if self.gen is None:
+            self.stop()
+            run = Clock(self.sig, steps, units='step').start()
+            self.task = cocotb.start_soon(_delayed(run, phase) if phase else run)
+            return self
+        high = steps // 2
+        self.gen.high_ps.value  = int(get_time_from_sim_steps(high, 'ps'))
+        self.gen.low_ps.value   = int(get_time_from_sim_steps(steps - high, 'ps'))
+        self.gen.phase_ps.value = int(get_time_from_sim_steps(phase, 'ps'))
+        self.gen.en.value = 1
+        return self
+
+    def stop(self) -> None:
+        """Stop toggling: a generator ends the current half period and goes
+        to the idle level, a Clock task holds the current level"""
+        if self.gen is not None:
+            self.gen.en.value = 0
+        elif self.task is not None:
+            self.task.kill()
+            self.task = None
+
+    def set(self, level: int) -> None:
+        """Drive the stopped clock to level (the idle level of a generator)"""
+        if self.gen is not None:
+            self.gen.level.value = level
+        else:
+            self.sig.value = level
+
+_clocks: Dict[str, tb_clock] = {}
+
+def get(sig) -> tb_clock:
+    """The clock of sig (one per signal for the whole simulation)"""
+    if sig._path not in _clocks:
+        _clocks[sig._path] = tb_clock(sig)
+    return _clocks[sig._path]
@@ -0,0 +1,92 @@
+"""nor_check DIFF mode reference model and DIFF_READ stream decoder
+
+DIFF compares every word of a range against a pattern: PATB where the
+parity of the address bits [15:0] selected by PATM is odd, else PATA
+(PATM = 0 is a constant, 1 alternates words). Each mismatch becomes an
+(address, data) record in the stream DIFF_READ frames shift out, which ends
+with the mismatch count (cmd_defs.vh):
+
+    0000h                                  idle, no record ready yet
+    TAG_REC | addr >> 16, addr & FFFFh, data
+    TAG_END | flags, count >> 16, count & FFFFh
+
+A scan takes as many DIFF_READ frames as the host likes; words not shifted
+out at the end of a frame are sent in the next one.
+"""
+
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from . import vh
+
+_defs = vh.load('cmd_defs.vh')
+
+TAG_MASK = _defs['DIFF_TAG_MASK']
+TAG_REC  = _defs['DIFF_TAG_REC']
+TAG_END  = _defs['DIFF_TAG_END']
+END_ERR  = _defs['DIFF_END_ERR_MASK']
+
+def pattern(addr: int, count: int, pata: int, patb: Optional[int] = None, patm: int = 0) -> np.ndarray:
+    """Expected words of [addr, addr+count)"""
+    a = (np.arange(addr, addr + count, dtype=np.uint32) & patm & 0xFFFF).astype(np.uint16)
+    for s in (8, 4, 2, 1):
+        a ^= a >> s
+    return np.where(a & 1, pata if patb is None else patb, pata).astype(np.uint16)
+
+def records(words, addr: int, pata: int, patb: Optional[int] = None, patm: int = 0) -> List[Tuple[int, int]]:
+    """(address, data) of the words differing from the pattern, words read from addr"""
+    w = np.asarray(words, dtype=np.uint16)
+    i = np.flatnonzero(w != pattern(addr, len(w), pata, patb, patm))
+    return list(zip((addr + i).tolist(), w[i].tolist()))
+
+def stream(recs: Iterable[Tuple[int, int]], err: bool = False) -> List[int]:
+    """Stream words for records (no idle words), end record included"""
+    out = []
+    for a,d in recs:
+        out += [TAG_REC | (a >> 16), a & 0xFFFF, d]
+    n = len(out) // 3
+    return out + [TAG_END | (END_ERR if err else 0), (n >> 16) & 0xFFFF, n & 0xFFFF]
+
+@dataclass
+class result:
+    records: List[Tuple[int, int]] = field(default_factory=list)
+    count: Optional[int] = None # from the end record, None until it arrives
+    err: bool = False
+
+    @property
+    def done(self) -> bool:
+        return self.count is not None
+
+class decoder:
+    """Incremental stream parser, fed the words of successive frames"""
+
+    def __init__(self):
+        self.result = result()
+        self.words = 0 # stream words seen, idle included
+        self._rec: List[int] = []
+
+    @property
+    def done(self) -> bool:
+        return self.result.done
+
+    def feed(self, words: Iterable[int]) -> None:
+        """Parse words; anything after the end record is ignored"""
+        for w in words:
+            if self.done:
+                return
+            self.words += 1
+            if not self._rec and w == 0:
+                continue
+            if not self._rec and (w & TAG_MASK) not in (TAG_REC, TAG_END):
+                raise ValueError(f"DIFF stream: {w:04X}h is not a record start")
+            self._rec.append(w)
+            if len(self._rec) == 3:
+                tag, hi, lo = self._rec
+                self._rec = []
+                if tag & TAG_MASK == TAG_END:
+                    self.result.count = (hi << 16) | lo
+                    self.result.err = bool(tag & END_ERR)
+                else:
+                    self.result.records.append((((tag & ~TAG_MASK) << 16) | hi, lo))
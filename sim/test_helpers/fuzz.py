@@ -0,0 +1,522 @@
+"""Coverage-guided QSPI frame fuzzer
+
+A case is a short list of frames, each frame one CS assertion given as the
+string of hex nibbles clocked in on the quad lines, MSB nibble first. Read
+phases are clocked like any other nibbles (their input is ignored), so
+truncated frames (early CS release), odd nibble counts, unknown opcodes and
+continuations past the end of a command are all just strings.
+
+Coverage is collected from value changes in the DUT, not per clock: qspi_if
+state transitions per command, the state each frame ends in, VT mode entry
+and exit, passthrough entry and the Wishbone cycles each command starts.
+Cases that reach a point not seen before join the corpus and are mutated in
+later rounds.
+
+After every case the bridge must still serve reads: once the NOR is ready, a
+VT exit write (also a NOR reset), a loopback, a FAST_READ of a known range
+compared with the flash model and a CFG read (READ is not checked: without
+dummy cycles its first word is only valid at SCK rates far below the
+test's). A case that fails this is reported and the DUT is reset before the
+next one. Passthrough holds until a system reset by design, so cases that
+enter it are followed by a reset and not checked. CFG writes that would change how the bridge talks to the host
+or the NOR (sampling edge, NOR bus waits and modes, nor_check start) are
+pinned to harmless values when a case is built (pin_config).
+
+In the simulator test_top.test_fuzz runs the cases of $FUZZ_IN and writes
+their results to $FUZZ_OUT, or without FUZZ_IN a short serial campaign. The
+driver runs a campaign with a batch per round split over a process pool,
+one simulator instance per worker (`make fuzz`). A simulator that crashes or
+runs past --timeout fails its batch, which is split and run again down to
+the cases that do it; those are reported as failures:
+
+    python -m test_helpers.fuzz sim_build/fuzz --jobs 8 --rounds 20 --make "make SIM=verilator"
+
+and leaves the corpus, the coverage and the failing cases in the output
+directory.
+"""
+
+import argparse
+import json
+import os
+import random
+import shlex
+import signal
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from . import bridge, regmap, vh
+
+_defs = vh.load('cmd_defs.vh', 'busmap.vh', 'spi_state.vh')
+
+STATES = {v: k[len('SPI_STATE_'):] for k,v in _defs.items() if k.startswith('SPI_STATE_') and k != 'SPI_STATE_BITS'}
+CMDS   = {v: k[len('SPI_COMMAND_'):] for k,v in _defs.items() if k.startswith('SPI_COMMAND_')}
+
+# nibbles per field in each state (qspi_if.v txn_config_reg)
+NIBBLES = {
+    'CMD':        _defs['SPI_CMD_BITS'] // 4,
+    'ADDR':       _defs['SPI_ADDR_BITS'] // 4,
+    'STALL':      _defs['SPI_WAIT_CYC'],
+    'READ_DATA':  _defs['SPI_DATA_BITS'] // 4,
+    'WRITE_DATA': _defs['SPI_DATA_BITS'] // 4,
+}
+
+# state after the address, by command (qspi_if.v), CMD for the others
+_after_addr = {
+    bridge.CMD_READ:       'READ_DATA',
+    bridge.CMD_LOOPBACK:   'READ_DATA',
+    bridge.CMD_FAST_READ:  'STALL',
+    bridge.CMD_WAIT_READY: 'STALL',
+    bridge.CMD_DIFF_READ:  'STALL',
+    bridge.CMD_WRITE_THRU: 'WRITE_DATA',
+}
+
+MAX_FRAMES  = 4
+MAX_NIBBLES = 64
+
+# range read back after every case
+CHECK_ADDR  = 0x1000
+CHECK_WORDS = 4
+
+# CFG registers written back to their reset value when a case writes them
+_pinned = {regmap.regs[n].addr: regmap.regs[n].reset for n in ['QSPICTRL', 'NBUSCTRL', 'NBUSWAIT0', 'NBUSWAIT1']}
+_nchkctrl = regmap.regs['NCHKCTRL']
+
+def fields(frame: str) -> List[Tuple[str, int, int]]:
+    """(state, start, end) nibble ranges of a frame as qspi_if decodes it;
+    the last one may be cut short by the end of the frame"""
+    res = []
+    pos, state = 0, 'CMD'
+    cmd = None
+    while pos < len(frame):
+        end = min(pos + NIBBLES[state], len(frame))
+        res.append((state, pos, end))
+        if end - pos < NIBBLES[state]:
+            break
+        if state == 'CMD':
+            cmd, state = int(frame[pos:end], 16), 'ADDR'
+        elif state == 'ADDR':
+            state = _after_addr.get(cmd, 'CMD')
+        elif state == 'STALL':
+            state = 'READ_DATA'
+        elif state == 'WRITE_DATA':
+            state = 'ADDR'
+        pos = end
+    return res
+
+def describe(frame: str) -> str:
+    """Frame fields as text, e.g. 'WRITE_THRU 80000201 0000 +3'"""
+    out = []
+    for state, a, b in fields(frame):
+        v = frame[a:b]
+        if b - a < NIBBLES[state]:
+            out.append(f"+{b - a}")
+        elif state == 'CMD':
+            out.append(CMDS.get(int(v, 16), f"cmd {v}"))
+        elif state in ('STALL', 'READ_DATA'):
+            if out and out[-1].startswith(state.lower()):
+                n = int(out[-1].split('x')[-1]) + 1
+                out[-1] = f"{state.lower()} x{n}"
+            else:
+                out.append(f"{state.lower()} x1")
+        else:
+            out.append(v)
+    return ' '.join(out) or '(empty)'
+
+def pin_config(frame: str) -> str:
+    """frame with the CFG writes that would reconfigure the bridge made harmless"""
+    out = list(frame)
+    addr = None
+    for state, a, b in fields(frame):
+        if b - a < NIBBLES[state]:
+            break
+        if state == 'ADDR':
+            addr = int(frame[a:b], 16)
+        elif state == 'WRITE_DATA' and addr & bridge.CFG:
+            reg, data = addr & bridge.CFG_MASK, int(frame[a:b], 16)
+            if reg in _pinned:
+                data = _pinned[reg]
+            elif reg == _nchkctrl.addr:
+                data = _nchkctrl.encode(data, START=0)
+            out[a:b] = f"{data:0{b - a}X}"
+    return ''.join(out)
+
+def _hex(f: bridge.Frame) -> str:
+    return f.tx.hex().upper() + '0' * (2 * f.rx_len)
+
+def seeds() -> List[List[str]]:
+    """One case per command and special case the bridge knows"""
+    b = bridge
+    cfg = lambda name: b.CFG | regmap.regs[name].addr
+    return [[_hex(f) for f in c] for c in [
+        [b.read_frame(CHECK_ADDR, 2)],
+        [b.read_fast_frame(CHECK_ADDR, 2)],
+        [b.write_through_frame(0x555, 0xF0)],
+        [b.Frame(b.write_through_frame(0x555, 0xF0).tx + b.write_through_frame(0x2AA, 0xF0).tx[1:])],
+        [b.read_fast_frame(cfg('NBUSCTRL'), 3)],
+        [b.write_through_frame(cfg('NCHKPATA'), 0x1234)],
+        [b.write_through_frame(cfg('QSPICTRL'), 0)],
+        [b.wait_ready_frame(64, 2)],
+        [b.diff_read_frame(2)],
+        [b.loopback_frame(0x1234)],
+        [b.cmd_frame(b.CMD_DET_VT), b.read_fast_frame(CHECK_ADDR, 1), b.write_through_frame(0, b.VT_EXIT_DATA)],
+        [b.cmd_frame(b.CMD_ENTER_PASSTHROUGH)],
+        [b.addr_frame(_defs['SPI_COMMAND_SECT_ERASE'], 0x10000)],
+    ]]
+
+@dataclass
+class case_result:
+    cov: Set[str] = field(default_factory=set)
+    fail: Optional[str] = None # what the read check found, None if it passed
+
+# mutations, each returns a new frame list
+def _frame_pick(rng, case):
+    i = rng.randrange(len(case))
+    return i, case[i]
+
+def _set_nibble(rng, case, corp):
+    i, f = _frame_pick(rng, case)
+    if f:
+        p = rng.randrange(len(f))
+        f = f[:p] + f"{rng.randrange(16):X}" + f[p+1:]
+    return case[:i] + [f] + case[i+1:]
+
+def _truncate(rng, case, corp):
+    i, f = _frame_pick(rng, case)
+    return case[:i] + [f[:rng.randrange(len(f) + 1)]] + case[i+1:]
+
+def _insert_nibble(rng, case, corp):
+    i, f = _frame_pick(rng, case)
+    p = rng.randrange(len(f) + 1)
+    return case[:i] + [f[:p] + f"{rng.randrange(16):X}" + f[p:]] + case[i+1:]
+
+def _delete_nibble(rng, case, corp):
+    i, f = _frame_pick(rng, case)
+    p = rng.randrange(max(len(f), 1))
+    return case[:i] + [f[:p] + f[p+1:]] + case[i+1:]
+
+def _opcode(rng, case, corp):
+    i, f = _frame_pick(rng, case)
+    op = rng.choice(list(CMDS)) if rng.random() < 0.7 else rng.randrange(256)
+    return case[:i] + [f"{op:02X}" + f[2:]] + case[i+1:]
+
+def _toggle_cfg(rng, case, corp):
+    """Flip CTRLBIT in one address field"""
+    i, f = _frame_pick(rng, case)
+    addrs = [a for s,a,b in fields(f) if s == 'ADDR' and b - a == NIBBLES['ADDR']]
+    if addrs:
+        a = rng.choice(addrs)
+        v = int(f[a:a+NIBBLES['ADDR']], 16) ^ bridge.CFG
+        f = f[:a] + f"{v:0{NIBBLES['ADDR']}X}" + f[a+NIBBLES['ADDR']:]
+    return case[:i] + [f] + case[i+1:]
+
+def _vt_exit_data(rng, case, corp):
+    """Make one write data word the VT exit value"""
+    i, f = _frame_pick(rng, case)
+    ws = [a for s,a,b in fields(f) if s == 'WRITE_DATA' and b - a == NIBBLES['WRITE_DATA']]
+    if ws:
+        a = rng.choice(ws)
+        f = f[:a] + f"{bridge.VT_EXIT_DATA:0{NIBBLES['WRITE_DATA']}X}" + f[a+NIBBLES['WRITE_DATA']:]
+    return case[:i] + [f] + case[i+1:]
+
+def _extend(rng, case, corp):
+    """More words: continuous reads or writes, or another command after an unknown one"""
+    i, f = _frame_pick(rng, case)
+    return case[:i] + [f + ''.join(f"{rng.randrange(16):X}" for _ in range(rng.choice([2, 4, 8, 12])))] + case[i+1:]
+
+def _splice(rng, case, corp):
+    other = rng.choice(corp.cases)
+    i = rng.randrange(len(case) + 1)
+    return case[:i] + [rng.choice(other)] + case[i:]
+
+def _drop_frame(rng, case, corp):
+    if len(case) < 2:
+        return case
+    i = rng.randrange(len(case))
+    return case[:i] + case[i+1:]
+
+def _dup_frame(rng, case, corp):
+    i, f = _frame_pick(rng, case)
+    return case[:i+1] + [f] + case[i+1:]
+
+MUTATORS = [_set_nibble, _truncate, _insert_nibble, _delete_nibble, _opcode, _toggle_cfg,
+            _vt_exit_data, _extend, _splice, _drop_frame, _dup_frame]
+
+class corpus:
+    """Cases that reached new coverage, and the coverage and failures so far"""
+
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.cases: List[List[str]] = []
+        self.hits: Dict[str, int] = {} # coverage point -> cases that hit it
+        self.failures: List[dict] = []
+        self.runs = 0
+
+    def mutate(self, case: List[str]) -> List[str]:
+        for _ in range(self.rng.randint(1, 3)):
+            case = self.rng.choice(MUTATORS)(self.rng, case, self)
+        case = [pin_config(f[:MAX_NIBBLES]) for f in case[:MAX_FRAMES]]
+        return case or ['']
+
+    def batch(self, n: int) -> List[List[str]]:
+        """n new cases, half of them from the most recent finds"""
+        if not self.cases:
+            return seeds()
+        res = []
+        for _ in range(n):
+            pool = self.cases[-16:] if self.rng.random() < 0.5 else self.cases
+            res.append(self.mutate(self.rng.choice(pool)))
+        return res
+
+    def update(self, cases: Sequence[List[str]], results: Sequence[case_result]) -> int:
+        """Add the results of cases; returns the number of new coverage points"""
+        new = 0
+        for c,r in zip(cases, results):
+            self.runs += 1
+            fresh = [p for p in r.cov if p not in self.hits]
+            for p in r.cov:
+                self.hits[p] = self.hits.get(p, 0) + 1
+            if fresh:
+                new += len(fresh)
+                self.cases.append(list(c))
+            if r.fail:
+                self.failures.append({'case': list(c), 'frames': [describe(f) for f in c], 'fail': r.fail})
+        return new
+
+    def save(self, d: str) -> None:
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, 'corpus.json'), 'w') as f:
+            json.dump(self.cases, f, indent=1)
+        with open(os.path.join(d, 'coverage.txt'), 'w') as f:
+            f.writelines(f"{n:6d} {p}\n" for p,n in sorted(self.hits.items()))
+        with open(os.path.join(d, 'failures.json'), 'w') as f:
+            json.dump(self.failures, f, indent=1)
+
+def load_cases(path: str) -> List[List[str]]:
+    with open(path) as f:
+        return json.load(f)
+
+def save_results(path: str, results: Sequence[case_result]) -> None:
+    with open(path, 'w') as f:
+        json.dump([{'cov': sorted(r.cov), 'fail': r.fail} for r in results], f)
+
+def load_results(path: str) -> List[case_result]:
+    with open(path) as f:
+        return [case_result(set(r['cov']), r['fail']) for r in json.load(f)]
+
+# simulator side
+
+def _int(v) -> int:
+    return int(v) if v.is_resolvable else -1
+
+class fsm_coverage:
+    """Coverage points hit in tb_top, from value changes of the FSM and bus signals"""
+
+    def __init__(self, dut):
+        self.top = dut.top
+        self.ctrl = dut.top.qspi_ctrl
+        self.hits: Set[str] = set()
+        self.tasks = []
+
+    def _cmd(self) -> str:
+        return CMDS.get(_int(self.ctrl.spicmd.value), 'other')
+
+    def _state(self, v) -> str:
+        return STATES.get(_int(v), 'X')
+
+    async def _transitions(self):
+        from cocotb.triggers import Edge
+
+        prev = self._state(self.ctrl.spistate.value)
+        while True:
+            await Edge(self.ctrl.spistate)
+            s = self._state(self.ctrl.spistate.value)
+            # returns to CMD at CS release are frame ends (_frame_ends)
+            if not self.ctrl.spirst.value:
+                self.hits.add(f"{self._cmd()} {prev}->{s}")
+            prev = s
+
+    async def _frame_ends(self):
+        from cocotb.triggers import RisingEdge
+
+        while True:
+            await RisingEdge(self.ctrl.spirst)
+            s = self._state(self.ctrl.spistate.value)
+            self.hits.add("end CMD" if s == 'CMD' else f"end {self._cmd()} {s}")
+
+    async def _watch(self, trig, point: Callable[[], str]):
+        while True:
+            await trig()
+            self.hits.add(point())
+
+    def start(self) -> 'fsm_coverage':
+        import cocotb
+        from cocotb.triggers import Edge, RisingEdge
+
+        t = self.top
+        we = lambda sig: 'wr' if sig.value else 'rd'
+        watches = [
+            (lambda: Edge(t.vt_mode), lambda: f"vt {'on' if t.vt_mode.value else 'off'}"),
+            (lambda: RisingEdge(t.passthrough_en_o), lambda: "passthrough"),
+            (lambda: RisingEdge(t.cfgwb_cyc), lambda: f"cfgwb {we(t.cfgwb_we)} {self._cmd()}"),
+            (lambda: RisingEdge(t.cfgwb_err), lambda: f"cfgwb err {self._cmd()}"),
+            (lambda: RisingEdge(t.memwb_ctrl_cyc), lambda: f"memwb {we(t.memwb_ctrl_we)} {self._cmd()}"),
+        ]
+        self.tasks = [cocotb.start_soon(self._transitions()), cocotb.start_soon(self._frame_ends())]
+        self.tasks += [cocotb.start_soon(self._watch(trig, point)) for trig, point in watches]
+        return self
+
+    def stop(self) -> None:
+        for t in self.tasks:
+            t.kill()
+        self.tasks = []
+
+    def take(self) -> Set[str]:
+        """Points hit since the last take"""
+        hits, self.hits = self.hits, set()
+        return hits
+
+async def send(dut, case: Sequence[str], freq: float) -> None:
+    """Clock the frames of a case into the tb_top pads"""
+    from cocotb.triggers import Timer
+    from . import qspi
+
+    for f in case:
+        frame = await qspi.spi_frame_begin(freq, dut.pad_spi_sce_i, dut.pad_spi_sck_i, 0)
+        if f:
+            await qspi.spi_write(dut.pad_spi_io_i, dut.pad_spi_sck_i, int(f, 16), qspi.SPI_MODE.QUAD, len(f), init_wait=1)
+        await qspi.spi_frame_end(frame, dut.pad_spi_sce_i, dut.pad_spi_sck_i, 0)
+        await Timer(100, 'ns')
+
+async def check(dut, br: bridge.Bridge, flash) -> Optional[str]:
+    """None if the bridge serves reads, else what it did wrong"""
+    from cocotb.triggers import RisingEdge, with_timeout
+    from cocotb.result import SimTimeoutError
+
+    if not dut.nor_ry_i.value:
+        try:
+            await with_timeout(RisingEdge(dut.nor_ry_i), 1000, 'us')
+        except SimTimeoutError:
+            return "NOR busy"
+    await br.exit_vt()
+    if dut.top.vt_mode.value:
+        return "VT mode not left"
+    lb = await br.loopback(0x5AA5)
+    if lb != 0x5AA5:
+        return f"loopback returned {lb:04X}"
+    want = flash.mem.read_range(CHECK_ADDR, CHECK_WORDS).tolist()
+    got = await br.read_fast(CHECK_ADDR, CHECK_WORDS)
+    if got != want:
+        return f"FAST_READ {CHECK_ADDR:X}: {' '.join(f'{w:04X}' for w in got)}, expected {' '.join(f'{w:04X}' for w in want)}"
+    ctrl = regmap.regs['NBUSCTRL']
+    got = await br.cfg_read(ctrl.addr)
+    if got != ctrl.reset:
+        return f"CFG read NBUSCTRL: {got:04X}, expected {ctrl.reset:04X}"
+    return None
+
+async def run_cases(dut, br: bridge.Bridge, flash, cases: Sequence[Sequence[str]], reset: Callable[[], Awaitable],
+                    freq: float) -> List[case_result]:
+    """Send each case and check the bridge after it; reset() after a failure or passthrough"""
+    from cocotb.triggers import ClockCycles
+
+    cov = fsm_coverage(dut).start()
+    res = []
+    for c in cases:
+        await send(dut, c, freq)
+        await ClockCycles(dut.clk_i, 8) # frame end through the CS synchronizer
+        r = case_result(cov.take())
+        if not dut.top.passthrough_en_o.value:
+            r.fail = await check(dut, br, flash)
+        if r.fail or dut.top.passthrough_en_o.value:
+            await reset()
+        cov.take() # not the check's own points
+        res.append(r)
+    cov.stop()
+    return res
+
+# process pool driver
+
+def _run_worker(args) -> Tuple[Optional[List[case_result]], str]:
+    """Run one batch in its own simulator (make TESTCASE=test_fuzz); no results if it crashed or hung"""
+    make, simdir, outdir, tag, cases, timeout = args
+    fin, fout = os.path.join(outdir, f"in{tag}.json"), os.path.join(outdir, f"out{tag}.json")
+    with open(fin, 'w') as f:
+        json.dump(cases, f)
+    if os.path.exists(fout):
+        os.remove(fout)
+    env = dict(os.environ, FUZZ_IN=fin, FUZZ_OUT=fout, TRACE='',
+               COCOTB_RESULTS_FILE=os.path.join(outdir, f"results{tag}.xml"))
+    with open(os.path.join(outdir, f"worker{tag}.log"), 'w') as log:
+        # own process group, so a hung simulator goes with make
+        p = subprocess.Popen(shlex.split(make) + ['TEST=top', 'TESTCASE=test_fuzz'], cwd=simdir, env=env,
+                             stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        try:
+            rc = p.wait(timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(p.pid, signal.SIGKILL)
+            p.wait()
+            return None, f"hung (no exit in {timeout} s), see {log.name}"
+    if rc or not os.path.exists(fout):
+        return None, f"crashed (exit {rc}), see {log.name}"
+    res = load_results(fout)
+    os.remove(fout)
+    return res, ''
+
+def run_batches(pool, args, simdir: str, chunks: Sequence[List[List[str]]]) -> List[List[case_result]]:
+    """Results of each chunk, one simulator per chunk
+
+    A chunk whose simulator crashed or hung is split in halves and run again
+    until the single cases that do it are found; each of those is a failure.
+    """
+    results = [[None] * len(c) for c in chunks]
+    todo = [(str(i), i, 0, c) for i,c in enumerate(chunks)] # tag, chunk, offset, cases
+    while todo:
+        out = pool.map(_run_worker, [(args.make, simdir, args.dir, t, c, args.timeout) for t,_,_,c in todo])
+        retry = []
+        for (t,i,o,c),(res,err) in zip(todo, out):
+            if res is not None:
+                results[i][o:o+len(c)] = res
+            elif len(c) == 1:
+                results[i][o] = case_result(fail=f"simulator {err}")
+            else:
+                print(f"worker {t}: simulator {err}, splitting {len(c)} cases", flush=True)
+                h = len(c) // 2
+                retry += [(t + 'a', i, o, c[:h]), (t + 'b', i, o + h, c[h:])]
+        todo = retry
+    return results
+
+def main():
+    ap = argparse.ArgumentParser(description="Coverage-guided QSPI frame fuzzing on parallel simulators")
+    ap.add_argument('dir', help="output directory: corpus.json, coverage.txt, failures.json, worker logs")
+    ap.add_argument('--jobs', type=int, default=os.cpu_count(), help="simulators run in parallel")
+    ap.add_argument('--rounds', type=int, default=10)
+    ap.add_argument('--cases', type=int, default=16, help="cases per simulator per round")
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--make', default='make', help="make command line for the simulator runs")
+    ap.add_argument('--timeout', type=float, default=900,
+                    help="seconds one simulator run may take (the first also builds it) before it counts as hung")
+    args = ap.parse_args()
+
+    simdir = str(Path(__file__).resolve().parents[1])
+    os.makedirs(args.dir, exist_ok=True)
+    corp = corpus(args.seed)
+    with ProcessPoolExecutor(args.jobs) as pool:
+        # the seeds first, in one simulator: it also builds it for the others
+        for r in range(args.rounds + 1):
+            cases = corp.batch(args.jobs * args.cases)
+            jobs = 1 if r == 0 else args.jobs
+            chunks = [cases[i::jobs] for i in range(jobs)]
+            results = run_batches(pool, args, simdir, chunks)
+            new = sum(corp.update(c, res) for c,res in zip(chunks, results))
+            print(f"round {r}: {len(cases)} cases, {new} new points, {len(corp.hits)} covered, "
+                  f"corpus {len(corp.cases)}, {len(corp.failures)} failures", flush=True)
+            corp.save(args.dir)
+    for fl in corp.failures:
+        print(f"FAIL {fl['fail']}\n    " + '\n    '.join(fl['frames']))
+    sys.exit(1 if corp.failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,24 @@
 """NOR flash device model"""
 
 from typing import Union
+from collections import OrderedDict
+from dataclasses import dataclass
+import numpy as np
 import cocotb
 from cocotb.triggers import Edge, RisingEdge, FallingEdge, ClockCycles, First, Timer, ReadOnly
+from cocotb.utils import get_sim_time
 from array import array
 from enum import Enum
 from .util import bvstr, sigstr
+from .chips import chip_map
 
 class nor_flash_array:
-    """NOR flash memory array"""
+    """NOR flash memory array
+
+    Word access with read/program/erase, and the same on ranges with NumPy
+    arrays (or anything np.asarray takes) for bulk preload and verification.
+    Range data is viewed as unsigned words of the array item size.
+    """
     mem: array
     tc: str
     size: int
@@ -33,7 +43,13 @@ class nor_flash_array:
         else:
             raise TypeError("typecode must be one of bBuhHiIlLfqQd")
 
-        self.mem = array(self.tc, [self.erase_val]*self.size)
+        self.mem = array(self.tc)
+        self.mem.frombytes(bytes(self.size * self.mem.itemsize))
+        self.erase_all()
+
+    def view(self) -> np.ndarray:
+        """The array as unsigned words, sharing its memory"""
+        return np.frombuffer(self.mem, dtype=f'u{self.mem.itemsize}')
 
     def read(self, addr) -> int:
         return self.mem[addr]
@@ -43,10 +59,43 @@ class nor_flash_array:
 
     def erase(self, addr: int) -> None:
         base_address = self.erase_size * int(addr / self.erase_size)
-        self.mem[base_address:base_address + self.erase_size] = array(self.tc, [self.erase_val]*self.erase_size)
+        self.view()[base_address:base_address + self.erase_size] = self.erase_val
 
     def erase_all(self) -> None:
-        self.mem = array(self.tc, [self.erase_val]*self.size)
+        self.view()[:] = self.erase_val
+
+    def read_range(self, addr: int, count: int) -> np.ndarray:
+        """Copy of count words at addr"""
+        return self.view()[addr:addr + count].copy()
+
+    def program_range(self, addr: int, data) -> None:
+        """Program data at addr: bits can only be cleared (AND), as with program"""
+        data = np.asarray(data)
+        self.view()[addr:addr + len(data)] &= data.astype(self.view().dtype, copy=False)
+
+    def fill_pattern(self, addr: int, count: int, pattern) -> None:
+        """Set count words at addr to pattern, repeated, regardless of their contents (preload)"""
+        pattern = np.asarray(pattern, dtype=self.view().dtype).ravel()
+        self.view()[addr:addr + count] = np.resize(pattern, count)
+
+    def erase_range(self, addr: int, count: int) -> None:
+        """Erase every sector that count words at addr touch"""
+        first = addr // self.erase_size * self.erase_size
+        last = -(-(addr + count) // self.erase_size) * self.erase_size
+        self.view()[first:last] = self.erase_val
+
+    def compare_range(self, addr: int, data) -> np.ndarray:
+        """Addresses where the words at addr differ from data"""
+        data = np.asarray(data)
+        return np.flatnonzero(self.view()[addr:addr + len(data)] != data) + addr
+
+@dataclass
+class vt_distribution:
+    """Cell threshold voltage distributions (normal) for erased (1) and programmed (0) cells, V"""
+    erased_mean: float = 2.0
+    erased_sigma: float = 0.35
+    programmed_mean: float = 5.5
+    programmed_sigma: float = 0.4
 
 class nor_flash_behavioral_x16:
     """NOR flash cocotb behavioral model (x16)"""
@@ -62,10 +111,36 @@ class nor_flash_behavioral_x16:
     # behavioral state
     busy: bool = False
 
+    # sector erase in progress (sector index), or None. Erase suspend (B0h)
+    # stops it after tsuspend_erase and frees the part: reads and programs
+    # outside the sector work, the sector itself reads status. Resume (30h)
+    # continues with the erase time that was left.
+    erasing: int = None
+    suspended: bool = False
+    erase_left: float = 0
+
+    # VT mode: reads with WE held low (bridge VT mode) compare every cell
+    # threshold against vt_level and read 1 where the cell conducts. Cell
+    # thresholds are drawn from vt_dist per sector on first use, seeded by
+    # vt_seed and the sector index, and the last vt_cache_sectors are kept.
+    vt_level: float = None
+    vt_dist: vt_distribution = vt_distribution()
+    vt_seed: int = 0
+    vt_cache_sectors: int = 16
+    vt_read: bool = False
+
+    # transient read errors: an array read flips one random bit with
+    # probability read_upset, drawn from a generator seeded by upset_seed.
+    # upsets counts the flipped reads.
+    read_upset: float = 0
+    upset_seed: int = 0
+    upsets: int = 0
+
     # timing parameters, ns
     tbusy_program = 60*1000
     tbusy_erase_sector = 0.5e9
     tbusy_erase_chip = 30 * 1e9
+    tsuspend_erase = 20*1000
 
     class bus_state(Enum):
         IDLE = 0
@@ -109,17 +184,88 @@ class nor_flash_behavioral_x16:
         self.mem = nor_flash_array('H', size, erase_size)
         self._init_cfi()
         self.log = log
+        self.vt_dist = vt_distribution()
+
+    def _vt_z(self, sector: int) -> np.ndarray:
+        """Per-cell standard normal deviates of one sector, shape (erase_size, 16)"""
+        if not hasattr(self, '_vt_cache'):
+            self._vt_cache = OrderedDict()
+        z = self._vt_cache.get(sector)
+        if z is None:
+            rng = np.random.default_rng((self.vt_seed, sector))
+            z = rng.standard_normal((self.mem.erase_size, 16), dtype=np.float32)
+            self._vt_cache[sector] = z
+            while len(self._vt_cache) > self.vt_cache_sectors:
+                self._vt_cache.popitem(last=False)
+        else:
+            self._vt_cache.move_to_end(sector)
+        return z
+
+    def read_vt_range(self, addr: int, count: int, level: float = None) -> np.ndarray:
+        """VT mode read of count words at addr with gate level (default vt_level)"""
+        level = self.vt_level if level is None else level
+        d = self.vt_dist
+        words = self.mem.view()[addr:addr+count]
+        bitpos = np.arange(16, dtype=np.uint16)
+        out = np.empty(len(words), dtype=np.uint16)
+        es = self.mem.erase_size
+        i = 0
+        while i < len(words):
+            sector, off = divmod(addr + i, es)
+            n = min(es - off, len(words) - i)
+            z = self._vt_z(sector)[off:off+n]
+            erased = ((words[i:i+n, None] >> bitpos) & 1).astype(bool)
+            vt = np.where(erased, d.erased_mean + d.erased_sigma * z, d.programmed_mean + d.programmed_sigma * z)
+            out[i:i+n] = ((vt < level).astype(np.uint16) << bitpos).sum(axis=1, dtype=np.uint16)
+            i += n
+        return out
+
+    def read_vt(self, addr: int, level: float = None) -> int:
+        return int(self.read_vt_range(addr, 1, level)[0])
+
+    def read_status(self, addr: int) -> int:
+        """Status word: DQ7 data polling, DQ6 toggles while busy, DQ3 erase started, DQ2 toggles in the erasing sector"""
+        self._toggle = not getattr(self, '_toggle', False)
+        in_erase = self.erasing is not None and addr // self.mem.erase_size == self.erasing
+        data = 0
+        if self.busy:
+            data |= self._toggle << 6
+            if self.erasing is not None and not self.suspended:
+                data |= 1 << 3
+            else:
+                data |= getattr(self, '_dq7', 0)
+        elif in_erase: # erase suspended
+            data |= 1 << 7
+        if in_erase:
+            data |= self._toggle << 2
+        return data
 
     def read(self, addr: int) -> int:
         data = 0
-        if self.overlay == self.mem_overlay.OVERLAY_CFI:
+        if self.vt_read:
+            data = self.read_vt(addr)
+            self.log(f"[flash] read VT {self.vt_level} @{addr:07X}h = {data:04X}")
+        elif self.busy or (self.suspended and addr // self.mem.erase_size == self.erasing):
+            data = self.read_status(addr)
+            self.log(f"[flash] read status @{addr:07X}h = {data:04X}")
+        elif self.overlay == self.mem_overlay.OVERLAY_CFI:
             data = self.cfi[addr] if addr < len(self.cfi) else 0
             self.log(f"[flash] read CFI @{addr:07X}h = {data:04X}")
         else:
             data = self.mem.read(addr)
+            if self.read_upset:
+                data = self._upset(data)
             self.log(f"[flash] read @{addr:07X}h = {data:04X}")
         return data
 
+    def _upset(self, data: int) -> int:
+        if not hasattr(self, '_upset_rng'):
+            self._upset_rng = np.random.default_rng(self.upset_seed)
+        if self._upset_rng.random() < self.read_upset:
+            self.upsets += 1
+            data ^= 1 << int(self._upset_rng.integers(16))
+        return data
+
     def _handle_cmd_cycle(self, addr: int, data: int) -> int:
         self.log(f"[flash] cmd cycle state={self.state} addr={addr:X} data={data:04X}")
 
@@ -130,6 +276,15 @@ class nor_flash_behavioral_x16:
                 self.busy = False
                 self.overlay = self.mem_overlay.OVERLAY_ARRAY
                 self.log("[flash] received cmd reset")
+            elif data == 0xB0: # erase suspend
+                if self.erasing is not None and not self.suspended:
+                    self.suspended = True
+                    self.log(f"[flash] received cmd erase suspend, sector {self.erasing:X}")
+            elif data == 0x30: # erase resume
+                if self.suspended:
+                    self.suspended = False
+                    wait_time = self.erase_left
+                    self.log(f"[flash] received cmd erase resume, {self.erase_left} ns left")
             elif addr == 0x55 and data == 0x98: # CFI enter
                 self.overlay = self.mem_overlay.OVERLAY_CFI
                 self.log("[flash] received cmd cfi enter")
@@ -155,7 +310,9 @@ class nor_flash_behavioral_x16:
             self.log(f"[flash] received cmd program {addr:X} = {data:04X}")
             # addr is program address and data is program data
             self.mem.program(addr, data)
+            self._dq7 = ~data & 0x80
             wait_time = self.tbusy_program
+            self.state = self.ctrl_state.CMD_CYCLE_1
         elif self.state == self.ctrl_state.CMD_WRITE_BUF:
             self.log("[flash] received cmd write buf")
             pass
@@ -179,16 +336,59 @@ class nor_flash_behavioral_x16:
                 self.log(f"[flash] received cmd erase sector {addr:X}")
                 # sector erase
                 self.mem.erase(addr)
+                self.erasing = addr // self.mem.erase_size
+                self.suspended = False
                 wait_time = self.tbusy_erase_sector
+            self.state = self.ctrl_state.CMD_CYCLE_1
 
         return wait_time
 
+    async def _start_busy(self, bus: dict, wait: float, erase: bool) -> None:
+        """Pull RY low for wait ns; an erase also ends with the erasing sector cleared
+
+        The command state is already back at CMD_CYCLE_1, where the model
+        returns after every program and erase, so the next command cycle is
+        a new sequence (while busy only erase suspend is taken).
+        """
+        self._busy_end = get_sim_time('ns') + wait
+        async def busy():
+            self.log("[flash] busy: wait 90 ns")
+            await Timer(90, 'ns')
+            self.busy = True
+            bus['ry'].value = 0
+            self.log(f"[flash] busy: {wait} ns")
+            if wait > 90:
+                await Timer(wait - 90, 'ns', round_mode='round')
+            bus['ry'].value = 1
+            self.busy = False
+            if erase:
+                self.erasing = None
+            self.log("[flash] busy: done")
+        self._busy_task = await cocotb.start(busy())
+
+    async def _suspend(self, bus: dict) -> None:
+        """Stop the running erase tsuspend_erase ns from now and keep the time left for resume"""
+        left = self._busy_end - get_sim_time('ns') - self.tsuspend_erase
+        if left <= 0: # the erase ends first
+            self.suspended = False
+            return
+        self._busy_task.kill()
+        self.erase_left = left
+        async def suspend():
+            await Timer(self.tsuspend_erase, 'ns', round_mode='round')
+            bus['ry'].value = 1
+            self.busy = False
+            self.log(f"[flash] erase suspended, {left} ns left")
+        await cocotb.start(suspend())
+
     async def state_machine_func(self, bus: dict):
         """Flash state machine function"""
 
         self.log("[flash] startup")
 
         self.busy = False
+        self.erasing = None
+        self.suspended = False
         self.if_state = self.bus_state.IDLE
         self.state = self.ctrl_state.CMD_CYCLE_1
 
@@ -203,29 +403,25 @@ class nor_flash_behavioral_x16:
                 await ReadOnly()
                 self.log(f"[flash] IDLE request ce={bus['ce'].value} oe={bus['oe'].value} we={bus['we'].value}")
                 if not bus['ce'].value: # we only care if CE is low TODO: fix this
-                    assert bus['we'].value or bus['oe'].value # at most one should be asserted
-                    if (not bus['we'].value) and (not self.busy):
-                        self.log(f"[flash] IDLE request write not busy")
+                    # WE and OE are only both asserted for VT mode reads
+                    self.vt_read = self.vt_level is not None and not bus['we'].value and not bus['oe'].value
+                    assert bus['we'].value or bus['oe'].value or self.vt_read # at most one should be asserted
+                    if (not bus['we'].value) and (not self.vt_read):
+                        self.log("[flash] IDLE request write")
                         await Timer(35, 'ns') # tWP
                         # now we sample the address and data
                         addr = int(bus['addr'].value)
                         data = int(bus['data_o'].value)
-                        wait_time = self._handle_cmd_cycle(addr, data)
-                        if wait_time > 0:
-                            async def set_busy():
-                                self.log(f"[flash] set_busy: wait 90 ns")
-                                await Timer(90, 'ns')
-                                self.busy = 1
-                                bus['ry'].value = 0
-                                self.log(f"[flash] set_busy: done")
-                            await cocotb.start(set_busy())
-                            async def unset_busy(wait):
-                                self.log(f"[flash] unset_busy: wait {wait} ns")
-                                await Timer(wait, 'ns')
-                                bus['ry'].value = 1
-                                self.busy = 0
-                                self.log(f"[flash] unset_busy: done")
-                            await cocotb.start(unset_busy(wait_time))
+                        # while busy only an erase may be suspended
+                        if self.busy and not (data == 0xB0 and self.erasing is not None):
+                            self.log(f"[flash] write while busy {addr:X} = {data:04X}, ignored")
+                        else:
+                            suspended = self.suspended
+                            wait_time = self._handle_cmd_cycle(addr, data)
+                            if self.suspended and not suspended:
+                                await self._suspend(bus)
+                            elif wait_time > 0:
+                                await self._start_busy(bus, wait_time, erase=self.erasing is not None and not self.suspended)
                         self.if_state = self.bus_state.RECOVERY
                     elif not bus['oe'].value:
                         self.log(f"[flash] IDLE request read {sigstr(bus['addr'], fmt='07X')}h")
@@ -233,9 +429,6 @@ class nor_flash_behavioral_x16:
                         bus['data_i'].value = 0
                         await First(Timer(180-1, 'ns'), RisingEdge(bus['ce']), RisingEdge(bus['oe'])) # tACC worst case, or deselect
                         if not bus['ce'].value and not bus['oe'].value: # timer expired
-                            # TODO: status data
-                            if self.busy:
-                                raise Warning("status data is not yet implemented, reading memory")
                             bus['data_i'].value = self.read(int(bus['addr'].value))
                             #self.log(f"[flash] read @{sigstr(bus['addr'], fmt='07X')}h = {self.read(bus['addr'].value.integer)):04X}")
                             #self.log(f"[flash] IDLE request read wait for end")
@@ -255,8 +448,6 @@ class nor_flash_behavioral_x16:
                                     await First(Edge(bus['addr']), RisingEdge(bus['ce']), RisingEdge(bus['oe']))
                                 await Timer(1, 'ns') # just to be sure
                         self.if_state = self.bus_state.IDLE
-                    else:
-                        self.log("[flash] request while busy")
             elif self.if_state == self.bus_state.RECOVERY:
                 self.log(f"[flash] RECOVERY")
                 await Timer(35, 'ns') # tCEH
@@ -264,3 +455,100 @@ class nor_flash_behavioral_x16:
             else:
                 self.log(f"[flash] if_state = {self.if_state}")
                 self.if_state = self.bus_state.IDLE
+
+class nor_flash_bank:
+    """Several nor_flash_behavioral_x16 devices sharing one bus
+
+    Each device has its own chip select and ready/busy line and sees the
+    device address of chip_map; the other bus signals are shared. Host
+    addresses are the bridge (memory wishbone) addresses.
+    """
+
+    def __init__(self, chips: chip_map, size: int, erase_size: int, log=lambda s: None):
+        self.chips = chips
+        self.devices = [nor_flash_behavioral_x16(size, erase_size, log=lambda s, c=c: log(f"[chip {c}] {s}"))
+                        for c in range(chips.chips)]
+        self.tasks = []
+
+    def __getitem__(self, chip: int) -> nor_flash_behavioral_x16:
+        return self.devices[chip]
+
+    def device(self, addr: int) -> nor_flash_behavioral_x16:
+        return self.devices[self.chips.chip(addr)]
+
+    def read(self, addr: int) -> int:
+        """Array contents at a host address"""
+        return self.device(addr).mem.read(self.chips.device(addr))
+
+    def program(self, addr: int, data: int) -> None:
+        self.device(addr).mem.program(self.chips.device(addr), data)
+
+    def start(self, bus: dict, ce: list, ry: list) -> None:
+        """Run every device on bus with its own ce and ry signal"""
+        for dev, c, r in zip(self.devices, ce, ry):
+            self.tasks.append(cocotb.start_soon(dev.state_machine_func(dict(bus, ce=c, ry=r))))
+
+    def stop(self) -> None:
+        for t in self.tasks:
+            t.kill()
+        self.tasks = []
+
+class nor_flash_verilog:
+    """Python side of the Verilog NOR model (tb/nor_flash_model.v)
+
+    Sets the model timing (same attribute names as nor_flash_behavioral_x16,
+    in ns) and moves array contents in bulk through $readmemh/$writememh
+    files, which are written in the simulator working directory.
+    """
+
+    TIMING = ['tbusy_program', 'tbusy_erase_sector', 'tbusy_erase_chip', 'tsuspend_erase']
+
+    def __init__(self, model, name: str = 'nor_model', log=lambda s: None):
+        self.model = model
+        self.name = name
+        self.log = log
+
+    def __getattr__(self, name):
+        if name in nor_flash_verilog.TIMING:
+            return int(getattr(self.model, name).value)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name in nor_flash_verilog.TIMING:
+            getattr(self.model, name).value = int(value)
+        else:
+            super().__setattr__(name, value)
+
+    @staticmethod
+    def _fname(path: str) -> int:
+        """File name as a Verilog string value"""
+        return int.from_bytes(path.encode(), 'big')
+
+    async def load(self, addr: int, words) -> None:
+        """Write words to the array at addr, bypassing the command interface"""
+        words = np.asarray(words, dtype=np.uint16)
+        path = f"{self.name}_load.hex"
+        with open(path, 'w') as f:
+            f.write(f"@{addr:x}\n")
+            f.write('\n'.join(f"{w:04x}" for w in words.tolist()))
+            f.write('\n')
+        self.model.load_file.value = self._fname(path)
+        self.model.load_req.value = int(not self.model.load_req.value)
+        await Timer(1, 'ns')
+        self.log(f"[flash model] loaded {len(words)} words at {addr:07X}h")
+
+    async def read_range(self, addr: int, count: int) -> np.ndarray:
+        """Array contents at addr, bypassing the command interface"""
+        path = f"{self.name}_dump.hex"
+        self.model.dump_file.value = self._fname(path)
+        self.model.dump_start.value = addr
+        self.model.dump_end.value = addr + count - 1
+        self.model.dump_req.value = int(not self.model.dump_req.value)
+        await Timer(1, 'ns')
+        words = []
+        with open(path) as f:
+            for line in f:
+                line = line.split('//')[0].strip()
+                if line and not line.startswith('@'):
+                    words.extend(int(w, 16) for w in line.split())
+        return np.array(words, dtype=np.uint16)
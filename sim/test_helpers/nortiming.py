@@ -0,0 +1,252 @@
+"""NOR bus AC timing check
+
+edge_recorder logs every value change of the NOR bus signals (ce, oe, we,
+addr, data_o) with its sim time, one cheap append per edge. After the run,
+check() pairs the edges into write pulses and read windows with numpy and
+measures every datasheet parameter in nor_ac_timing against its limit,
+reporting the worst margin of each. Times are in ps in the recording and ns
+in the results.
+
+Reads are sampled where nor_bus latches the data it acks. If the edges
+include the nor_bus memory ack ('ack'), that is the clock edge on which ack
+rises; reads that were never acked (a burst cut short by the master) are not
+checked. Without it the sample is taken at the address change that ends a
+chained read, or one clock before OE and CE rise.
+"""
+
+import argparse
+from array import array
+from dataclasses import dataclass, fields
+from typing import Dict, List
+
+import numpy as np
+
+SIGNALS = ['ce', 'oe', 'we', 'addr', 'data_o']
+ACK = 'ack' # optional
+
+@dataclass
+class nor_ac_timing:
+    """Minimum times in ns; defaults follow nor_flash_behavioral_x16"""
+    tWC:   float = 90  # write cycle, WE fall to WE fall
+    tWP:   float = 35  # WE low
+    tWPH:  float = 20  # WE high between writes
+    tCS:   float = 0   # CE fall to WE fall
+    tCH:   float = 0   # WE rise to CE rise
+    tAS:   float = 0   # address setup to WE fall
+    tAH:   float = 45  # address hold from WE fall
+    tDS:   float = 30  # data setup to WE rise
+    tDH:   float = 0   # data hold from WE rise
+    tCEH:  float = 35  # CE high between cycles
+    tACC:  float = 180 # address to data
+    tPACC: float = 25  # page address to data
+    tCE:   float = 180 # CE fall to data
+    tOE:   float = 25  # OE fall to data
+
+class edge_recorder:
+    """Records (time, value) of every change of the given signals"""
+
+    def __init__(self, signals: Dict):
+        self.signals = signals
+        self.t = {k: array('q') for k in signals}
+        self.v = {k: array('q') for k in signals}
+        self.tasks = []
+
+    @staticmethod
+    def _val(s) -> int:
+        v = s.value
+        return v.integer if v.is_resolvable else -1
+
+    def start(self) -> 'edge_recorder':
+        import cocotb
+        from cocotb.triggers import Edge
+        from cocotb.utils import get_sim_time
+
+        async def rec(sig, t, v):
+            t.append(int(get_sim_time('ps')))
+            v.append(self._val(sig))
+            while True:
+                await Edge(sig)
+                t.append(int(get_sim_time('ps')))
+                v.append(self._val(sig))
+
+        for k,s in self.signals.items():
+            self.tasks.append(cocotb.start_soon(rec(s, self.t[k], self.v[k])))
+        return self
+
+    def stop(self) -> None:
+        for task in self.tasks:
+            task.kill()
+        self.tasks = []
+
+    def edges(self) -> Dict[str, np.ndarray]:
+        """{name: times}, {name_v: values}, as for save()"""
+        out = {}
+        for k in self.signals:
+            out[k] = np.frombuffer(self.t[k], dtype=np.int64).copy()
+            out[k + '_v'] = np.frombuffer(self.v[k], dtype=np.int64).copy()
+        return out
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, **self.edges())
+
+class _sig:
+    """Value change list: value at a time, neighbouring change times"""
+
+    def __init__(self, t: np.ndarray, v: np.ndarray):
+        # keep the last value of changes in the same time step
+        keep = np.append(t[1:] != t[:-1], True) if len(t) else np.zeros(0, bool)
+        t, v = t[keep], v[keep]
+        # and only real changes
+        keep = np.append(True, v[1:] != v[:-1]) if len(t) else keep[:0]
+        self.t, self.v = t[keep], v[keep]
+
+    def at(self, tq):
+        return self.v[np.maximum(np.searchsorted(self.t, tq, 'right') - 1, 0)]
+
+    def last_change(self, tq):
+        """Last change at or before tq"""
+        return self.t[np.maximum(np.searchsorted(self.t, tq, 'right') - 1, 0)]
+
+    def next_change(self, tq, strict=False):
+        """First change at (unless strict) or after tq; +inf if none"""
+        i = np.searchsorted(self.t, tq, 'right' if strict else 'left')
+        t = np.append(self.t, np.iinfo(np.int64).max)
+        return t[i]
+
+    def falls(self):
+        i = np.flatnonzero((self.v[1:] == 0) & (self.v[:-1] == 1)) + 1
+        return self.t[i]
+
+    def rises(self):
+        i = np.flatnonzero((self.v[1:] == 1) & (self.v[:-1] == 0)) + 1
+        return self.t[i]
+
+def _until(t_next: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """t_next - t, keeping the no-change marker"""
+    big = np.iinfo(np.int64).max
+    return np.where(t_next == big, big, t_next - t)
+
+def _pulses(falls: np.ndarray, rises: np.ndarray):
+    """Pair each fall with the next rise"""
+    i = np.searchsorted(rises, falls, 'right')
+    ok = i < len(rises)
+    return falls[ok], rises[i[ok]]
+
+@dataclass
+class margin:
+    param: str
+    limit: float    # ns
+    count: int      # measurements
+    worst: float    # smallest measured value, ns
+    violations: int
+    t_worst: float  # ns, time of the worst case
+
+    @property
+    def margin(self) -> float:
+        return self.worst - self.limit
+
+def _margin(name: str, limit: float, value_ps: np.ndarray, t_ps: np.ndarray) -> margin:
+    value_ps = np.asarray(value_ps, dtype=np.float64)
+    value_ps = value_ps[value_ps < np.iinfo(np.int64).max / 2] if len(value_ps) else value_ps
+    if len(value_ps) == 0:
+        return margin(name, limit, 0, float('inf'), 0, float('nan'))
+    i = int(np.argmin(value_ps))
+    v = value_ps / 1000
+    return margin(name, limit, len(v), float(v[i]), int(np.count_nonzero(v < limit)), float(t_ps[i]) / 1000)
+
+def check(edges: Dict[str, np.ndarray], timing: nor_ac_timing = None, clk_ns: float = 11.9) -> List[margin]:
+    """Measure every parameter of timing over the recorded edges; clk_ns is the nor_bus clock period"""
+    timing = timing or nor_ac_timing()
+    clk_ps = int(round(clk_ns * 1000))
+    ce, oe, we, addr, data = (_sig(edges[k], edges[k + '_v']) for k in SIGNALS)
+    res = []
+
+    # writes: WE pulses with CE low and OE high (WE and OE both low is a VT read)
+    wf, wr = _pulses(we.falls(), we.rises())
+    sel = (ce.at(wf) == 0) & (oe.at(wf) == 1)
+    wf, wr = wf[sel], wr[sel]
+    res.append(_margin('tWP', timing.tWP, wr - wf, wf))
+    res.append(_margin('tWPH', timing.tWPH, wf[1:] - wr[:-1], wr[:-1]))
+    res.append(_margin('tWC', timing.tWC, np.diff(wf), wf[:-1]))
+    res.append(_margin('tCS', timing.tCS, wf - ce.last_change(wf), wf))
+    res.append(_margin('tCH', timing.tCH, _until(ce.next_change(wr), wr), wr))
+    res.append(_margin('tAS', timing.tAS, wf - addr.last_change(wf), wf))
+    res.append(_margin('tAH', timing.tAH, _until(addr.next_change(wf, strict=True), wf), wf))
+    res.append(_margin('tDS', timing.tDS, wr - data.last_change(wr), wr))
+    res.append(_margin('tDH', timing.tDH, _until(data.next_change(wr), wr), wr))
+
+    cf, cr = ce.falls(), ce.rises()
+    j = np.searchsorted(cf, cr, 'right')
+    ok = j < len(cf)
+    res.append(_margin('tCEH', timing.tCEH, cf[j[ok]] - cr[ok], cr[ok]))
+
+    if ACK in edges:
+        res.extend(_check_reads_ack(edges, timing, ce, oe, addr))
+        return res
+
+    # reads: OE pulses with CE low, split into windows at every address change
+    of, oend = _pulses(oe.falls(), oe.rises())
+    oend = np.minimum(oend, ce.next_change(of, strict=True))
+    sel = ce.at(of) == 0
+    of, oend = of[sel], oend[sel]
+    ac = addr.t
+    k0 = np.searchsorted(ac, of, 'right')  # first change after the OE fall
+    n = np.searchsorted(ac, oend, 'left') - k0 # changes before the OE end
+    p = np.repeat(np.arange(len(of)), n + 1)   # pulse of each window
+    pos = np.arange(len(p)) - np.repeat(np.cumsum(n + 1) - (n + 1), n + 1)
+    i = np.minimum(k0[p] + pos, len(ac) - 1)
+    start = np.where(pos == 0, addr.last_change(of)[p], ac[i - 1])
+    # nor_bus latches the last word one clock before it raises OE and CE; a
+    # shorter last window is the address of the next request, not a read
+    end = np.where(pos == n[p], oend[p] - clk_ps, ac[i])
+    sel = end > start
+    p, pos, start, end = p[sel], pos[sel], start[sel], end[sel]
+    a = addr.at(start)
+    page = np.zeros(len(p), dtype=bool)
+    page[1:] = (pos[1:] > 0) & (p[1:] == p[:-1]) & ((a[1:] >> 3) == (a[:-1] >> 3))
+    res.append(_margin('tACC', timing.tACC, (end - start)[~page], end[~page]))
+    res.append(_margin('tPACC', timing.tPACC, (end - start)[page], end[page]))
+    res.append(_margin('tOE', timing.tOE, end - of[p], end))
+    res.append(_margin('tCE', timing.tCE, end - ce.last_change(of)[p], end))
+    return res
+
+def _check_reads_ack(edges, timing, ce, oe, addr) -> List[margin]:
+    """Read windows ending at every ack of a read, from the address change before it"""
+    ack = _sig(edges[ACK], edges[ACK + '_v'])
+    end = ack.rises()
+    # data is latched from the clock before the ack edge
+    end = end[(ce.at(end - 1) == 0) & (oe.at(end - 1) == 0)]
+    start = addr.last_change(end - 1)
+    of = oe.last_change(end - 1)
+    cf = ce.last_change(end - 1)
+    # page mode: address changed while OE stayed low, within the page
+    page = (start > of) & ((addr.at(start - 1) >> 3) == (addr.at(start) >> 3))
+    return [
+        _margin('tACC', timing.tACC, (end - start)[~page], end[~page]),
+        _margin('tPACC', timing.tPACC, (end - start)[page], end[page]),
+        _margin('tOE', timing.tOE, end - of, end),
+        _margin('tCE', timing.tCE, end - cf, end),
+    ]
+
+def report(margins: List[margin]) -> str:
+    lines = [f"{'param':6} {'limit':>8} {'worst':>9} {'margin':>9} {'count':>9} {'viol':>6}  at"]
+    for m in margins:
+        at = f"{m.t_worst:.1f} ns" if m.count else '-'
+        lines.append(f"{m.param:6} {m.limit:8.1f} {m.worst:9.1f} {m.margin:9.1f} {m.count:9d} {m.violations:6d}  {at}")
+    return '\n'.join(lines)
+
+def main():
+    ap = argparse.ArgumentParser(description="Check recorded NOR bus edges against AC timing")
+    ap.add_argument('edges', help=".npz from edge_recorder.save")
+    ap.add_argument('--clk', type=float, default=11.9, help="nor_bus clock period, ns")
+    for f in fields(nor_ac_timing):
+        ap.add_argument(f'--{f.name}', type=float, default=f.default, help=f"ns (default {f.default})")
+    args = ap.parse_args()
+    timing = nor_ac_timing(**{f.name: getattr(args, f.name) for f in fields(nor_ac_timing)})
+    m = check(dict(np.load(args.edges)), timing, args.clk)
+    print(report(m))
+    if any(x.violations for x in m):
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
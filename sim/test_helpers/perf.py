@@ -0,0 +1,77 @@
+"""Bridge performance counters (perf.v)
+
+Counters are named after their PERF_CNT_<NAME> index in busmap.vh. read()
+snapshots them with one R_PERFCTRL write (clearing them too, by default) and
+fetches every snapshot with a single FAST_READ burst of the CFG space, so
+the values are consistent with each other. rates() turns a reading into
+per-second rates and a few ratios:
+
+    page_mode   NOR page mode read cycles / all NOR read cycles
+    mem_stall   memory wishbone stall clocks / clocks
+    nor_busy    clocks with RY low / clocks
+    frames      QSPI frames of any command
+
+The counters are 32 bits and wrap (after 51 s at 84 MHz for CLK): read and
+clear them more often than that, or pass the previous reading to rates()
+and leave them running.
+"""
+
+from typing import Dict, Optional
+
+from . import vh
+from .bridge import CFG
+
+_defs = vh.load('cmd_defs.vh', 'busmap.vh')
+
+R_PERFCTRL = _defs['R_PERFCTRL']
+R_PERFCNT  = _defs['R_PERFCNT']
+CTRL_SNAP  = _defs['R_PERFCTRL_SNAP_MASK']
+CTRL_CLR   = _defs['R_PERFCTRL_CLR_MASK']
+CTRL_STOP  = _defs['R_PERFCTRL_STOP_MASK']
+
+# counter names by index
+COUNTERS = [k[len('PERF_CNT_'):] for k,v in sorted(((k,v) for k,v in _defs.items() if k.startswith('PERF_CNT_')),
+                                                     key=lambda kv: kv[1])]
+assert len(COUNTERS) == _defs['PERF_COUNTERS']
+FRAMES = ['READ', 'FAST_READ', 'WRITE_THRU', 'WAIT_READY', 'DIFF_READ', 'LOOPBACK', 'OTHER']
+
+def decode(words) -> Dict[str, int]:
+    """Counter values from the R_PERFCNT words (low half first)"""
+    return {n: (words[2*i+1] << 16) | words[2*i] for i,n in enumerate(COUNTERS)}
+
+async def read(bridge, clear: bool = True, stop: bool = False) -> Dict[str, int]:
+    """Snapshot the counters (then clear them if clear) and read the snapshot"""
+    b = bridge.batch()
+    b.cfg_write(R_PERFCTRL, CTRL_SNAP | (CTRL_CLR if clear else 0) | (CTRL_STOP if stop else 0))
+    i = b.read_fast(CFG | R_PERFCNT, 2 * len(COUNTERS))
+    return decode((await b.run())[i])
+
+async def clear(bridge) -> None:
+    await bridge.cfg_write(R_PERFCTRL, CTRL_CLR)
+
+def delta(counts: Dict[str, int], prev: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """counts - prev, for counters that wrapped in between too"""
+    return {k: (v - (prev[k] if prev else 0)) & 0xFFFFFFFF for k,v in counts.items()}
+
+def rates(counts: Dict[str, int], clk_hz: float, prev: Optional[Dict[str, int]] = None) -> Dict[str, float]:
+    """Events per second over the counted interval (CLK clocks of clk_hz), and
+    the ratios in the module docstring. prev is an earlier reading of running
+    counters; without it counts are taken as counted from a clear."""
+    d = delta(counts, prev)
+    clk = d['CLK']
+    secs = clk / clk_hz if clk else 0.0
+    res = {k: (v / secs if secs else 0.0) for k,v in d.items() if k != 'CLK'}
+    rd = d['NOR_RD'] + d['NOR_RDPG']
+    res['seconds']   = secs
+    res['frames']    = sum(d[k] for k in FRAMES) / secs if secs else 0.0
+    res['page_mode'] = d['NOR_RDPG'] / rd if rd else 0.0
+    res['mem_stall'] = d['MEM_STALL'] / clk if clk else 0.0
+    res['nor_busy']  = d['RY_BUSY'] / clk if clk else 0.0
+    return res
+
+def report(r: Dict[str, float]) -> str:
+    lines = [f"{'counter':12} {'rate':>14}"]
+    for k,v in r.items():
+        unit = '' if k in ('seconds', 'page_mode', 'mem_stall', 'nor_busy') else ' /s'
+        lines.append(f"{k:12} {v:14.6g}{unit}")
+    return '\n'.join(lines)
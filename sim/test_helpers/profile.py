@@ -0,0 +1,148 @@
+"""Coroutine wake-up profiler
+
+Counts scheduler wake-ups per coroutine and trigger type, with the wall-clock
+time spent running after each wake-up and the simulated time spent waiting
+before it. A wake-up is charged to the innermost coroutine that was waiting
+(e.g. `spi_write_msb` rather than the test awaiting it) and to the type of the
+trigger it waited on.
+
+Opt-in: set WAKE_PROFILE to an output directory (`make WAKE_PROFILE=prof`).
+Every test module calls install_from_env() at import. At the end of each
+test a ranked report is logged and <dir>/<test>.json is written.
+"""
+
+import json
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional, Tuple
+
+from cocotb.regression import RegressionManager
+from cocotb.task import Task
+from cocotb.utils import get_sim_time
+
+PROFILE_ENV = 'WAKE_PROFILE'
+
+@dataclass
+class wakeup_stats:
+    wakeups: int = 0
+    wall_s: float = 0.0 # running after the wake-up
+    sim_ns: float = 0.0 # waiting before the wake-up
+
+def _leaf_name(coro) -> str:
+    """Name of the innermost coroutine in an await chain"""
+    while True:
+        inner = getattr(coro, 'cr_await', None)
+        if inner is None or not hasattr(inner, 'cr_code'):
+            break
+        coro = inner
+    code = getattr(coro, 'cr_code', None) or getattr(coro, 'gi_code', None)
+    if code is None:
+        return type(coro).__qualname__
+    return getattr(code, 'co_qualname', code.co_name)
+
+class wakeup_profiler:
+    """Patches Task._advance to record wake-ups of every cocotb task"""
+
+    def __init__(self):
+        self.stats: Dict[Tuple[str, str], wakeup_stats] = {}
+        self._orig_advance = None
+        self._t0 = time.perf_counter()
+        self._sim0 = 0.0
+
+    def reset(self) -> None:
+        self.stats = {}
+        self._t0 = time.perf_counter()
+        self._sim0 = get_sim_time('ns')
+
+    def install(self) -> None:
+        if self._orig_advance is not None:
+            return
+        orig = self._orig_advance = Task._advance
+        prof = self
+
+        def _advance(task, outcome):
+            now = get_sim_time('ns')
+            # set by the previous wake-up of this task
+            key = getattr(task, '_prof_wait', None) or (_leaf_name(task._coro), 'start')
+            since = getattr(task, '_prof_since', now)
+            t0 = time.perf_counter()
+            result = orig(task, outcome)
+            dt = time.perf_counter() - t0
+            s = prof.stats.get(key)
+            if s is None:
+                s = prof.stats[key] = wakeup_stats()
+            s.wakeups += 1
+            s.wall_s += dt
+            s.sim_ns += now - since
+            if result is not None:
+                task._prof_wait = (_leaf_name(task._coro), type(result).__name__)
+                task._prof_since = now
+            return result
+
+        Task._advance = _advance
+        self.reset()
+
+    def uninstall(self) -> None:
+        if self._orig_advance is not None:
+            Task._advance = self._orig_advance
+            self._orig_advance = None
+
+    def totals(self, by: int) -> Dict[str, wakeup_stats]:
+        """Stats summed per coroutine (by=0) or per trigger type (by=1)"""
+        out: Dict[str, wakeup_stats] = {}
+        for key, s in self.stats.items():
+            t = out.setdefault(key[by], wakeup_stats())
+            t.wakeups += s.wakeups
+            t.wall_s += s.wall_s
+            t.sim_ns += s.sim_ns
+        return out
+
+    def to_dict(self, name: str = '') -> dict:
+        return {
+            'test': name,
+            'wall_s': time.perf_counter() - self._t0,
+            'sim_ns': get_sim_time('ns') - self._sim0,
+            'entries': [dict(coroutine=c, trigger=t, **asdict(s)) for (c, t), s in
+                        sorted(self.stats.items(), key=lambda kv: -kv[1].wall_s)],
+        }
+
+    def report(self, name: str = '', top: int = 15) -> str:
+        d = self.to_dict(name)
+        wall = sum(s.wall_s for s in self.stats.values())
+        lines = [f"wake-up profile {name}: {sum(s.wakeups for s in self.stats.values())} wake-ups, "
+                 f"{wall*1e3:.1f} ms in coroutines of {d['wall_s']*1e3:.1f} ms, {d['sim_ns']:.0f} ns simulated"]
+        for title, rows in [('coroutine', self.totals(0)), ('trigger', self.totals(1))]:
+            lines.append(f"  {'by ' + title:<40} {'wakeups':>9} {'wall ms':>9} {'%':>5} {'us/wake':>8} {'sim ns waited':>14}")
+            for k, s in sorted(rows.items(), key=lambda kv: -kv[1].wall_s)[:top]:
+                lines.append(f"  {k[:40]:<40} {s.wakeups:9d} {s.wall_s*1e3:9.1f} {100*s.wall_s/wall if wall else 0:5.1f} "
+                             f"{1e6*s.wall_s/s.wakeups:8.1f} {s.sim_ns:14.0f}")
+        return '\n'.join(lines)
+
+    def write(self, path: str, name: str = '') -> None:
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(name), f, indent=1)
+
+profiler: Optional[wakeup_profiler] = None
+
+def install_from_env(log=None) -> Optional[wakeup_profiler]:
+    """Start profiling if WAKE_PROFILE is set; report and reset after every test"""
+    global profiler
+    outdir = os.environ.get(PROFILE_ENV)
+    if not outdir or profiler is not None:
+        return profiler
+    os.makedirs(outdir, exist_ok=True)
+    profiler = wakeup_profiler()
+    profiler.install()
+
+    record = RegressionManager._record_result
+
+    def _record_result(self, test, outcome, wall_time_s, sim_time_ns):
+        record(self, test, outcome, wall_time_s, sim_time_ns)
+        name = test.__qualname__
+        (log or self.log.info)(profiler.report(name))
+        profiler.write(os.path.join(outdir, f"{name}.json"), name)
+        profiler.reset()
+
+    RegressionManager._record_result = _record_result
+    return profiler
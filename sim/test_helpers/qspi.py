@@ -1,9 +1,10 @@
 import cocotb
-from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge, FallingEdge, ClockCycles, Timer, Join
+from cocotb.utils import get_sim_time
 from typing import List
 from enum import Enum
 from .util import sigstr
+from . import clock
 
 async def with_delay(coro: cocotb.Task or cocotb.Coroutine, delay, units: str = "step"):
     await Timer(delay, units)
@@ -11,14 +12,16 @@ async def with_delay(coro: cocotb.Task or cocotb.Coroutine, delay, units: str =
 
 def sim_period(freq: float):
     #return 10*int(100000.0/freq) # freq (MHz) -> period (ps), rounded to 10ps
-    return (10*int(100000.0/freq))/1000.0 # freq (MHz) -> period (ns), rounded to 10ps
+    # freq (MHz) -> period (ns), rounded to 20ps so that the half period is a
+    # whole number of 10ps steps (the tb timescale precision)
+    return (20*int(50000.0/freq))/1000.0
 
-def start_sck(sck, period: float, units='ns'):
+def start_sck(sck, period: float, units='ns') -> clock.tb_clock:
     #T = 10*int(100000.0/freq) # freq (MHz) -> period (ps), rounded to 10ps
     #T = sim_period(freq)
     #log(f"[start_sck] starting sck with f={freq} => T={T} (rounded to 10 ps)")
-    sck_task = cocotb.start_soon(with_delay(Clock(sck, period, units=units).start(), 1, 'ns'))
-    return sck_task
+    # first rising edge 1 ns from now
+    return clock.get(sck).start(period, units, phase=1)
 
 class SPI_MODE(Enum):
     SINGLE = 0,
@@ -31,7 +34,7 @@ async def spi_write_lsb(sio_i, sck, data: int, mode: SPI_MODE, cycles: int, init
         else: # single
             sio_i.value = (data >> i) & 0x1
         if i == 0 and init_wait > 0:
-            await Timer(init_wait, 'ns')
+            await Timer(init_wait, 'ns', round_mode='round')
         await FallingEdge(sck)
         #log(f"[spi_write_lsb] cmd bit {i} = {sigstr(sio.value)}h (?= {(cmd>>i)&0x01:04X}h)")
 
@@ -42,26 +45,35 @@ async def spi_write_msb(sio_i, sck, data: int, mode: SPI_MODE, cycles: int, init
         else: # single
             sio_i.value = (data >> i) & 0x1
         if i == cycles-1 and init_wait > 0:
-            await Timer(init_wait, 'ns')
+            await Timer(init_wait, 'ns', round_mode='round')
         await FallingEdge(sck)
         #log(f"[spi_write_msb] cmd bit {i} = {sigstr(sio.value)}h (?= {(cmd>>i)&0x01:04X}h)")
 
 spi_write = spi_write_msb
 
+# minimum CS deselect time between frames (tSHSL): the bridge sees the end of
+# a frame through a synchronizer, so CS must stay high for a few of its clocks
+CS_HIGH_NS = 50
+_cs_high_at = {} # sce handle name -> time of the last frame end (ns)
+
 async def spi_frame_begin(freq, sce, sck, sce_pol, toff=0):
     sck_T = sim_period(freq)
+    t_high = get_sim_time('ns') - _cs_high_at.get(sce._path, -CS_HIGH_NS)
+    if t_high < CS_HIGH_NS:
+        await Timer(CS_HIGH_NS - t_high, 'ns', round_mode='round')
     sce.value = sce_pol
-    await Timer(sck_T + toff, 'ns')
-    sck_task = start_sck(sck, sck_T, units='ns')
+    await Timer(sck_T + toff, 'ns', round_mode='round')
+    sck_clk = start_sck(sck, sck_T, units='ns')
     #await ClockCycles(sck, 1)
-    return sck_task, sck_T
+    return sck_clk, sck_T
 
 async def spi_frame_end(frame, sce, sck, sce_pol):
-    sck_task, sck_T = frame
-    sck_task.kill()
-    await Timer(sck_T/2, 'ns')
+    sck_clk, sck_T = frame
+    sck_clk.stop()
+    await Timer(sck_T/2, 'ns', round_mode='round')
     sce.value = not sce_pol
-    sck.value = 0
+    sck_clk.set(0)
+    _cs_high_at[sce._path] = get_sim_time('ns')
     await Timer(1, 'ns')
 
 async def prog_word(sio_i, sck, sce, addr: int, data: int, freq: float=108, sce_pol=0, log=lambda s: None) -> None:
@@ -0,0 +1,374 @@
+"""Multi-board readout orchestrator (asyncio)
+
+Runs reads, CFG polls and sector erases on many boards, one bridge each, at
+the same time. Every board has one worker task that owns its bridge (a
+bridge serves one frame at a time) and takes jobs from a bounded queue:
+submitting to a board whose queue is full waits, so a slow board holds back
+its producer and not the others. Long operations are split into jobs so
+they interleave on a board: reads into chunk-word FAST_READ frames, erases
+into the erase command and then R_NBUSSTAT polls (a WAIT_READY frame would
+hold CS for the whole erase).
+
+Each board's frames go through a token bucket of SPI bytes per second (rate
+limit, optional) and are counted. Each job attempt runs with a timeout and
+is retried after a backoff on a timeout or a transport OSError. Reads and
+CFG polls are safe to repeat; an erase attempt may have stopped partway
+through its command sequence, so a retry checks R_NBUSSTAT first: with RY
+low the erase is running and is polled, otherwise the chip gets a reset
+(F0) before the sequence is sent again.
+
+    boards = [board(f"b{i}", transport, rate=2e6) for i,transport in enumerate(transports)]
+    async with orchestrator(boards) as o:
+        data = await asyncio.gather(*(o.read(b, 0, 1 << 16) for b in boards))
+    print(o.report())
+
+Transports are the bridge.py ones. SpidevTransport transfers in a worker
+thread; threaded_transport gives a blocking transport (anything with
+xfer_sync) a thread of its own instead, one per board. For tests
+without hardware, paced_transport adds the SPI transfer time, a NOR busy
+time after programs and erases (and optional stalls) to a ModelTransport
+over nor_flash_behavioral_x16; `make readout-bench` runs a self-checking
+readout of such boards:
+
+    python -m test_helpers.readout --boards 8 --words 65536 --stall 0.01 --busy 0.05
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+from . import bridge
+from .bridge import Bridge, Frame, Transport
+
+def frame_bytes(frames: Sequence[Frame]) -> int:
+    """SPI bytes clocked for frames"""
+    return sum(len(f.tx) + f.rx_len for f in frames)
+
+class rate_limit:
+    """Token bucket: rate per second, up to burst at once. time and sleep are
+    the event loop's unless given (a test clock)."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None, time: Optional[Callable[[], float]] = None,
+                 sleep: Optional[Callable[[float], Awaitable]] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate / 10
+        self.tokens = self.burst
+        self.t = None
+        self.time = time
+        self.sleep = sleep or asyncio.sleep
+
+    async def take(self, n: float) -> None:
+        now = self.time() if self.time else asyncio.get_running_loop().time()
+        if self.t is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.t) * self.rate)
+        self.t = now
+        self.tokens -= n
+        # a take larger than the burst goes through once the bucket is full
+        if self.tokens < 0:
+            wait = -self.tokens / self.rate
+            self.tokens, self.t = 0, now + wait
+            await self.sleep(wait)
+
+@dataclass
+class board_stats:
+    jobs: int = 0
+    frames: int = 0
+    bytes: int = 0
+    words: int = 0     # NOR words read
+    retries: int = 0
+    timeouts: int = 0
+    errors: int = 0    # transport errors
+    failed: int = 0    # jobs out of retries
+    polls: int = 0     # cfg_poll reads
+    busy_s: float = 0  # time in job attempts
+
+class _metered(Transport):
+    """Board transport with the rate limit applied and the traffic counted"""
+
+    def __init__(self, inner: Transport, stats: board_stats, limit: Optional[rate_limit]):
+        self.inner, self.stats, self.limit = inner, stats, limit
+
+    async def xfer(self, frames: Sequence[Frame]) -> List[bytes]:
+        n = frame_bytes(frames)
+        if self.limit:
+            await self.limit.take(n)
+        rx = await self.inner.xfer(frames)
+        self.stats.frames += len(frames)
+        self.stats.bytes += n
+        return rx
+
+class board:
+    """One board: its bridge transport and readout limits
+
+    rate     SPI bytes per second, None for no limit
+    limit    a rate_limit to use instead of one for rate
+    depth    jobs queued before submit() waits
+    timeout  seconds per job attempt
+    retries  attempts after the first one
+    backoff  seconds before the first retry, doubled for each next one
+    """
+
+    def __init__(self, name: str, transport: Transport, rate: Optional[float] = None, depth: int = 8,
+                 timeout: float = 1.0, retries: int = 3, backoff: float = 0.01, limit: Optional[rate_limit] = None):
+        self.name = name
+        self.stats = board_stats()
+        if limit is None and rate:
+            limit = rate_limit(rate)
+        self.bridge = Bridge(_metered(transport, self.stats, limit))
+        self.depth = depth
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.queue: Optional[asyncio.Queue] = None
+
+@dataclass
+class _job:
+    what: str
+    fn: Callable[[Bridge], Awaitable]
+    fut: asyncio.Future = field(default=None)
+
+class orchestrator:
+    """Jobs on boards, run concurrently across boards and in order on each"""
+
+    def __init__(self, boards: Sequence[board]):
+        self.boards = list(boards)
+        self.workers: List[asyncio.Task] = []
+        self.t0 = self.t1 = None
+
+    async def __aenter__(self) -> 'orchestrator':
+        loop = asyncio.get_running_loop()
+        self.t0 = loop.time()
+        for b in self.boards:
+            b.queue = asyncio.Queue(b.depth)
+            self.workers.append(asyncio.create_task(self._worker(b)))
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if not exc[0]:
+            for b in self.boards:
+                await b.queue.join()
+        for w in self.workers:
+            w.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.t1 = asyncio.get_running_loop().time()
+
+    async def _worker(self, b: board) -> None:
+        while True:
+            job = await b.queue.get()
+            try:
+                if not job.fut.done():
+                    job.fut.set_result(await self._attempts(b, job))
+            except Exception as e:
+                if not job.fut.done():
+                    job.fut.set_exception(e)
+            finally:
+                b.queue.task_done()
+
+    async def _attempts(self, b: board, job: _job):
+        loop = asyncio.get_running_loop()
+        b.stats.jobs += 1
+        for attempt in range(b.retries + 1):
+            t = loop.time()
+            try:
+                return await asyncio.wait_for(job.fn(b.bridge), b.timeout)
+            except asyncio.TimeoutError as e:
+                b.stats.timeouts += 1
+                err = e
+            except OSError as e:
+                b.stats.errors += 1
+                err = e
+            finally:
+                b.stats.busy_s += loop.time() - t
+            if attempt < b.retries:
+                b.stats.retries += 1
+                await asyncio.sleep(b.backoff * 2**attempt)
+        b.stats.failed += 1
+        raise RuntimeError(f"{b.name}: {job.what} failed after {b.retries + 1} attempts ({type(err).__name__})") from err
+
+    async def submit(self, b: board, what: str, fn: Callable[[Bridge], Awaitable]) -> asyncio.Future:
+        """Queue fn(bridge) on b, waiting while its queue is full. Returns the result future."""
+        job = _job(what, fn, asyncio.get_running_loop().create_future())
+        await b.queue.put(job)
+        return job.fut
+
+    async def run(self, b: board, what: str, fn: Callable[[Bridge], Awaitable]):
+        return await (await self.submit(b, what, fn))
+
+    async def read(self, b: board, addr: int, count: int, chunk: int = 256) -> List[int]:
+        """count NOR words from addr, in FAST_READ frames of up to chunk words.
+        When a chunk fails the chunks not run yet are dropped (one on the bus
+        finishes) and its error is raised."""
+        futs = []
+        try:
+            for a in range(addr, addr + count, chunk):
+                if any(f.done() and f.exception() for f in futs):
+                    break
+                n = min(chunk, addr + count - a)
+                futs.append(await self.submit(b, f"read {a:X}+{n}", lambda br, a=a, n=n: br.read_fast(a, n)))
+            chunks = await asyncio.gather(*futs)
+        except BaseException:
+            for f in futs:
+                # the worker skips cancelled jobs; retrieve the other errors
+                if not f.cancel() and not f.cancelled():
+                    f.exception()
+            raise
+        words = [w for c in chunks for w in c]
+        b.stats.words += count
+        return words
+
+    async def cfg_read(self, b: board, reg: int) -> int:
+        return await self.run(b, f"cfg read {reg:04X}", lambda br: br.cfg_read(reg))
+
+    async def cfg_poll(self, b: board, reg: int, mask: int, value: int, interval: float = 1e-3,
+                       timeout: float = 10.0) -> int:
+        """Read reg every interval seconds until (reg & mask) == value. Returns
+        the register; raises TimeoutError after timeout seconds."""
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        while True:
+            v = await self.cfg_read(b, reg)
+            b.stats.polls += 1
+            if v & mask == value:
+                return v
+            if loop.time() > end:
+                raise TimeoutError(f"{b.name}: CFG {reg:04X} = {v:04X}, waiting for {value:04X} in {mask:04X}")
+            await asyncio.sleep(interval)
+
+    async def erase_sector(self, b: board, addr: int, interval: float = 1e-3, timeout: float = 10.0) -> None:
+        """Sector erase, then R_NBUSSTAT polls until it is done"""
+        tried = False
+        async def start(br: Bridge):
+            nonlocal tried
+            if tried:
+                # RY low: the last attempt got the whole sequence out. Else the
+                # chip may wait for the rest of it; an erase that is already
+                # over is repeated.
+                if not await br.cfg_read(bridge.R_NBUSSTAT) & bridge.STAT_RY:
+                    return
+                await br.nor_reset(br.chips.chip(addr))
+            tried = True
+            await br.cfg_write(bridge.R_NBUSSTAT, bridge.STAT_DONE)
+            await br.nor_erase_sector(addr)
+        await self.run(b, f"erase {addr:X}", start)
+        await self.cfg_poll(b, bridge.R_NBUSSTAT, bridge.STAT_DONE, bridge.STAT_DONE, interval, timeout)
+
+    def elapsed(self) -> float:
+        """Seconds from the start to the end of the async with, or to now inside it"""
+        if self.t1 is not None:
+            return self.t1 - self.t0
+        return asyncio.get_running_loop().time() - self.t0
+
+    def report(self) -> str:
+        """Per board and aggregate readout throughput"""
+        dt = self.elapsed()
+        cols = ['jobs', 'frames', 'bytes', 'words', 'retries', 'timeouts', 'errors', 'failed', 'polls']
+        lines = [f"{'board':10} " + ' '.join(f"{c:>9}" for c in cols) + f" {'words/s':>12} {'busy':>6}"]
+        tot = board_stats()
+        for b in self.boards:
+            s = b.stats
+            for c in cols + ['busy_s']:
+                setattr(tot, c, getattr(tot, c) + getattr(s, c))
+            lines.append(f"{b.name:10} " + ' '.join(f"{getattr(s, c):9d}" for c in cols) +
+                         f" {s.words / dt:12.0f} {s.busy_s / dt:6.0%}")
+        lines.append(f"{'total':10} " + ' '.join(f"{getattr(tot, c):9d}" for c in cols) +
+                     f" {tot.words / dt:12.0f} {tot.busy_s / dt / max(len(self.boards), 1):6.0%}")
+        lines.append(f"{len(self.boards)} boards, {dt:.3f} s, {tot.words / dt:.0f} words/s, {tot.bytes / dt:.0f} SPI bytes/s")
+        return '\n'.join(lines)
+
+class threaded_transport(Transport):
+    """A blocking transport (SpidevTransport, anything with xfer_sync) run in a thread of its own"""
+
+    def __init__(self, inner: Transport):
+        self.inner = inner
+        self.pool = ThreadPoolExecutor(1)
+
+    async def xfer(self, frames: Sequence[Frame]) -> List[bytes]:
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self.inner.xfer_sync, frames)
+
+class paced_transport(Transport):
+    """Stand-in timing for a transport that has none (ModelTransport): each
+    transfer takes its quad SPI clock time at freq MHz plus gap_s per frame,
+    and with probability stall never completes (seeded). A NOR program or
+    erase keeps R_NBUSSTAT.RY low and DONE clear for busy_s after its transfer."""
+
+    def __init__(self, inner: bridge.ModelTransport, freq: float = 20, gap_s: float = 2e-6, stall: float = 0,
+                 seed: int = 0, busy_s: float = 0):
+        self.inner = inner
+        self.freq = freq
+        self.gap_s = gap_s
+        self.stall = stall
+        self.rng = random.Random(seed)
+        self.busy_s = busy_s
+        self.busy_end = None
+
+    async def xfer(self, frames: Sequence[Frame]) -> List[bytes]:
+        if self.stall and self.rng.random() < self.stall:
+            await asyncio.Event().wait()
+        await asyncio.sleep(2 * frame_bytes(frames) / (self.freq * 1e6) + self.gap_s * len(frames))
+        if not self.busy_s:
+            return await self.inner.xfer(frames)
+        loop = asyncio.get_running_loop()
+        regs = self.inner.regs
+        if self.busy_end is not None and loop.time() >= self.busy_end:
+            regs[bridge.R_NBUSSTAT] |= bridge.STAT_RY | bridge.STAT_DONE
+            self.busy_end = None
+        done = regs[bridge.R_NBUSSTAT] & bridge.STAT_DONE
+        rx = await self.inner.xfer(frames)
+        if not done and regs[bridge.R_NBUSSTAT] & bridge.STAT_DONE:
+            # the model is done at once: a NOR write started a program or erase
+            regs[bridge.R_NBUSSTAT] &= ~(bridge.STAT_RY | bridge.STAT_DONE)
+            self.busy_end = loop.time() + self.busy_s
+        return rx
+
+def model_board(name: str, words: int = 1 << 20, freq: float = 20, stall: float = 0, seed: int = 0,
+                busy_s: float = 0, **kw) -> board:
+    """Board with an in-process bridge and flash (bridge.ModelTransport); the flash is board.flash"""
+    from .nor import nor_flash_behavioral_x16
+    flash = nor_flash_behavioral_x16(words, min(words, 1 << 16))
+    b = board(name, paced_transport(bridge.ModelTransport(flash), freq, stall=stall, seed=seed, busy_s=busy_s), **kw)
+    b.flash = flash
+    return b
+
+async def _bench(args) -> int:
+    boards = [model_board(f"b{i}", freq=args.freq, stall=args.stall, seed=i, busy_s=args.busy, rate=args.rate,
+                          timeout=args.timeout) for i in range(args.boards)]
+    sector = 1 << 16
+    for i,b in enumerate(boards):
+        b.flash.mem.fill_pattern(0, args.words, [(i << 12) + k for k in range(256)])
+        b.flash.mem.program(sector + 1, 0)
+    bad = []
+
+    async def readout(i: int, b: board):
+        await o.erase_sector(b, sector)
+        if (await o.read(b, sector, 4)) != [0xFFFF] * 4:
+            bad.append(f"{b.name}: sector {sector:X} not erased")
+        words = await o.read(b, 0, args.words)
+        if words != b.flash.mem.read_range(0, args.words).tolist():
+            bad.append(f"{b.name}: read data differs from the flash")
+
+    async with orchestrator(boards) as o:
+        await asyncio.gather(*(readout(i, b) for i,b in enumerate(boards)))
+    print(o.report())
+    for s in bad:
+        print(s)
+    return 1 if bad else 0
+
+def main():
+    ap = argparse.ArgumentParser(description="Concurrent readout of in-process bridge stand-ins, with throughput report")
+    ap.add_argument('--boards', type=int, default=8)
+    ap.add_argument('--words', type=int, default=1 << 16, help="words read from each board")
+    ap.add_argument('--freq', type=float, default=20, help="SPI clock of the stand-ins, MHz")
+    ap.add_argument('--rate', type=float, default=None, help="rate limit per board, SPI bytes/s")
+    ap.add_argument('--stall', type=float, default=0, help="probability of a transfer that never completes")
+    ap.add_argument('--timeout', type=float, default=0.1, help="seconds per job attempt")
+    ap.add_argument('--busy', type=float, default=0, help="NOR program and erase time of the stand-ins, s")
+    args = ap.parse_args()
+    sys.exit(asyncio.run(_bench(args)))
+
+if __name__ == '__main__':
+    main()
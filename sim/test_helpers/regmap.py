@@ -0,0 +1,160 @@
+"""CFG register map from busmap.vh, with a shadow copy of each register
+
+Registers are the `R_<REG> defines, fields their `R_<REG>_<FIELD>_MASK and
+_SHIFT pairs, field values other `R_<REG>_<FIELD>_<VALUE> defines (e.g.
+R_NCHKCTRL_MODE_CRC) and reset values `R_<REG>_RST_VAL. Names drop the R_
+prefix: regs['NBUSWAIT0'].fields['WRITE_WAIT'].
+
+cfg_regs keeps the last value written to or read from each register over a
+Bridge. Registers with a reset value in busmap.vh are plain configuration
+registers: their shadow starts at the reset value, writes of the value they
+already hold are skipped and field updates are read-modify-writes of the
+shadow, without a read frame. The others (status, results, registers with
+write side effects) always go to the bridge.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from . import vh
+
+_reg_re   = re.compile(r'R_([A-Z0-9]+)')
+_field_re = re.compile(r'R_([A-Z0-9]+)_(\w+)_MASK')
+
+@dataclass
+class reg_field:
+    name: str
+    mask: int
+    shift: int
+    values: Dict[str, int] = field(default_factory=dict) # named field values
+
+    def get(self, reg_value: int) -> int:
+        return (reg_value & self.mask) >> self.shift
+
+    def put(self, reg_value: int, value) -> int:
+        """reg_value with this field set to value (an int or a name in values)"""
+        value = self.values[value] if isinstance(value, str) else value
+        if (value << self.shift) & ~self.mask:
+            raise ValueError(f"{self.name}: {value:#x} does not fit {self.mask:#06x}")
+        return (reg_value & ~self.mask) | (value << self.shift)
+
+@dataclass
+class register:
+    name: str
+    addr: int
+    reset: Optional[int] = None # None: not in busmap.vh, not shadowed
+    fields: Dict[str, reg_field] = field(default_factory=dict)
+
+    def decode(self, value: int) -> Dict[str, int]:
+        return {f.name: f.get(value) for f in self.fields.values()}
+
+    def encode(self, value: Optional[int] = None, **fields) -> int:
+        """value (default the reset value) with fields replaced"""
+        value = (self.reset or 0) if value is None else value
+        for k,v in fields.items():
+            value = self.fields[k].put(value, v)
+        return value
+
+def parse(defs: Dict[str, object]) -> Dict[str, register]:
+    """Registers in parsed busmap.vh defines, by name"""
+    regs = {}
+    for k,v in defs.items():
+        m = _reg_re.fullmatch(k)
+        if m and isinstance(v, int):
+            rst = defs.get(f"{k}_RST_VAL")
+            regs[m.group(1)] = register(m.group(1), v, rst if isinstance(rst, int) else None)
+    for k,v in defs.items():
+        m = _field_re.fullmatch(k)
+        if m and m.group(1) in regs and isinstance(v, int):
+            shift = defs.get(f"R_{m.group(1)}_{m.group(2)}_SHIFT")
+            shift = shift if isinstance(shift, int) else (v & -v).bit_length() - 1
+            regs[m.group(1)].fields[m.group(2)] = reg_field(m.group(2), v, shift)
+    for k,v in defs.items():
+        for r in regs.values():
+            for f in r.fields.values():
+                p = f"R_{r.name}_{f.name}_"
+                if k.startswith(p) and k[len(p):] not in ('MASK', 'SHIFT') and isinstance(v, int):
+                    f.values[k[len(p):]] = v
+    return regs
+
+regs = parse(vh.load('busmap.vh'))
+
+class cfg_regs:
+    """Shadowed CFG register access over a Bridge (see bridge.py)
+
+    Writes can be queued into a Batch instead of sent at once; the shadow
+    takes them when the batch has run. Every CFG write the Bridge sends
+    (cfg_write, write_through to the CFG space) is shadowed the same way.
+    Writes that bypass the Bridge, such as the pin level helpers, have to be
+    reported with wrote(). Call reset() after resetting the bridge and
+    invalidate() if the registers may have been changed otherwise.
+    """
+
+    def __init__(self, bridge, regmap: Dict[str, register] = None):
+        self.bridge = bridge
+        self.regs = regmap or regs
+        self.by_addr = {r.addr: r.name for r in self.regs.values()}
+        self.shadow: Dict[str, int] = {}
+        self.writes = 0  # frames sent or queued
+        self.skipped = 0 # writes not sent: the register already held the value
+        self.reset()
+
+    def reset(self) -> None:
+        """Shadow back to the reset values"""
+        self.shadow = {n: r.reset for n,r in self.regs.items() if r.reset is not None}
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Forget shadowed values (all, or one register); the next get() reads"""
+        if name is None:
+            self.shadow = {}
+        else:
+            self.shadow.pop(name, None)
+
+    def wrote(self, addr: int, value: int) -> None:
+        """Shadow a write of value to the register at CFG address addr"""
+        name = self.by_addr.get(addr)
+        if name is not None and self._cached(name):
+            self.shadow[name] = value
+
+    def _cached(self, name: str) -> bool:
+        return self.regs[name].reset is not None
+
+    def _value(self, name: str, batch=None) -> Optional[int]:
+        """Shadowed value, as it will be after the writes queued in batch"""
+        if batch is not None and self.regs[name].addr in batch.cfg:
+            return batch.cfg[self.regs[name].addr]
+        return self.shadow.get(name)
+
+    async def read(self, name: str) -> int:
+        """Register value from the bridge"""
+        value = await self.bridge.cfg_read(self.regs[name].addr)
+        if self._cached(name):
+            self.shadow[name] = value
+        return value
+
+    async def get(self, name: str, field_name: Optional[str] = None) -> int:
+        """Register (or field) value, from the shadow if there is one"""
+        value = self.shadow.get(name)
+        if value is None:
+            value = await self.read(name)
+        return self.regs[name].fields[field_name].get(value) if field_name else value
+
+    async def write(self, name: str, value: int, batch=None) -> bool:
+        """Write value unless the shadow holds it already. Returns True if a write was sent or queued."""
+        if self._cached(name) and self._value(name, batch) == value:
+            self.skipped += 1
+            return False
+        if batch is not None:
+            batch.cfg_write(self.regs[name].addr, value)
+        else:
+            await self.bridge.cfg_write(self.regs[name].addr, value)
+        self.writes += 1
+        return True
+
+    async def set(self, name: str, batch=None, **fields) -> bool:
+        """Read-modify-write of fields (FIELD=value), on the shadow when there is one"""
+        value = self._value(name, batch)
+        if value is None:
+            value = await self.get(name)
+        return await self.write(name, self.regs[name].encode(value, **fields), batch)
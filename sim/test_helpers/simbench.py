@@ -0,0 +1,80 @@
+"""Simulator wall-clock comparison from cocotb results files
+
+`make bench-sim` runs the test modules once per simulator, each into its own
+results file <dir>/<sim>-<test>.xml, and reports the per-test wall-clock
+(REAL TIME in the cocotb summary) side by side with the speedup of each
+simulator over the first one:
+
+    python -m test_helpers.simbench sim_build/bench [--sims icarus verilator]
+
+Build time is not included: the builds are cached (see the Makefile) and
+their cost is paid once per source change, not per run. Tests that fail or
+are skipped under a simulator are marked and left out of the totals.
+"""
+
+import argparse
+import os
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+@dataclass
+class test_time:
+    wall_s: float
+    sim_ns: float
+    status: str # PASS, FAIL or SKIP
+
+def load(path: str) -> Dict[Tuple[str, str], test_time]:
+    """Test times by (module, test) from a cocotb results.xml"""
+    res = {}
+    for tc in ET.parse(path).getroot().iter('testcase'):
+        status = 'FAIL' if tc.find('failure') is not None or tc.find('error') is not None else \
+                 'SKIP' if tc.find('skipped') is not None else 'PASS'
+        res[(tc.get('classname'), tc.get('name'))] = test_time(float(tc.get('time', 0)),
+                                                               float(tc.get('sim_time_ns', 0)), status)
+    return res
+
+def load_dir(d: str, sims: List[str]) -> Dict[str, Dict[Tuple[str, str], test_time]]:
+    """Results of every <sim>-<test>.xml in d, by simulator"""
+    res = {s: {} for s in sims}
+    for f in sorted(os.listdir(d)):
+        s, _, rest = f.partition('-')
+        if s in res and rest.endswith('.xml'):
+            res[s].update(load(os.path.join(d, f)))
+    return res
+
+def report(res: Dict[str, Dict[Tuple[str, str], test_time]]) -> str:
+    sims = list(res)
+    tests = []
+    for r in res.values():
+        tests += [k for k in r if k not in tests]
+    w = max([len(f"{m}.{t}") for m,t in tests] + [4])
+    lines = [f"{'test':{w}} " + ' '.join(f"{s:>12}" for s in sims) +
+             ''.join(f" {s + ' speedup':>18}" for s in sims[1:])]
+    tot = {s: 0.0 for s in sims}
+    for k in tests:
+        t = [res[s].get(k) for s in sims]
+        ok = all(x is not None and x.status == 'PASS' for x in t)
+        cols = [f"{'-':>12}" if x is None else f"{x.wall_s:11.2f}s" if x.status == 'PASS' else f"{x.status:>12}" for x in t]
+        sp = [f"{t[0].wall_s / x.wall_s:17.2f}x" if ok and x.wall_s else f"{'-':>18}" for x in t[1:]]
+        if ok:
+            for s,x in zip(sims, t):
+                tot[s] += x.wall_s
+        lines.append(f"{k[0] + '.' + k[1]:{w}} " + ' '.join(cols) + ''.join(' ' + x for x in sp))
+    lines.append(f"{'total':{w}} " + ' '.join(f"{tot[s]:11.2f}s" for s in sims) +
+                 ''.join(f" {tot[sims[0]] / tot[s]:17.2f}x" if tot[s] else f" {'-':>18}" for s in sims[1:]))
+    return '\n'.join(lines)
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare test wall-clock times between simulators")
+    ap.add_argument('dir', help="directory of <sim>-<test>.xml results files")
+    ap.add_argument('--sims', nargs='+', default=['icarus', 'verilator'], help="simulators, the first is the reference")
+    args = ap.parse_args()
+    res = load_dir(args.dir, args.sims)
+    missing = [s for s,r in res.items() if not r]
+    if missing:
+        print(f"no results for {' '.join(missing)}")
+    print(report({s: r for s,r in res.items() if r}))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,414 @@
+"""Readout store: a time series of NOR array readouts on disk
+
+An append-only directory of three files:
+
+    index     header + one index_dtype record per stored sector chunk
+    readouts  header + one readout_dtype record per readout (time, chunks)
+    data      chunk payloads, 8-byte aligned
+
+Each readout is a range of whole sectors of 16-bit words (the
+nor_flash_array 'H' layout), stored per sector as one of
+
+    RAW    the words, little-endian
+    FILL   every word the same (an erased sector): no payload
+    DELTA  the words that differ from the previous readout of the sector:
+           their offsets, then the XOR with the previous words
+
+A sector starts with a RAW or FILL key chunk, and a new key is written after
+key_interval deltas or when a delta would take more than half a RAW chunk,
+so reading one chunk applies at most key_interval patches. Unchanged
+sectors are DELTA chunks without a payload. The readout record is written
+last, so a reader only sees complete readouts, also while a writer appends.
+
+Readers memory map index and data: RAW chunks are returned as read-only
+views of the data file, without a copy. One sector across all readouts is
+decoded in one pass from its first key (sector_series).
+
+    w = store.store_writer('run1', sector_words=65536)
+    w.append(model.mem.view(), base=0)        # one readout
+    s = store.load('run1')
+    n, words = s.sector_series(12)            # sector 12 in every readout
+    dump = s.readout(3)                       # as for analysis.analyze(dump, base=s.base(3))
+
+Command line:
+    python -m test_helpers.store info run1
+    python -m test_helpers.store append run1 dump.bin --base 0x100000
+    python -m test_helpers.store export run1 3 dump3.bin
+    python -m test_helpers.store bench /tmp/bench --readouts 1000
+"""
+
+import argparse
+import os
+import time
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b'QSTORE01'
+HEADER_BYTES = 16
+ALIGN = 8
+
+ENC_RAW, ENC_FILL, ENC_DELTA = range(3)
+ENCODINGS = ['raw', 'fill', 'delta']
+
+index_dtype = np.dtype([
+    ('readout', '<u4'),
+    ('sector',  '<u4'),  # NOR address // sector_words
+    ('enc',     'u1'),
+    ('pad',     'u1'),
+    ('value',   '<u2'),  # FILL word
+    ('count',   '<u4'),  # words in the payload: sector_words for RAW, changed words for DELTA
+    ('offset',  '<u8'),  # payload in the data file
+])
+
+readout_dtype = np.dtype([
+    ('t',      '<f8'), # s since the epoch
+    ('first',  '<u8'), # first index record
+    ('chunks', '<u4'), # index records, one per sector in ascending order
+    ('pad',    '<u4'),
+])
+
+def _header(dtype: np.dtype, sector_words: int) -> bytes:
+    return MAGIC + dtype.itemsize.to_bytes(4, 'little') + sector_words.to_bytes(4, 'little')
+
+def _read_header(path: str, dtype: np.dtype) -> int:
+    """sector_words from a store file header"""
+    with open(path, 'rb') as f:
+        hdr = f.read(HEADER_BYTES)
+    if hdr[:len(MAGIC)] != MAGIC or int.from_bytes(hdr[8:12], 'little') != dtype.itemsize:
+        raise ValueError(f"{path}: not a readout store file")
+    return int.from_bytes(hdr[12:16], 'little')
+
+def _records(path: str, dtype: np.dtype, count: Optional[int] = None) -> np.ndarray:
+    n = (os.path.getsize(path) - HEADER_BYTES) // dtype.itemsize
+    n = n if count is None else min(n, count)
+    if n == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_BYTES, shape=(n,))
+
+def _pos_dtype(sector_words: int) -> str:
+    return '<u2' if sector_words <= 1 << 16 else '<u4'
+
+class store_reader:
+    """Memory mapped readout store; refresh() picks up readouts appended since"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sector_words = _read_header(os.path.join(path, 'index'), index_dtype)
+        if _read_header(os.path.join(path, 'readouts'), readout_dtype) != self.sector_words:
+            raise ValueError(f"{path}: index and readouts differ in sector size")
+        self.pos_dtype = np.dtype(_pos_dtype(self.sector_words))
+        self.refresh()
+
+    def refresh(self) -> None:
+        self.readouts = _records(os.path.join(self.path, 'readouts'), readout_dtype)
+        last = self.readouts[-1] if len(self.readouts) else None
+        self.index = _records(os.path.join(self.path, 'index'), index_dtype,
+                              0 if last is None else int(last['first']) + int(last['chunks']))
+        data = os.path.join(self.path, 'data')
+        self.data = np.memmap(data, dtype=np.uint8, mode='r') if os.path.getsize(data) else np.zeros(0, np.uint8)
+        # records by sector, in readout order within a sector, and the key
+        # each one decodes from (as a position in that order)
+        self.order = np.argsort(self.index['sector'], kind='stable')
+        self.by_sector = self.index['sector'][self.order]
+        self.pos = np.empty_like(self.order)
+        self.pos[self.order] = np.arange(len(self.order))
+        is_key = self.index['enc'][self.order] != ENC_DELTA
+        self.key = np.maximum.accumulate(np.where(is_key, np.arange(len(self.order)), 0))
+
+    def __len__(self) -> int:
+        return len(self.readouts)
+
+    @property
+    def times(self) -> np.ndarray:
+        return self.readouts['t']
+
+    def sectors(self, readout: int) -> np.ndarray:
+        """Sectors stored in readout"""
+        r = self.readouts[readout]
+        return self.index['sector'][int(r['first']):int(r['first']) + int(r['chunks'])]
+
+    def base(self, readout: int) -> int:
+        """NOR address of the first word of readout"""
+        return int(self.sectors(readout)[0]) * self.sector_words
+
+    def _find(self, readout: int, sector: int) -> int:
+        r = self.readouts[readout]
+        first = int(r['first'])
+        s = self.sectors(readout)
+        i = int(np.searchsorted(s, sector))
+        if i == len(s) or s[i] != sector:
+            raise KeyError(f"sector {sector} not in readout {readout}")
+        return first + i
+
+    def _payload(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """RAW: (words, None); DELTA: (offsets, XOR words)"""
+        rec = self.index[i]
+        off, n = int(rec['offset']), int(rec['count'])
+        if rec['enc'] == ENC_RAW:
+            return self.data[off:off + 2*n].view('<u2'), None
+        pos_end = off + n * self.pos_dtype.itemsize
+        return self.data[off:pos_end].view(self.pos_dtype), self.data[pos_end:pos_end + 2*n].view('<u2')
+
+    def _apply(self, i: int, cur: Optional[np.ndarray]) -> np.ndarray:
+        """Words of record i given the words of the previous record of its sector"""
+        rec = self.index[i]
+        if rec['enc'] == ENC_RAW:
+            return self._payload(i)[0]
+        if rec['enc'] == ENC_FILL:
+            return np.full(self.sector_words, rec['value'], dtype='<u2')
+        if rec['count']:
+            pos, x = self._payload(i)
+            if not cur.flags.writeable:
+                cur = cur.copy()
+            cur[pos] ^= x
+        return cur
+
+    def sector(self, readout: int, sector: int) -> np.ndarray:
+        """Words of sector in readout (read-only view of the file for RAW chunks)"""
+        p = int(self.pos[self._find(readout, sector)])
+        cur = None
+        for q in range(int(self.key[p]), p + 1):
+            cur = self._apply(int(self.order[q]), cur)
+        return cur
+
+    def sector_series(self, sector: int, readouts: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """sector in each of readouts (default: every readout that has it).
+        Returns the readout numbers and a (readouts, sector_words) array."""
+        lo, hi = np.searchsorted(self.by_sector, [sector, sector + 1])
+        recs = self.order[lo:hi]
+        have = self.index['readout'][recs]
+        if readouts is None:
+            sel = np.arange(len(recs))
+        else:
+            readouts = np.asarray(readouts)
+            sel = np.searchsorted(have, readouts)
+            if np.any(sel >= len(have)) or np.any(have[np.minimum(sel, len(have) - 1)] != readouts):
+                raise KeyError(f"sector {sector} not in every readout requested")
+        out = np.empty((len(sel), self.sector_words), dtype='<u2')
+        if len(sel) == 0:
+            return have[sel], out
+        cur, j = None, 0
+        for k in range(int(self.key[lo + sel[0]]) - lo, int(sel[-1]) + 1):
+            cur = self._apply(int(recs[k]), cur)
+            while j < len(sel) and sel[j] == k:
+                out[j] = cur
+                j += 1
+        return have[sel], out
+
+    def readout(self, readout: int) -> np.ndarray:
+        """All words of readout, from base(readout)"""
+        return np.concatenate([self.sector(readout, int(s)) for s in self.sectors(readout)])
+
+    def data_end(self) -> int:
+        """End of the payloads of the complete readouts in the data file"""
+        rec = self.index[self.index['enc'] != ENC_FILL]
+        if not len(rec):
+            return 0
+        size = np.where(rec['enc'] == ENC_RAW, 2, self.pos_dtype.itemsize + 2) * rec['count'].astype(np.int64)
+        end = int((rec['offset'].astype(np.int64) + size).max())
+        return end + -end % ALIGN
+
+    def stored_bytes(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.path, f)) for f in ['index', 'readouts', 'data'])
+
+    def report(self) -> str:
+        raw = 2 * len(self.index) * self.sector_words
+        stored = self.stored_bytes()
+        enc = np.bincount(self.index['enc'], minlength=len(ENCODINGS))
+        lines = [f"{self.path}: {len(self)} readouts, {len(self.index)} sector chunks of {self.sector_words} words",
+                 ', '.join(f"{n} {e}" for e,n in zip(ENCODINGS, enc)),
+                 f"{raw} bytes of readouts in {stored} bytes ({raw / stored if stored else 0:.1f}x)"]
+        if len(self):
+            lines.append(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.times[0]))} to "
+                         f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.times[-1]))}")
+        return '\n'.join(lines)
+
+def load(path: str) -> store_reader:
+    return store_reader(path)
+
+class store_writer:
+    """Appends readouts to a new or existing store
+
+    delta         store changed words against the previous readout of a sector
+    key_interval  deltas before a sector gets a new key chunk
+
+    The last words of each sector are kept for the next delta, up to one
+    copy of the whole array; they are decoded from the store after reopening.
+    """
+
+    def __init__(self, path: str, sector_words: int = 65536, delta: bool = True, key_interval: int = 32):
+        self.path = path
+        self.delta = delta
+        self.key_interval = key_interval
+        index = os.path.join(path, 'index')
+        if os.path.exists(index):
+            self.reader = load(path)
+            if self.reader.sector_words != sector_words:
+                raise ValueError(f"{path}: sector size is {self.reader.sector_words} words, not {sector_words}")
+            # drop an incomplete readout of an interrupted append
+            for f,n in [('index', HEADER_BYTES + len(self.reader.index) * index_dtype.itemsize),
+                        ('readouts', HEADER_BYTES + len(self.reader) * readout_dtype.itemsize),
+                        ('data', self.reader.data_end())]:
+                os.truncate(os.path.join(path, f), n)
+            self.reader.refresh()
+            self.chunks = len(self.reader.index)
+            self.count = len(self.reader)
+        else:
+            os.makedirs(path, exist_ok=True)
+            for f,dtype in [('index', index_dtype), ('readouts', readout_dtype)]:
+                with open(os.path.join(path, f), 'wb') as fh:
+                    fh.write(_header(dtype, sector_words))
+            open(os.path.join(path, 'data'), 'wb').close()
+            self.reader = None
+            self.chunks = 0
+            self.count = 0
+        self.sector_words = sector_words
+        self.pos_dtype = np.dtype(_pos_dtype(sector_words))
+        self.f_index = open(index, 'ab')
+        self.f_readouts = open(os.path.join(path, 'readouts'), 'ab')
+        self.f_data = open(os.path.join(path, 'data'), 'ab')
+        self.offset = self.f_data.seek(0, os.SEEK_END)
+        self.last = {} # sector: (words, deltas since its key)
+
+    def _last(self, sector: int) -> Optional[Tuple[np.ndarray, int]]:
+        if sector not in self.last and self.reader is not None:
+            lo, hi = np.searchsorted(self.reader.by_sector, [sector, sector + 1])
+            if hi > lo:
+                i = int(self.reader.order[hi - 1])
+                r = int(self.reader.index['readout'][i])
+                self.last[sector] = (np.array(self.reader.sector(r, sector)), hi - 1 - int(self.reader.key[hi - 1]))
+        return self.last.get(sector)
+
+    def _write(self, *parts: np.ndarray) -> int:
+        off = self.offset
+        for p in parts:
+            self.f_data.write(p.tobytes())
+            self.offset += p.nbytes
+        pad = -self.offset % ALIGN
+        self.f_data.write(bytes(pad))
+        self.offset += pad
+        return off
+
+    def append(self, words, base: int = 0, t: Optional[float] = None) -> int:
+        """Store words read from NOR address base (whole sectors) as the next
+        readout, taken at t (default now). Returns the readout number."""
+        sw = self.sector_words
+        words = np.asarray(words).astype('<u2', copy=False)
+        if base % sw or len(words) % sw or not len(words):
+            raise ValueError(f"Readouts must be whole sectors of {sw} words (base {base:X}h, {len(words)} words)")
+        recs = np.zeros(len(words) // sw, dtype=index_dtype)
+        recs['readout'] = self.count
+        for k in range(len(recs)):
+            s = base // sw + k
+            w = words[k*sw:(k+1)*sw]
+            rec = recs[k:k+1]
+            rec['sector'] = s
+            last = self._last(s) if self.delta else None
+            deltas = 0
+            if last is not None and last[1] < self.key_interval:
+                x = w ^ last[0]
+                pos = np.flatnonzero(x)
+                if len(pos) * (self.pos_dtype.itemsize + 2) <= sw:
+                    rec['enc'], rec['count'], deltas = ENC_DELTA, len(pos), last[1] + 1
+                    if len(pos):
+                        rec['offset'] = self._write(pos.astype(self.pos_dtype), x[pos])
+            if deltas == 0:
+                if np.all(w == w[0]):
+                    rec['enc'], rec['value'] = ENC_FILL, w[0]
+                else:
+                    rec['enc'], rec['count'], rec['offset'] = ENC_RAW, sw, self._write(w)
+            if self.delta:
+                self.last[s] = (w.copy(), deltas)
+        self.f_data.flush()
+        self.f_index.write(recs.tobytes())
+        self.f_index.flush()
+        r = np.zeros(1, dtype=readout_dtype)
+        r['t'] = time.time() if t is None else t
+        r['first'], r['chunks'] = self.chunks, len(recs)
+        self.f_readouts.write(r.tobytes())
+        self.f_readouts.flush()
+        self.chunks += len(recs)
+        self.count += 1
+        return self.count - 1
+
+    def close(self) -> None:
+        for f in [self.f_data, self.f_index, self.f_readouts]:
+            f.close()
+
+    def __enter__(self) -> 'store_writer':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def bench(path: str, readouts: int = 1000, sectors: int = 16, sector_words: int = 65536, flips: int = 64,
+          seed: int = 0) -> str:
+    """Store readouts of a nor_flash_behavioral_x16 array that collects flips
+    (bits cleared at random words) between readouts, then time the reads"""
+    from .nor import nor_flash_behavioral_x16
+    rng = np.random.default_rng(seed)
+    words = sectors * sector_words
+    flash = nor_flash_behavioral_x16(words, sector_words)
+    flash.mem.fill_pattern(0, words // 2, [0x0000, 0xFFFF, 0x5555, 0xAAAA])
+    t0 = time.perf_counter()
+    with store_writer(path, sector_words) as w:
+        for r in range(readouts):
+            a = rng.integers(0, words, flips)
+            flash.mem.view()[a] &= ~(np.uint16(1) << rng.integers(0, 16, flips).astype(np.uint16))
+            w.append(flash.mem.view(), t=float(r))
+    t1 = time.perf_counter()
+    s = load(path)
+    n, series = s.sector_series(sectors // 2)
+    t2 = time.perf_counter()
+    picks = rng.integers(0, readouts, 100)
+    for r in picks:
+        s.sector(int(r), int(r) % sectors)
+    t3 = time.perf_counter()
+    assert np.array_equal(series[-1], flash.mem.view()[(sectors // 2) * sector_words:(sectors // 2 + 1) * sector_words])
+    assert np.array_equal(s.readout(readouts - 1), flash.mem.view())
+    mb = 2 * words * readouts / 1e6
+    return '\n'.join([s.report(),
+                      f"append: {t1 - t0:.2f} s, {mb / (t1 - t0):.0f} MB/s of readouts",
+                      f"one sector across {len(n)} readouts: {1e3 * (t2 - t1):.1f} ms",
+                      f"random sector reads: {1e6 * (t3 - t2) / len(picks):.0f} us each"])
+
+def main():
+    ap = argparse.ArgumentParser(description="Readout store of NOR array time series")
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('info', help="readouts, encodings and size")
+    p.add_argument('store')
+    p = sub.add_parser('append', help="append a dump file (little-endian 16-bit words) as a readout")
+    p.add_argument('store')
+    p.add_argument('dump')
+    p.add_argument('--base', type=lambda s: int(s, 0), default=0, help="NOR address of the first word")
+    p.add_argument('--sector-words', type=lambda s: int(s, 0), default=65536)
+    p.add_argument('--t', type=float, default=None, help="readout time, s since the epoch (default: file time)")
+    p = sub.add_parser('export', help="write one readout as a dump file")
+    p.add_argument('store')
+    p.add_argument('readout', type=int)
+    p.add_argument('dump')
+    p = sub.add_parser('bench', help="store and read back a simulated exposure")
+    p.add_argument('store')
+    p.add_argument('--readouts', type=int, default=1000)
+    p.add_argument('--sectors', type=int, default=16)
+    p.add_argument('--sector-words', type=lambda s: int(s, 0), default=65536)
+    p.add_argument('--flips', type=int, default=64, help="bits flipped between readouts")
+    args = ap.parse_args()
+
+    if args.cmd == 'info':
+        print(load(args.store).report())
+    elif args.cmd == 'append':
+        from .analysis import load_dump
+        with store_writer(args.store, args.sector_words) as w:
+            r = w.append(load_dump(args.dump), args.base, os.path.getmtime(args.dump) if args.t is None else args.t)
+        print(f"readout {r}")
+    elif args.cmd == 'export':
+        s = load(args.store)
+        s.readout(args.readout).astype('<u2', copy=False).tofile(args.dump)
+        print(f"{args.dump}: readout {args.readout} from {s.base(args.readout):07X}h")
+    elif args.cmd == 'bench':
+        print(bench(args.store, args.readouts, args.sectors, args.sector_words, args.flips))
+
+if __name__ == '__main__':
+    main()
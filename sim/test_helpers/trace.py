@@ -0,0 +1,269 @@
+"""Binary transaction trace
+
+Passive monitors for the QSPI frames, both Wishbone buses and the NOR bus of
+tb_top append fixed-width records (record_dtype) to a trace file. Records are
+buffered in a numpy array and written in blocks, and the file is read back
+as a memory map, so a soak run can be queried without parsing text logs.
+
+Monitors wake up on bus activity only (strobe, CS and NOR control edges),
+not on every clock, so tracing can stay on for the whole regression. It is
+opt-in: setup() traces each test when TRACE names a directory
+(`make TRACE=/tmp/trace`).
+
+Query from the command line:
+    python -m test_helpers.trace /tmp/trace/test_read.trace --kind nor_rd --by addr/256
+"""
+
+import argparse
+import os
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+
+MAGIC = b'QTRACE01'
+HEADER_BYTES = 16
+
+record_dtype = np.dtype([
+    ('t',       '<f8'), # ns, start of the transaction
+    ('kind',    'u1'),
+    ('cmd',     'u1'),  # QSPI command
+    ('flags',   '<u2'),
+    ('addr',    '<u4'),
+    ('data',    '<u4'),
+    ('latency', '<f4'), # ns: CS low time, Wishbone request to ack, NOR OE/WE low time
+])
+
+KIND_QSPI, KIND_MEMWB, KIND_CFGWB, KIND_NOR_RD, KIND_NOR_WR = range(5)
+KINDS = {'qspi': KIND_QSPI, 'memwb': KIND_MEMWB, 'cfgwb': KIND_CFGWB, 'nor_rd': KIND_NOR_RD, 'nor_wr': KIND_NOR_WR}
+
+FLAG_WE  = 0x0001 # Wishbone write
+FLAG_ERR = 0x0002 # Wishbone err instead of ack
+FLAG_X   = 0x0004 # address or data not resolvable
+
+class trace_writer:
+    """Appends records to a trace file in blocks of buffer_records"""
+
+    def __init__(self, path: str, buffer_records: int = 1 << 14):
+        self.path = path
+        self.f = open(path, 'wb')
+        self.f.write(MAGIC + record_dtype.itemsize.to_bytes(4, 'little') + bytes(HEADER_BYTES - len(MAGIC) - 4))
+        self.buf = np.zeros(buffer_records, dtype=record_dtype)
+        self.n = 0
+        self.count = 0
+
+    def append(self, t: float, kind: int, addr: int = 0, data: int = 0, latency: float = 0, cmd: int = 0, flags: int = 0) -> None:
+        self.buf[self.n] = (t, kind, cmd, flags, addr, data, latency)
+        self.n += 1
+        if self.n == len(self.buf):
+            self.flush()
+
+    def flush(self) -> None:
+        if self.f is None:
+            self.n = 0 # closed, drop late records
+            return
+        self.f.write(self.buf[:self.n].tobytes())
+        self.f.flush()
+        self.count += self.n
+        self.n = 0
+
+    def close(self) -> None:
+        if self.f is not None:
+            self.flush()
+            self.f.close()
+            self.f = None
+
+def load(path: str) -> np.ndarray:
+    """Memory map the records of a trace file"""
+    with open(path, 'rb') as f:
+        hdr = f.read(HEADER_BYTES)
+    if hdr[:len(MAGIC)] != MAGIC or int.from_bytes(hdr[8:12], 'little') != record_dtype.itemsize:
+        raise ValueError(f"{path}: not a trace file")
+    if os.path.getsize(path) == HEADER_BYTES:
+        return np.zeros(0, dtype=record_dtype)
+    return np.memmap(path, dtype=record_dtype, mode='r', offset=HEADER_BYTES)
+
+def select(rec: np.ndarray, kind=None, cmd: Optional[int] = None, addr_lo: Optional[int] = None,
+           addr_hi: Optional[int] = None, t0: Optional[float] = None, t1: Optional[float] = None) -> np.ndarray:
+    """Records matching all given filters; addr_hi and t1 are exclusive"""
+    m = np.ones(len(rec), dtype=bool)
+    if kind is not None:
+        m &= rec['kind'] == (KINDS[kind] if isinstance(kind, str) else kind)
+    if cmd is not None:
+        m &= rec['cmd'] == cmd
+    if addr_lo is not None:
+        m &= rec['addr'] >= addr_lo
+    if addr_hi is not None:
+        m &= rec['addr'] < addr_hi
+    if t0 is not None:
+        m &= rec['t'] >= t0
+    if t1 is not None:
+        m &= rec['t'] < t1
+    return rec[m]
+
+def latency_stats(rec: np.ndarray, by: str = 'kind', bin: int = 1) -> np.ndarray:
+    """Latency count, mean, min, median, p99 and max grouped by kind, cmd or addr // bin"""
+    key = rec['addr'].astype(np.int64) // bin * bin if by == 'addr' else rec[by].astype(np.int64)
+    out = np.zeros(0, dtype=[('key', np.int64), ('count', np.int64), ('mean', 'f8'), ('min', 'f8'),
+                             ('p50', 'f8'), ('p99', 'f8'), ('max', 'f8')])
+    if len(rec) == 0:
+        return out
+    lat = np.asarray(rec['latency'], dtype=np.float64)
+    order = np.lexsort((lat, key))
+    key, lat = key[order], lat[order]
+    starts = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1])))
+    counts = np.diff(np.append(starts, len(key)))
+    out = np.zeros(len(starts), dtype=out.dtype)
+    out['key'] = key[starts]
+    out['count'] = counts
+    out['mean'] = np.add.reduceat(lat, starts) / counts
+    out['min'] = lat[starts]
+    out['max'] = lat[starts + counts - 1]
+    # latencies are sorted within each group
+    out['p50'] = lat[starts + (counts - 1) // 2]
+    out['p99'] = lat[starts + np.ceil(0.99 * (counts - 1)).astype(np.int64)]
+    return out
+
+def _int(v) -> int:
+    return v.integer if v.is_resolvable else -1
+
+async def monitor_qspi(w: trace_writer, sce, qspi_ctrl, sce_pol=0):
+    """One record per CS assertion: command, first address, last write data"""
+    from cocotb.triggers import Edge, First, RisingEdge
+    from cocotb.utils import get_sim_time
+
+    while True:
+        while int(sce.value) != sce_pol:
+            await Edge(sce)
+        t0 = get_sim_time('ns')
+        cmd = addr = -1
+        while True:
+            end = Edge(sce)
+            trig = await First(end, RisingEdge(qspi_ctrl.spistbcmd), RisingEdge(qspi_ctrl.spistbadr))
+            if trig is end:
+                break
+            if cmd < 0 and qspi_ctrl.spistbcmd.value:
+                cmd = _int(qspi_ctrl.spicmd.value)
+            elif addr < 0 and qspi_ctrl.spistbadr.value:
+                addr = _int(qspi_ctrl.spiaddr.value)
+        data = _int(qspi_ctrl.spidata_if.value)
+        flags = FLAG_X if min(cmd, addr, data) < 0 else 0
+        w.append(t0, KIND_QSPI, max(addr, 0), max(data, 0), get_sim_time('ns') - t0, cmd=max(cmd, 0), flags=flags)
+
+async def monitor_wb(w: trace_writer, kind: int, clk, cyc, stb, we, adr, dat_i, dat_o, ack, err, stall):
+    """One record per Wishbone request, latency from accepted strobe to ack/err
+
+    The bus is sampled at the falling clock edge, where it holds what the next
+    rising edge registers whatever order the simulator reports the rising edge
+    and the register updates in."""
+    from cocotb.triggers import FallingEdge, First, RisingEdge
+    from cocotb.utils import get_sim_time
+
+    pending = deque()
+    while True:
+        if not pending and not stb.value:
+            await RisingEdge(stb)
+        elif pending and not stb.value and not ack.value and not err.value:
+            await First(RisingEdge(ack), RisingEdge(err), RisingEdge(stb))
+        await FallingEdge(clk)
+        now = get_sim_time('ns')
+        if not cyc.value:
+            pending.clear()
+            continue
+        if stb.value and not stall.value:
+            pending.append((now, int(we.value), _int(adr.value), _int(dat_i.value)))
+        if pending and (ack.value or err.value):
+            t0, wr, a, d = pending.popleft()
+            if not wr:
+                d = _int(dat_o.value)
+            flags = (FLAG_WE if wr else 0) | (FLAG_ERR if err.value else 0) | (FLAG_X if min(a, d) < 0 else 0)
+            w.append(t0, kind, max(a, 0), max(d, 0), now - t0, flags=flags)
+
+async def monitor_nor(w: trace_writer, bus: Dict):
+    """One record per NOR read (each address while OE is low) or WE pulse"""
+    from cocotb.triggers import Edge, FallingEdge, First, RisingEdge
+    from cocotb.utils import get_sim_time
+
+    while True:
+        await First(FallingEdge(bus['oe']), FallingEdge(bus['we']))
+        t0 = get_sim_time('ns')
+        if not bus['oe'].value:
+            # page mode: the address changes while OE stays low
+            a = _int(bus['addr'].value)
+            while True:
+                oe_rise = RisingEdge(bus['oe'])
+                trig = await First(oe_rise, Edge(bus['addr']))
+                now = get_sim_time('ns')
+                d = _int(bus['data_i'].value)
+                w.append(t0, KIND_NOR_RD, max(a, 0), max(d, 0), now - t0, flags=FLAG_X if min(a, d) < 0 else 0)
+                if trig is oe_rise:
+                    break
+                t0, a = now, _int(bus['addr'].value)
+        else:
+            await RisingEdge(bus['we'])
+            a, d = _int(bus['addr'].value), _int(bus['data_o'].value)
+            w.append(t0, KIND_NOR_WR, max(a, 0), max(d, 0), get_sim_time('ns') - t0, flags=FLAG_X if min(a, d) < 0 else 0)
+
+def start(dut, path: str) -> trace_writer:
+    """Start all monitors on tb_top; the trace is closed when they are killed"""
+    import cocotb
+
+    w = trace_writer(path)
+    top = dut.top
+
+    async def run(coro):
+        try:
+            await coro
+        finally:
+            w.close()
+
+    nor_bus = {'oe': dut.nor_oe_o, 'we': dut.nor_we_o, 'addr': dut.nor_addr_o, 'data_i': dut.nor_data_i, 'data_o': dut.nor_data_o}
+    cocotb.start_soon(run(monitor_qspi(w, dut.pad_spi_sce_i, top.qspi_ctrl)))
+    cocotb.start_soon(run(monitor_wb(w, KIND_MEMWB, dut.clk_i, top.memwb_cyc, top.memwb_stb, top.memwb_we, top.memwb_adr,
+                                     top.memwb_dat_i, top.memwb_dat_o, top.memwb_ack, top.memwb_err, top.memwb_stall)))
+    cocotb.start_soon(run(monitor_wb(w, KIND_CFGWB, dut.clk_i, top.cfgwb_cyc, top.cfgwb_stb, top.cfgwb_we, top.cfgwb_adr,
+                                     top.cfgwb_dat_i, top.cfgwb_dat_o, top.cfgwb_ack, top.cfgwb_err, top.cfgwb_stall)))
+    cocotb.start_soon(run(monitor_nor(w, nor_bus)))
+    return w
+
+def start_from_env(dut) -> Optional[trace_writer]:
+    """Trace the running test to $TRACE/<test>.trace if TRACE is set"""
+    import cocotb
+
+    outdir = os.environ.get('TRACE')
+    if not outdir:
+        return None
+    os.makedirs(outdir, exist_ok=True)
+    test = getattr(cocotb.regression_manager, '_test', None)
+    return start(dut, os.path.join(outdir, f"{getattr(test, '__qualname__', 'trace')}.trace"))
+
+def main():
+    ap = argparse.ArgumentParser(description="Filter a transaction trace and aggregate latencies")
+    num = lambda s: int(s, 0)
+    ap.add_argument('trace')
+    ap.add_argument('--kind', choices=list(KINDS))
+    ap.add_argument('--cmd', type=num)
+    ap.add_argument('--addr', help="LO:HI address range, HI exclusive")
+    ap.add_argument('--time', help="T0:T1 in ns")
+    ap.add_argument('--by', default='kind', help="kind, cmd, addr or addr/BIN")
+    ap.add_argument('--list', type=int, default=0, metavar='N', help="print the first N matching records")
+    args = ap.parse_args()
+
+    rng = lambda s, f: [f(x) if x else None for x in s.split(':')] if s else [None, None]
+    lo, hi = rng(args.addr, num)
+    t0, t1 = rng(args.time, float)
+    rec = select(load(args.trace), args.kind, args.cmd, lo, hi, t0, t1)
+    by, _, b = args.by.partition('/')
+    kind_names = {v: k for k,v in KINDS.items()}
+
+    for r in rec[:args.list]:
+        print(f"{r['t']:14.1f} {kind_names.get(int(r['kind']), r['kind']):6} cmd {r['cmd']:02X} addr {r['addr']:08X} "
+              f"data {r['data']:04X} flags {r['flags']:X} {r['latency']:9.1f} ns")
+    print(f"{len(rec)} records")
+    print(f"{by:>10} {'count':>9} {'mean':>9} {'min':>9} {'p50':>9} {'p99':>9} {'max':>9}")
+    for s in latency_stats(rec, by, num(b) if b else 1):
+        k = kind_names.get(int(s['key']), s['key']) if by == 'kind' else f"{s['key']:X}"
+        print(f"{k:>10} {s['count']:9d} {s['mean']:9.1f} {s['min']:9.1f} {s['p50']:9.1f} {s['p99']:9.1f} {s['max']:9.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Verilog header (`define) parser
+
+Reads the constants in src/*.vh so Python code uses the same command codes,
+register addresses and field masks as the RTL.
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, Union
+
+SRCDIR = Path(__file__).resolve().parents[2] / 'src'
+
+_define_re  = re.compile(r'^\s*`define\s+(\w+)\s*(.*)$')
+_literal_re = re.compile(r"(\d*)\s*'([bdhoBDHO])\s*([0-9a-fA-F_]+)")
+_macro_re   = re.compile(r'`(\w+)')
+_bases      = {'b': 2, 'o': 8, 'd': 10, 'h': 16}
+
+def _eval(expr: str, defs: Dict[str, Union[int, str]]) -> Union[int, str]:
+    """Evaluate a define body to an int, or return it unchanged if it is not a plain expression"""
+
+    def macro(m):
+        v = defs.get(m.group(1))
+        if not isinstance(v, int):
+            raise ValueError(m.group(1))
+        return f"({v})"
+
+    def literal(m):
+        return str(int(m.group(3).replace('_', ''), _bases[m.group(2).lower()]))
+
+    try:
+        py = _literal_re.sub(literal, _macro_re.sub(macro, expr))
+        if re.search(r"[^\w\s()|&^~+\-*<>]", py) or re.search(r'[A-Za-z_]', py.replace('0x', '')):
+            return expr
+        return int(eval(py, {'__builtins__': {}}))
+    except (ValueError, SyntaxError, TypeError):
+        return expr
+
+def parse(text: str, defs: Dict[str, Union[int, str]] = None) -> Dict[str, Union[int, str]]:
+    """Parse `define lines. Values are ints where they can be evaluated, otherwise the raw text."""
+    defs = dict(defs) if defs else {}
+    for line in text.splitlines():
+        m = _define_re.match(line.split('//')[0])
+        if m:
+            defs[m.group(1)] = _eval(m.group(2).strip(), defs)
+    return defs
+
+def load(*names: str, srcdir: Union[str, Path] = SRCDIR) -> Dict[str, Union[int, str]]:
+    """Parse one or more header files from srcdir, later files see earlier defines"""
+    defs = {}
+    for n in names:
+        defs = parse((Path(srcdir) / n).read_text(), defs)
+    return defs
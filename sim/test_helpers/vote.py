@@ -0,0 +1,38 @@
+"""Majority-vote reads (nor_bus R_NBUSCTRL.VOTE) reference model
+
+With VOTE = n nor_bus samples every word it reads 2n+1 times and returns
+the bitwise majority. The first sample has the normal read timing; for each
+repeat the address steps to the other word of its pair for one clock and
+back, and the word is sampled again a page read wait (R_NBUSWAIT1.READPG_WAIT)
+later. The repeats are page mode reads of the page latched by the first one,
+so they catch errors on the output path, not in the array.
+R_NBUSVOTEERR counts the words whose samples were not all equal.
+"""
+
+from typing import Callable, Tuple
+
+import numpy as np
+
+_bits = np.arange(16, dtype=np.uint16)
+
+def reads(vote: int) -> int:
+    """Samples per word for a VOTE field value"""
+    return 2 * vote + 1
+
+def majority(samples) -> np.ndarray:
+    """Bitwise majority of samples (reads x words) of 16-bit words"""
+    s = np.asarray(samples, dtype=np.uint16)
+    ones = ((s[..., None] >> _bits) & 1).sum(axis=0)
+    return ((ones > s.shape[0] // 2).astype(np.uint16) << _bits).sum(axis=-1, dtype=np.uint16)
+
+def disagree(samples) -> np.ndarray:
+    """Per word: were its samples (reads x words) not all equal"""
+    s = np.asarray(samples)
+    return (s != s[0]).any(axis=0)
+
+def vote_read(read: Callable[[int], int], addr: int, count: int, vote: int) -> Tuple[np.ndarray, int]:
+    """count words from addr as nor_bus reads them with VOTE = vote, sampling
+    each word with read(addr); returns the words and how many disagreed"""
+    n = reads(vote)
+    s = np.array([[read(addr + i) for _ in range(n)] for i in range(count)], dtype=np.uint16).reshape(count, n).T
+    return majority(s), int(np.count_nonzero(disagree(s)))
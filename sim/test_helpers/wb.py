@@ -1,7 +1,33 @@
-from typing import Tuple, Iterator, List
+from typing import Callable, Tuple, Iterator, List, Sequence
 from cocotb.triggers import RisingEdge, FallingEdge, ClockCycles, with_timeout, Join
 from cocotb import start_soon
 from .util import sigstr
+from . import vh
+
+_defs = vh.load('busmap.vh')
+
+# registered feedback burst cycle types (memory wb, busmap.vh)
+CTI_CLASSIC = _defs['WB_CTI_CLASSIC']
+CTI_INC     = _defs['WB_CTI_INC']
+CTI_END     = _defs['WB_CTI_END']
+BTE_LINEAR  = _defs['WB_BTE_LINEAR']
+BTE_WRAP4   = _defs['WB_BTE_WRAP4']
+BTE_WRAP8   = _defs['WB_BTE_WRAP8']
+BTE_WRAP16  = _defs['WB_BTE_WRAP16']
+
+def burst_next(addr: int, bte: int = BTE_LINEAR) -> int:
+    """Address of the beat after addr in an incrementing burst"""
+    wrap = {BTE_WRAP4: 4, BTE_WRAP8: 8, BTE_WRAP16: 16}.get(bte)
+    if wrap is None:
+        return addr + 1
+    return (addr & ~(wrap - 1)) | ((addr + 1) & (wrap - 1))
+
+def burst_addrs(addr: int, count: int, bte: int = BTE_LINEAR) -> List[int]:
+    addrs = []
+    for i in range(count):
+        addrs.append(addr)
+        addr = burst_next(addr, bte)
+    return addrs
 
 async def read(bus: dict, addr: int, timeout=0) -> int:
     if bus['cyc'].value:
@@ -25,13 +51,17 @@ async def read(bus: dict, addr: int, timeout=0) -> int:
             await with_timeout(trig, timeout, 'ns')
         else:
             await trig
+    # dat_o is valid with ack, sample it before the edge that may change it
+    dat = bus['dat_o'].value
     await ClockCycles(bus['clk'], 1)
 
     bus['cyc'].value = 0
 
-    return bus['dat_o'].value
+    return dat
 
-async def multi_read(bus: dict, addrs: Iterator[int], timeout=0, log=lambda a: None) -> List[Tuple[int,int]]:
+async def multi_read(bus: dict, addrs: Iterator[int], timeout=0, log=lambda a: None,
+                     ctis: Sequence[int] = None, bte: int = BTE_LINEAR) -> List[Tuple[int,int]]:
+    """Pipelined reads in one cycle. With ctis, bus['cti'] and bus['bte'] are driven per strobe."""
     if bus['cyc'].value:
         raise Exception("Transaction already in progress")
 
@@ -42,7 +72,7 @@ async def multi_read(bus: dict, addrs: Iterator[int], timeout=0, log=lambda a: N
     # send the reads
     async def send_reads(clk, stall, stb, adr, addrs: Iterator[int]) -> List[int]:
         addr_ret = []
-        for a in addrs:
+        for i,a in enumerate(addrs):
             await FallingEdge(clk) # wait for stall to settle
             addr_ret.append(a) # keep a record
             if stall.value:
@@ -52,8 +82,14 @@ async def multi_read(bus: dict, addrs: Iterator[int], timeout=0, log=lambda a: N
             log(f"[multi_read.send_reads] stb a={a:X}")
             stb.value = 1
             adr.value = a
+            if ctis is not None:
+                bus['cti'].value = ctis[i]
+                bus['bte'].value = bte
             await ClockCycles(clk, 1)
             stb.value = 0
+        if ctis is not None:
+            bus['cti'].value = CTI_CLASSIC
+            bus['bte'].value = BTE_LINEAR
         return addr_ret
     addr_task = start_soon(send_reads(bus['clk'], bus['stall'], bus['stb'], bus['adr'], addrs))
 
@@ -81,6 +117,11 @@ async def multi_read(bus: dict, addrs: Iterator[int], timeout=0, log=lambda a: N
 
     return addr_data
 
+async def burst_read(bus: dict, addr: int, count: int, bte: int = BTE_LINEAR, timeout=0, log=lambda a: None) -> List[Tuple[int,int]]:
+    """Incrementing burst: CTI incrementing on every beat but the last, which is end of burst"""
+    ctis = [CTI_INC] * (count - 1) + [CTI_END]
+    return await multi_read(bus, burst_addrs(addr, count, bte), timeout, log, ctis=ctis, bte=bte)
+
 async def read_abort(bus: dict, addr: int, after_cycles: int = 1) -> None:
     if bus['cyc'].value:
         raise Exception("Transaction already in progress")
@@ -318,3 +359,40 @@ async def slave_expect_nothing(bus: dict):
         assert bus['stb'].value == 0
         await ClockCycles(bus['clk'], 1)
 
+
+async def slave_burst_read(bus: dict, read: Callable[[int], int], beats: list = None, stall_cycles=0, log=lambda s: None):
+    """
+    Pipelined read slave with registered feedback bursts
+
+    Start with cocotb.start_soon. Every strobe is acked one clock later (after
+    stall_cycles with stall high) with read(adr) on bus['dat_o']. While the
+    previous beat announced an incrementing burst, the next one must be a read
+    of the address that follows per BTE. (adr, cti, bte) of each beat is
+    appended to beats.
+    """
+
+    prev = None
+    bus['stall'].value = 0
+    bus['ack'].value = 0
+
+    while True:
+        bus['ack'].value = 0
+        if bus['rst'].value or not bus['cyc'].value:
+            bus['stall'].value = 0
+            prev = None
+        elif bus['stb'].value and not bus['stall'].value:
+            beat = (int(bus['adr'].value), int(bus['cti'].value), int(bus['bte'].value))
+            log(f"[burst slave] adr={beat[0]:X} cti={beat[1]:03b} bte={beat[2]:02b}")
+            if prev is not None and prev[1] == CTI_INC:
+                assert not bus['we'].value, "write in a read burst"
+                assert beat[0] == burst_next(prev[0], prev[2]), f"burst address {beat[0]:X} after {prev[0]:X}"
+            prev = beat if beat[1] != CTI_END else None
+            if beats is not None:
+                beats.append(beat)
+            if stall_cycles > 0:
+                bus['stall'].value = 1
+                await ClockCycles(bus['clk'], stall_cycles)
+                bus['stall'].value = 0
+            bus['dat_o'].value = read(beat[0])
+            bus['ack'].value = 1
+        await ClockCycles(bus['clk'], 1)
@@ -0,0 +1,246 @@
+"""Tests of the Python helpers that need no simulator (plain pytest)
+
+    cd sim && python3 -m pytest -q test_helpers_py.py
+
+or `make test-py`. The cocotb test modules (test_top.py, ...) run under make.
+"""
+
+import asyncio
+import numpy as np
+import pytest
+from test_helpers import nor, bridge, regmap, readout
+
+def test_nor_array_ranges():
+    """nor_flash_array range operations against the word operations"""
+
+    mem = nor.nor_flash_array('H', 4 * 256, 256)
+    ref = [0xFFFF] * mem.size
+
+    # fill_pattern repeats the pattern and overwrites regardless of contents
+    mem.program(12, 0x0000)
+    mem.fill_pattern(10, 5, [0x0F0F, 0x1234])
+    ref[10:15] = [0x0F0F, 0x1234, 0x0F0F, 0x1234, 0x0F0F]
+    # program_range only clears bits, as program does
+    mem.program_range(11, [0x00FF, 0xFFFF, 0xF0F0])
+    for a,d in zip(range(11, 14), [0x00FF, 0xFFFF, 0xF0F0]):
+        ref[a] &= d
+    assert [mem.read(a) for a in range(mem.size)] == ref
+
+    # read_range is a copy
+    r = mem.read_range(10, 5)
+    assert r.tolist() == ref[10:15]
+    r[:] = 0
+    assert mem.read(10) == ref[10]
+
+    # compare_range returns the mismatching addresses
+    assert mem.compare_range(8, ref[8:16]).tolist() == []
+    assert mem.compare_range(8, [0xFFFF] * 8).tolist() == [10, 11, 12, 13, 14]
+
+    # erase_range erases every sector the range touches, and only those
+    mem.fill_pattern(0, mem.size, [0])
+    mem.erase_range(250, 10)
+    assert mem.compare_range(0, [0xFFFF] * 512).tolist() == []
+    assert not np.any(mem.read_range(512, 512))
+    mem.erase_range(768, 1)
+    assert mem.read_range(512, 512).tolist() == [0] * 256 + [0xFFFF] * 256
+
+def test_spidev_wait_ready():
+    """SpidevTransport sends WAIT_READY as bounded frames until the status word"""
+
+    class spidev_stub:
+        """xfer2 returns zeros, then the DONE status in frame ready_at (0 for never)"""
+        def __init__(self, ready_at: int):
+            self.ready_at = ready_at
+            self.lens = []
+
+        def xfer2(self, buf):
+            self.lens.append(len(buf))
+            rx = [0] * len(buf)
+            if len(self.lens) == self.ready_at:
+                rx[-1] = bridge.STAT_DONE
+            return rx
+
+    dev = spidev_stub(3)
+    br = bridge.Bridge(bridge.SpidevTransport(dev))
+    assert asyncio.run(br.wait_ready(0, 1 << 16)) == bridge.STAT_DONE
+    assert len(dev.lens) == 3 and max(dev.lens) <= 4096
+
+    # max_words without a status word: 0, in as many frames as it takes
+    dev = spidev_stub(0)
+    br = bridge.Bridge(bridge.SpidevTransport(dev, bufsiz=1024))
+    assert asyncio.run(br.wait_ready(0, 3000)) == 0
+    hdr = len(bridge.wait_ready_frame(0, 1).tx)
+    assert sum(n - hdr for n in dev.lens) == 2 * 3000 and max(dev.lens) <= 1024
+
+    # wall clock timeout
+    br = bridge.Bridge(bridge.SpidevTransport(spidev_stub(0), wait_timeout_s=0))
+    with pytest.raises(TimeoutError):
+        asyncio.run(br.wait_ready(0, 1 << 16))
+
+def test_cfg_shadow():
+    """CFG register shadow: skipped writes, read-modify-writes without a read, batches"""
+
+    class recording(bridge.ModelTransport):
+        """ModelTransport that keeps the command of every frame, and can fail"""
+        def __init__(self):
+            super().__init__()
+            self.cmds = []
+            self.fail = False
+
+        async def xfer(self, frames):
+            if self.fail:
+                raise OSError("link down")
+            self.cmds += [f.cmd for f in frames]
+            return await super().xfer(frames)
+
+    async def run():
+        t = recording()
+        br = bridge.Bridge(t)
+        wait1 = regmap.regs['NBUSWAIT1']
+
+        # the reset value is shadowed: writing it again sends nothing
+        assert not await br.regs.write('NBUSWAIT1', wait1.reset)
+        assert (br.regs.writes, br.regs.skipped, t.cmds) == (0, 1, [])
+
+        # a field update is one write frame, no read frame
+        assert await br.regs.set('NBUSWAIT1', READPG_WAIT=3)
+        assert t.cmds == [bridge.CMD_WRITE_THRU] and br.regs.writes == 1
+        assert await br.cfg_read(wait1.addr) == wait1.encode(READPG_WAIT=3)
+        t.cmds = []
+
+        # queued writes reach the shadow when the batch has run; set() sees the
+        # writes queued before it
+        b = br.batch()
+        await br.regs.set('NBUSWAIT1', b, READ_WAIT=6)
+        await br.regs.set('NBUSWAIT1', b, READPG_WAIT=4)
+        assert br.regs.shadow['NBUSWAIT1'] == wait1.encode(READPG_WAIT=3)
+        await b.run()
+        assert br.regs.shadow['NBUSWAIT1'] == wait1.encode(READ_WAIT=6, READPG_WAIT=4)
+        assert await br.cfg_read(wait1.addr) == br.regs.shadow['NBUSWAIT1']
+        assert bridge.CMD_FAST_READ not in t.cmds[:-1]
+
+        # a batch that fails leaves the shadow alone
+        b = br.batch()
+        await br.regs.set('NBUSWAIT1', b, READ_WAIT=9)
+        t.fail = True
+        with pytest.raises(OSError):
+            await b.run()
+        t.fail = False
+        assert br.regs.shadow['NBUSWAIT1'] == wait1.encode(READ_WAIT=6, READPG_WAIT=4)
+
+        # direct writes through the bridge are shadowed too
+        ctrl = regmap.regs['NBUSCTRL']
+        await br.cfg_write(ctrl.addr, ctrl.encode(VOTE=1))
+        await br.write_through(bridge.CFG | wait1.addr, wait1.reset)
+        assert br.regs.shadow['NBUSCTRL'] == ctrl.encode(VOTE=1)
+        assert br.regs.shadow['NBUSWAIT1'] == wait1.reset
+        skipped = br.regs.skipped
+        assert not await br.regs.set('NBUSCTRL', VOTE=1)
+        assert br.regs.skipped == skipped + 1
+
+    asyncio.run(run())
+
+class virtual_clock:
+    """Time that only passes in sleep(), which returns at once"""
+
+    def __init__(self):
+        self.t = 0.0
+
+    def time(self) -> float:
+        return self.t
+
+    async def sleep(self, dt: float) -> None:
+        self.t += dt
+        await asyncio.sleep(0)
+
+def test_readout_orchestrator():
+    """Readout orchestrator on bridge stand-ins: erase polls, full queues, rate limit"""
+
+    async def run():
+        # erase: R_NBUSSTAT polls until the stand-in's busy time is over. The
+        # first poll comes right after the erase and sees DONE clear; each
+        # poll is one job after the erase's.
+        b = readout.model_board("busy", words=1 << 17, busy_s=0.05)
+        async with readout.orchestrator([b]) as o:
+            await o.erase_sector(b, 1 << 16, interval=0.005)
+        assert b.stats.polls >= 2 and b.stats.jobs == 1 + b.stats.polls, b.stats
+        assert b.stats.retries == 0
+        assert b.flash.mem.read_range(1 << 16, 4).tolist() == [0xFFFF] * 4
+
+        # a full queue holds back submit until the worker takes a job
+        b = readout.model_board("full", words=1 << 10, depth=2)
+        go = asyncio.Event()
+        async with readout.orchestrator([b]) as o:
+            futs = [await o.submit(b, "held", lambda br: go.wait())]
+            await asyncio.sleep(0) # the worker takes it
+            futs += [await o.submit(b, f"queued {i}", lambda br: br.cfg_read(bridge.R_NBUSSTAT)) for i in range(2)]
+            blocked = asyncio.create_task(o.submit(b, "blocked", lambda br: br.cfg_read(bridge.R_NBUSSTAT)))
+            for _ in range(10):
+                await asyncio.sleep(0)
+            assert not blocked.done()
+            go.set()
+            futs.append(await blocked)
+            await asyncio.gather(*futs)
+        assert b.stats.jobs == 4
+
+        # rate limit: on a virtual clock the bucket's waits add up to the
+        # SPI bytes of the board past the initial burst (rate/10), at rate
+        rate, words = 1e5, 1 << 14
+        clocks = [virtual_clock() for _ in range(2)]
+        boards = [readout.model_board(f"r{i}", words=words, limit=readout.rate_limit(rate, time=c.time, sleep=c.sleep))
+                  for i,c in enumerate(clocks)]
+        async with readout.orchestrator(boards) as o:
+            await asyncio.gather(*(o.read(b, 0, words) for b in boards))
+        for b,c in zip(boards, clocks):
+            assert b.stats.words == words
+            assert b.stats.bytes == b.stats.frames * (1 + 4 + bridge.WAIT_BYTES) + 2 * words
+            assert c.t == pytest.approx((b.stats.bytes - rate / 10) / rate)
+
+        # an erase whose transfer fails is retried from a reset when it
+        # stopped after the first unlock cycles, and polled when it got out
+        # whole (the stand-in is busy, RY low)
+        for cycles in (3, 6):
+            b = readout.model_board("retry", words=1 << 17, busy_s=0.05)
+            b.flash.mem.program_range(1 << 16, [0x1234] * 4)
+            paced = b.bridge.transport.inner
+            # a cut frame never reaches the stand-in's busy accounting
+            tr = paced.inner if cycles < 6 else paced
+            xfer, erases = tr.xfer, []
+            async def cutting(frames, xfer=xfer, erases=erases, cycles=cycles):
+                # the six erase cycles go out as one merged write-through frame
+                f = frames[0]
+                if f.cmd == bridge.CMD_WRITE_THRU and len(f.tx) == 1 + 6 * 6:
+                    erases.append(f)
+                    if len(erases) == 1:
+                        await xfer([bridge.Frame(f.tx[:1 + cycles * 6])])
+                        raise OSError("stand-in transfer error")
+                return await xfer(frames)
+            tr.xfer = cutting
+            async with readout.orchestrator([b]) as o:
+                await o.erase_sector(b, 1 << 16, interval=0.002)
+            assert b.stats.retries == 1 and len(erases) == (2 if cycles < 6 else 1), (cycles, len(erases))
+            assert b.flash.mem.read_range(1 << 16, 4).tolist() == [0xFFFF] * 4
+
+        # a failed chunk fails the read and drops the chunks still queued
+        b = readout.model_board("fail", words=1 << 12, depth=2, retries=0)
+        read_fast, calls = b.bridge.read_fast, []
+        async def failing(a, n):
+            calls.append(a)
+            if a == 256:
+                raise OSError("stand-in transfer error")
+            return await read_fast(a, n)
+        b.bridge.read_fast = failing
+        async with readout.orchestrator([b]) as o:
+            with pytest.raises(RuntimeError, match="read 100"):
+                await o.read(b, 0, 1 << 12)
+        assert calls[:2] == [0, 256] and len(calls) <= 2 + b.depth, calls
+        assert b.stats.failed == 1 and b.stats.words == 0
+
+        # blocking transports run in a thread, with xfer_sync
+        class spidev_stub:
+            def xfer2(self, buf):
+                return list(buf[:5]) + [0x12, 0x34] * ((len(buf) - 5) // 2)
+        br = bridge.Bridge(readout.threaded_transport(bridge.SpidevTransport(spidev_stub())))
+        assert await br.read(0, 3) == [0x1234] * 3
+
+    asyncio.run(run())
@@ -1,8 +1,10 @@
 from typing import Tuple
 import cocotb
-from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge, FallingEdge, ClockCycles, Join
-from test_helpers import wb
+from cocotb.triggers import RisingEdge, FallingEdge, ClockCycles, Join, Edge, Timer
+from cocotb.utils import get_sim_time
+from test_helpers import clock, wb, regmap, profile
+
+profile.install_from_env()
 
 async def setup(dut):
     """Prepare DUT for test"""
@@ -10,13 +12,15 @@ async def setup(dut):
     #T = 15.15 # ~66 MHz
     #T = 13.33 # ~75 MHz
     T = 11.9 # ~84 MHz
-    cocotb.start_soon(Clock(dut.clk_i, 13.33, units="ns").start())
+    clock.get(dut.clk_i).start(13.33, 'ns')
 
     dut.memwb_cyc_i.value = 0
     dut.memwb_stb_i.value = 0
     dut.memwb_we_i.value = 0
     dut.memwb_adr_i.value = 0
     dut.memwb_dat_i.value = 0
+    dut.memwb_cti_i.value = wb.CTI_CLASSIC
+    dut.memwb_bte_i.value = wb.BTE_LINEAR
     dut.cfgwb_adr_i.value = 0
     dut.cfgwb_dat_i.value = 0
     dut.cfgwb_we_i.value = 0
@@ -178,6 +182,70 @@ async def test_pipeline(dut):
 
     await ClockCycles(dut.clk_i, 10)
 
+@cocotb.test()
+async def test_burst_read(dut):
+    """Incrementing bursts against chained classic reads of the same words"""
+
+    await setup(dut)
+
+    bus = {
+          'clk': dut.clk_i,
+          'rst': dut.rst_i,
+          'cyc': dut.memwb_cyc_i,
+          'stb': dut.memwb_stb_i,
+           'we': dut.memwb_we_i,
+          'adr': dut.memwb_adr_i,
+        'dat_i': dut.memwb_dat_i,
+        'stall': dut.memwb_stall_o,
+          'ack': dut.memwb_ack_o,
+        'dat_o': dut.memwb_dat_o,
+          'cti': dut.memwb_cti_i,
+          'bte': dut.memwb_bte_i
+    }
+
+    def word(a):
+        return (a * 0x9E37 + 0x1234) & 0xFFFF
+
+    async def nor_data():
+        # the flash returns the word at nor_addr_o
+        while True:
+            dut.nor_data_i.value = word(int(dut.nor_addr_o.value))
+            await Edge(dut.nor_addr_o)
+    nor_task = cocotb.start_soon(nor_data())
+
+    T = 13.33
+    N = 16
+    base = 0x1230
+    addrs = list(range(base, base + N))
+
+    t0 = get_sim_time('ns')
+    classic = await wb.multi_read(bus, addrs, timeout=1000, log=dut._log.debug)
+    t_classic = (get_sim_time('ns') - t0) / T / N
+    await ClockCycles(dut.clk_i, 4)
+
+    t0 = get_sim_time('ns')
+    burst = await wb.burst_read(bus, base, N, timeout=1000, log=dut._log.debug)
+    t_burst = (get_sim_time('ns') - t0) / T / N
+    await ClockCycles(dut.clk_i, 4)
+
+    dut._log.info(f"{N} words: classic {t_classic:.1f} clk/word, burst {t_burst:.1f} clk/word, "
+                  f"{t_classic - t_burst:.1f} saved")
+    for res in [classic, burst]:
+        assert [int(a) for a,d in res] == addrs
+        assert [int(d) for a,d in res] == [word(a) for a in addrs]
+    assert t_classic - t_burst >= 1.5, "burst did not save cycles per word"
+
+    # wrapping burst, as a cache line fill starting at the missed word
+    start = 0x1236
+    wrapped = await wb.burst_read(bus, start, 8, wb.BTE_WRAP8, timeout=1000, log=dut._log.debug)
+    expect = wb.burst_addrs(start, 8, wb.BTE_WRAP8)
+    assert expect == [0x1236, 0x1237, 0x1230, 0x1231, 0x1232, 0x1233, 0x1234, 0x1235]
+    assert [int(a) for a,d in wrapped] == expect
+    assert [int(d) for a,d in wrapped] == [word(a) for a in expect]
+
+    nor_task.kill()
+    await ClockCycles(dut.clk_i, 10)
+
 @cocotb.test()
 async def test_cfg_read(dut):
     """Read cfg registers"""
@@ -214,9 +282,7 @@ async def test_cfg_read(dut):
 
     reg_def = [
         # (register addr, default value)
-        (0x0100, 0x0001), # R_NBUSCTRL
-        (0x0101, 0x4F0E), # R_NBUSWAIT0
-        (0x0102, 0x1115), # R_NBUSWAIT1
+        (regmap.regs[n].addr, regmap.regs[n].reset) for n in ['NBUSCTRL', 'NBUSWAIT0', 'NBUSWAIT1']
     ]
 
     for a,d in reg_def:
@@ -260,9 +326,9 @@ async def test_cfg_write(dut):
 
     reg_val = [
         # (register addr, write value)
-        (0x0100, 0xFEDC), # R_NBUSCTRL
-        (0x0101, 0x2011), # R_NBUSWAIT0
-        (0x0102, 0x1410), # R_NBUSWAIT1
+        (regmap.regs['NBUSCTRL'].addr,  0xFEDC),
+        (regmap.regs['NBUSWAIT0'].addr, 0x2011),
+        (regmap.regs['NBUSWAIT1'].addr, 0x1410),
     ]
 
     for a,d in reg_val:
@@ -274,3 +340,84 @@ async def test_cfg_write(dut):
         assert read_val == d, f"Reg {a:04X} = {int(read_val):04X} (expected {d:04X})"
         await ClockCycles(dut.clk_i, 1)
 
+@cocotb.test()
+async def test_cfg_err(dut):
+    """An access to no register errors for one clock, the next access does not"""
+
+    await setup(dut)
+
+    cfgwb = {
+          'clk': dut.clk_i,
+          'rst': dut.cfgwb_rst_i,
+          'cyc': dut.cfgwb_cyc_i,
+          'stb': dut.cfgwb_stb_i,
+           'we': dut.cfgwb_we_i,
+          'adr': dut.cfgwb_adr_i,
+        'dat_i': dut.cfgwb_dat_i,
+        'stall': dut.cfgwb_stall_o,
+          'ack': dut.cfgwb_ack_o,
+        'dat_o': dut.cfgwb_dat_o
+    }
+
+    errs = []
+    async def monitor():
+        while True:
+            await RisingEdge(dut.clk_i)
+            errs.append(int(dut.cfgwb_err_o.value))
+    mon = cocotb.start_soon(monitor())
+
+    # past the last nor_bus register, read and write
+    bad = regmap.regs['NBUSVOTEERR'].addr + 1
+    for we in (0, 1):
+        errs.clear()
+        dut.cfgwb_adr_i.value = bad
+        dut.cfgwb_dat_i.value = 0
+        dut.cfgwb_we_i.value = we
+        dut.cfgwb_cyc_i.value = 1
+        dut.cfgwb_stb_i.value = 1
+        await ClockCycles(dut.clk_i, 1)
+        dut.cfgwb_stb_i.value = 0
+        dut.cfgwb_we_i.value = 0
+        await ClockCycles(dut.clk_i, 1)
+        dut.cfgwb_cyc_i.value = 0
+        await ClockCycles(dut.clk_i, 4)
+        assert errs.count(1) == 1, errs
+
+    errs.clear()
+    a = regmap.regs['NBUSCTRL']
+    assert await wb.read(cfgwb, a.addr) == a.reset
+    await ClockCycles(dut.clk_i, 2)
+    assert not any(errs), errs
+
+    mon.kill()
+
+
+@cocotb.test()
+async def test_clkgen(dut):
+    """tb_clkgen: stop ends the current half period, a quick restart keeps its phase"""
+
+    await setup(dut)
+    clk = clock.get(dut.clk_i)
+
+    # stop in the high half: it ends, then the clock stays low
+    await RisingEdge(dut.clk_i)
+    t0 = get_sim_time('ps')
+    clk.stop()
+    await FallingEdge(dut.clk_i)
+    assert get_sim_time('ps') - t0 == int(clk.gen.high_ps.value)
+    await Timer(100, 'ns')
+    assert dut.clk_i.value == 0
+
+    # restart within a half period: the low half ends, then phase to the edge
+    clk.start(10, 'ns')
+    await RisingEdge(dut.clk_i)
+    await FallingEdge(dut.clk_i)
+    await Timer(1, 'ns')
+    clk.stop()
+    await Timer(1, 'ns')
+    clk.start(10, 'ns', phase=3)
+    t0 = get_sim_time('ps')
+    await RisingEdge(dut.clk_i)
+    assert get_sim_time('ps') - t0 == 3000 + 3000
+
+    clk.start(13.33, 'ns')
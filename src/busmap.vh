@@ -15,6 +15,25 @@
 `define SPI_WAIT_CYC  20
 `define SPI_DATA_BITS `NORDATABITS
 
+// Read prefetch FIFO depth (ctrl), power of two. Override with -DPIPE_DEPTH=n
+`ifndef PIPE_DEPTH
+`define PIPE_DEPTH    16
+`endif
+
+// NOR devices on the bus, one chip select each, power of two. Override with -DNOR_CHIPS=n
+`ifndef NOR_CHIPS
+`define NOR_CHIPS     1
+`endif
+
+// Memory WB registered feedback bursts (Wishbone B4 CTI/BTE)
+`define WB_CTI_CLASSIC 3'b000
+`define WB_CTI_INC     3'b010 // incrementing burst, another beat follows
+`define WB_CTI_END     3'b111 // last beat of a burst
+`define WB_BTE_LINEAR  2'b00
+`define WB_BTE_WRAP4   2'b01
+`define WB_BTE_WRAP8   2'b10
+`define WB_BTE_WRAP16  2'b11
+
 // Internal CFG WB
 `define CFGWBADDRBITS 16
 `define CFGWBDATABITS `NORDATABITS
@@ -23,7 +42,7 @@
 `define NORADDRMASK   {(`NORADDRBITS){1'b1}} //32'h03FFFFFF
 `define CFGADDRMASK   {(`CFGWBADDRBITS){1'b1}} //32'h0000FFFF
 `define CTRLBIT       31 // SPI addr high bit. 0 = nor request, 1 = management request
-`define CTRLBITMASK   ('1 << `CTRLBIT)
+`define CTRLBITMASK   (32'h1 << `CTRLBIT)
 
 // CFG address maps
 
@@ -33,6 +52,8 @@
 // modules
 `define QSPIADDRBASE  16'h0000 // qspi_ctrl_frm
 `define NBUSADDRBASE  16'h0100 // nor_bus
+`define NCHKADDRBASE  16'h0200 // nor_check
+`define PERFADDRBASE  16'h0300 // perf_counters
 
 // QSPI regs
 `define R_QSPICTRL    16'h0001
@@ -43,14 +64,25 @@
 `define R_QSPICTRL_WPEN_SHIFT 1
 `define R_QSPICTRL_VTEN_MASK  16'h0004
 `define R_QSPICTRL_VTEN_SHIFT 2
+`define R_QSPICTRL_SDLY_MASK  16'h0008
+`define R_QSPICTRL_SDLY_SHIFT 3
+`define R_QSPICTRL_RST_VAL    'b0
 
 // NOR bus regs
 `define R_NBUSCTRL    16'h0100
 `define R_NBUSWAIT0   16'h0101
 `define R_NBUSWAIT1   16'h0102
+`define R_NBUSSTAT    16'h0103
+`define R_NBUSBUSYL   16'h0104
+`define R_NBUSBUSYH   16'h0105
+`define R_NBUSVOTEERR 16'h0106
 // R_NBUSCTRL
 `define R_NBUSCTRL_PGEN_MASK  16'h0001
 `define R_NBUSCTRL_PGEN_SHIFT 0
+`define R_NBUSCTRL_ILV_MASK   16'h0002 // chip select: 0 = top address bits (banks), 1 = address bits above the page (interleave)
+`define R_NBUSCTRL_ILV_SHIFT  1
+`define R_NBUSCTRL_VOTE_MASK  16'h000C // majority vote: 0 = off, n = 2n+1 reads per word
+`define R_NBUSCTRL_VOTE_SHIFT 2
 `define R_NBUSCTRL_RST_VAL    ('b0 | ('b1 << `R_NBUSCTRL_PGEN_SHIFT))
 // R_NBUSWAIT0
 `define R_NBUSWAIT0_WRITE_WAIT_MASK    16'h00FF
@@ -64,3 +96,69 @@
 `define R_NBUSWAIT1_READPG_WAIT_MASK   16'hFF00
 `define R_NBUSWAIT1_READPG_WAIT_SHIFT  8
 `define R_NBUSWAIT1_RST_VAL            ('b0 | ('d21 << `R_NBUSWAIT1_READ_WAIT_SHIFT) | ('d17 << `R_NBUSWAIT1_READPG_WAIT_SHIFT))
+// R_NBUSSTAT
+`define R_NBUSSTAT_RY_MASK     16'h0001 // RY of all chips, live
+`define R_NBUSSTAT_RY_SHIFT    0
+`define R_NBUSSTAT_DONE_MASK   16'h0002 // RY rose since the last NOR write; write 1 to clear
+`define R_NBUSSTAT_DONE_SHIFT  1
+`define R_NBUSSTAT_TOUT_MASK   16'h0004 // WAIT_READY data only: timed out before DONE
+`define R_NBUSSTAT_TOUT_SHIFT  2
+
+// NOR check regs
+`define R_NCHKCTRL    16'h0200
+`define R_NCHKSTAT    16'h0201
+`define R_NCHKADDRL   16'h0202
+`define R_NCHKADDRH   16'h0203
+`define R_NCHKLENL    16'h0204
+`define R_NCHKLENH    16'h0205
+`define R_NCHKRESL    16'h0206
+`define R_NCHKRESH    16'h0207
+`define R_NCHKPATA    16'h0208
+`define R_NCHKPATB    16'h0209
+`define R_NCHKPATM    16'h020A
+// R_NCHKCTRL
+`define R_NCHKCTRL_START_MASK  16'h0001
+`define R_NCHKCTRL_START_SHIFT 0
+`define R_NCHKCTRL_MODE_MASK   16'h0006
+`define R_NCHKCTRL_MODE_SHIFT  1
+`define R_NCHKCTRL_MODE_CRC    2'd0
+`define R_NCHKCTRL_MODE_BLANK  2'd1
+`define R_NCHKCTRL_MODE_DIFF   2'd2
+// R_NCHKSTAT
+`define R_NCHKSTAT_BUSY_MASK   16'h0001
+`define R_NCHKSTAT_BUSY_SHIFT  0
+`define R_NCHKSTAT_DONE_MASK   16'h0002
+`define R_NCHKSTAT_DONE_SHIFT  1
+`define R_NCHKSTAT_FOUND_MASK  16'h0004
+`define R_NCHKSTAT_FOUND_SHIFT 2
+// R_NCHKPATA/B/M: DIFF mode expected data, PATB where the parity of the
+// address bits [15:0] selected by PATM is odd, else PATA (PATM = 0: constant)
+`define R_NCHKPATA_RST_VAL     16'hFFFF
+`define R_NCHKPATB_RST_VAL     16'hFFFF
+`define R_NCHKPATM_RST_VAL     16'h0000
+
+// Performance counter regs
+`define R_PERFCTRL    16'h0300
+`define R_PERFCNT     16'h0310 // snapshot of counter i: low half at R_PERFCNT + 2*i, high half at + 2*i + 1
+// R_PERFCTRL
+`define R_PERFCTRL_SNAP_MASK  16'h0001 // write 1: snapshot all counters
+`define R_PERFCTRL_SNAP_SHIFT 0
+`define R_PERFCTRL_CLR_MASK   16'h0002 // write 1: clear all counters, after SNAP
+`define R_PERFCTRL_CLR_SHIFT  1
+`define R_PERFCTRL_STOP_MASK  16'h0004 // counters hold while set
+`define R_PERFCTRL_STOP_SHIFT 2
+// counters
+`define PERF_CNT_CLK          0  // bridge clocks
+`define PERF_CNT_READ         1  // QSPI frames by command
+`define PERF_CNT_FAST_READ    2
+`define PERF_CNT_WRITE_THRU   3
+`define PERF_CNT_WAIT_READY   4
+`define PERF_CNT_DIFF_READ    5
+`define PERF_CNT_LOOPBACK     6
+`define PERF_CNT_OTHER        7  // any other command
+`define PERF_CNT_NOR_RD       8  // NOR random read cycles
+`define PERF_CNT_NOR_RDPG     9  // NOR page mode read cycles
+`define PERF_CNT_NOR_WR       10 // NOR write cycles
+`define PERF_CNT_MEM_STALL    11 // memory wishbone stall clocks
+`define PERF_CNT_RY_BUSY      12 // clocks with RY low
+`define PERF_COUNTERS         13
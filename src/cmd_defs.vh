@@ -12,6 +12,17 @@
 `define SPI_COMMAND_PROG_WORD  8'hF2
 `define SPI_COMMAND_RESET      8'hF0
 `define SPI_COMMAND_WRITE_THRU 8'hF8
+`define SPI_COMMAND_WAIT_READY 8'hF9
 `define SPI_COMMAND_LOOPBACK   8'hFA
 `define SPI_COMMAND_DET_VT     8'hFB
 `define SPI_COMMAND_ENTER_PASSTHROUGH 8'hFC
+`define SPI_COMMAND_DIFF_READ  8'hF7
+
+// DIFF_READ stream (nor_check DIFF mode): 0000h while no record is ready,
+// else three-word records, the first word tagged
+//     REC  TAG_REC | addr[25:16], addr[15:0], data   one per mismatch
+//     END  TAG_END | flags,       count[31:16], count[15:0]
+`define DIFF_TAG_MASK     16'hC000
+`define DIFF_TAG_REC      16'h8000
+`define DIFF_TAG_END      16'hC000
+`define DIFF_END_ERR_MASK 16'h0001 // aborted on a bus error
@@ -18,7 +18,8 @@ module ctrl #(
     parameter MEMWBADDRBITS = `NORADDRBITS,
     parameter MEMWBDATABITS = `NORDATABITS,
     parameter CFGWBADDRBITS = `CFGWBADDRBITS,
-    parameter CFGWBDATABITS = `CFGWBDATABITS
+    parameter CFGWBDATABITS = `CFGWBDATABITS,
+    parameter PIPEDEPTH     = `PIPE_DEPTH
 ) (
     input i_clk, i_sysrst,
 
@@ -38,6 +39,8 @@ module ctrl #(
     output reg                        o_memwb_cyc,
     output reg                        o_memwb_stb,
     output reg                        o_memwb_we,
+    output reg                  [2:0] o_memwb_cti,
+    output                      [1:0] o_memwb_bte,
     output reg    [MEMWBADDRBITS-1:0] o_memwb_adr,
     output reg    [MEMWBDATABITS-1:0] o_memwb_dat,
     input                             i_memwb_err,
@@ -50,13 +53,18 @@ module ctrl #(
     output reg    [CFGWBADDRBITS-1:0] o_cfgwb_adr,
     output reg    [CFGWBDATABITS-1:0] o_cfgwb_dat,
     output reg                        o_cfgwb_we,
-    output reg                        o_cfgwb_stb, // TODO: one stb per peripheral
+    output reg                        o_cfgwb_stb,
     output reg                        o_cfgwb_cyc,
     input                             i_cfgwb_err,
     input                             i_cfgwb_ack,
     input         [CFGWBDATABITS-1:0] i_cfgwb_dat,
     input                             i_cfgwb_stall,
 
+    // nor_check DIFF record stream
+    output                            o_diff_rd,
+    output                            o_diff_end,
+    input         [MEMWBDATABITS-1:0] i_diff_dat,
+
     output reg                        o_vtmode,
     output reg                        o_passthrough_en
 );
@@ -80,11 +88,12 @@ module ctrl #(
             o_passthrough_en <= 'b1;
 
     // address counter
+    wire cfg_rd_issue;
     reg  [SPIADDRBITS-1:0]   addr_count;
     wire [MEMWBADDRBITS-1:0] memaddr;
     wire [SPIADDRBITS-MEMWBADDRBITS-1:0] ctrladdr;
     wire addr_latch = i_spistbadr; // i_spistb && (i_spistate == `SPI_STATE_ADDR);
-    wire addr_inc   = o_memwb_stb;
+    wire addr_inc   = o_memwb_stb || cfg_rd_issue;
     //reg  addr_latch;
     //always @(posedge i_clk) addr_latch <= i_spistb && (i_spistate == `SPI_STATE_ADDR);
     upcounter #(.BITS(SPIADDRBITS)) addr_counter (
@@ -99,51 +108,125 @@ module ctrl #(
     //
     // write direction
     wire cmd_is_write;
-    assign cmd_is_write = !((i_spicmd == `SPI_COMMAND_READ) || (i_spicmd == `SPI_COMMAND_FAST_READ));
+    assign cmd_is_write = !((i_spicmd == `SPI_COMMAND_READ) || (i_spicmd == `SPI_COMMAND_FAST_READ) ||
+                            (i_spicmd == `SPI_COMMAND_WAIT_READY));
+
+    // loopback echoes the low address bits without touching either bus
+    wire cmd_is_loopback = i_spicmd == `SPI_COMMAND_LOOPBACK;
+
+    // wait for ready reads R_NBUSSTAT, the address phase is a timeout
+    wire cmd_is_wait = i_spicmd == `SPI_COMMAND_WAIT_READY;
+
+    // DIFF_READ shifts out the nor_check record stream, neither bus is used
+    wire cmd_is_diff = i_spicmd == `SPI_COMMAND_DIFF_READ;
 
     // memwb / cfgwb routing
-    wire bus_is_cfg = i_spiaddr[SPIADDRBITS-1]; //ctrladdr[SPIADDRBITS-MEMWBADDRBITS-1];
+    wire bus_is_cfg = i_spiaddr[SPIADDRBITS-1] || cmd_is_wait; //ctrladdr[SPIADDRBITS-MEMWBADDRBITS-1];
     reg  [CFGWBDATABITS-1:0] cfgwb_dat_q;
     reg  [MEMWBDATABITS-1:0] pipe_fifo_rd_data;
-    assign o_spidata[MEMWBDATABITS-1:0] = bus_is_cfg ? cfgwb_dat_q : pipe_fifo_rd_data;
+    assign o_spidata[MEMWBDATABITS-1:0] = cmd_is_loopback ? i_spiaddr[MEMWBDATABITS-1:0] :
+                                          cmd_is_diff     ? i_diff_dat  :
+                                          bus_is_cfg      ? cfgwb_dat_q : pipe_fifo_rd_data;
+
+    // diff stream
+    // A stream word is loaded for every data word (the read request strobes
+    // into READ_DATA). One more is loaded than is shifted out: nor_check takes
+    // it back when CS rises.
+    reg spirst_q;
+    always @(posedge i_clk) spirst_q <= i_spirst;
+    assign o_diff_rd  = cmd_is_diff && i_spistbrrq && (i_spistate == `SPI_STATE_READ_DATA);
+    assign o_diff_end = cmd_is_diff && i_spirst && !spirst_q;
+
+    // wait for ready
+    // The address phase of WAIT_READY is a timeout in clocks (0 = none). Every
+    // data word reads R_NBUSSTAT, but is 0 until either its DONE bit is set
+    // or the timeout has expired, in which case TOUT is set in the word. The
+    // host clocks data words until it gets a nonzero one: one frame per wait.
+    reg [SPIADDRBITS-1:0] wait_left;
+    reg                   wait_tout;
+    always @(posedge i_clk)
+        if (i_sysrst || addr_latch) begin
+            wait_left <= i_sysrst ? 'b0 : i_spiaddr;
+            wait_tout <= 'b0;
+        end else if (wait_left != 'b0) begin
+            wait_left <= wait_left - 1'b1;
+            wait_tout <= wait_left == 'b1;
+        end
+
+    function [CFGWBDATABITS-1:0] wait_word(input [CFGWBDATABITS-1:0] stat, input tout);
+        if (stat[`R_NBUSSTAT_DONE_SHIFT]) wait_word = stat;
+        else if (tout)                    wait_word = stat | `R_NBUSSTAT_TOUT_MASK;
+        else                              wait_word = 'b0;
+    endfunction
 
     // cfgwb control
+    // A CFG read frame reads consecutive registers, one per data word, as a
+    // memory read frame reads consecutive words. Like the memory reads, the
+    // next word is fetched ahead into cfgwb_dat_next during the stall phase
+    // and while the previous word shifts out, and moved to cfgwb_dat_q on the
+    // read request that starts its shift-out. A word that was not fetched in
+    // time (READ has no stall phase) goes to cfgwb_dat_q when it arrives.
+    // A read fetched ahead for a word the host never clocks out is dropped
+    // when CS is released, so no CFG cycle stays open into the next frame.
     assign o_cfgwb_rst = i_sysrst;
     reg cfg_req_read, cfg_req_write;
+    reg [CFGWBDATABITS-1:0] cfgwb_dat_next;
+    reg cfg_next_vld, cfg_late, cfg_cyc_read;
+    wire [CFGWBDATABITS-1:0] cfg_ack_dat = i_cfgwb_err ? 'b0 :
+                                           cmd_is_wait ? wait_word(i_cfgwb_dat, wait_tout) : i_cfgwb_dat;
+    wire cfg_reading = bus_is_cfg && !cmd_is_write && !cmd_is_loopback && !cmd_is_diff && !i_spirst &&
+                       ((i_spistate == `SPI_STATE_READ_DATA) || (i_spistate == `SPI_STATE_STALL));
+    wire cfg_shift   = cfg_reading && i_spistbrrq && (i_spistate == `SPI_STATE_READ_DATA);
     always @(posedge i_clk) begin
         cfg_req_read  <= 'b0;
         cfg_req_write <= 'b0;
         if (!o_cfgwb_cyc && !i_cfgwb_stall) begin
-            cfg_req_read  <= i_spistbrrq;
+            cfg_req_read  <= cfg_reading && !cfg_next_vld && !cfg_req_read;
             cfg_req_write <= i_spistbwrq;
         end
-        /*if (!o_cfgwb_cyc && !i_cfgwb_stall && i_spistb) begin
-            cfg_req_read  <= !cmd_is_write && (i_spistate == `SPI_STATE_ADDR);
-            cfg_req_write <=  cmd_is_write && (i_spistate == `SPI_STATE_WRITE_DATA);
-        end*/
     end
+    assign cfg_rd_issue = !o_cfgwb_rst && bus_is_cfg && !o_cfgwb_cyc && !i_cfgwb_stall && cfg_req_read && !cfg_req_write;
     always @(posedge i_clk) begin
         o_cfgwb_adr <= 'b0;
         o_cfgwb_dat <= 'b0;
         o_cfgwb_we  <= 'b0;
         o_cfgwb_stb <= 'b0;
-        if (o_cfgwb_rst || i_cfgwb_err) begin
+        if (o_cfgwb_rst || addr_latch) begin
+            // READ: the first read request comes with the address
+            cfg_next_vld <= 'b0;
+            cfg_late     <= !o_cfgwb_rst && cfg_shift;
+        end else if (cfg_shift) begin
+            cfg_next_vld <= 'b0;
+            cfg_late     <= !cfg_next_vld;
+            if (cfg_next_vld)
+                cfgwb_dat_q <= cfgwb_dat_next;
+        end
+        if (o_cfgwb_rst) begin
             o_cfgwb_cyc <= 'b0;
             cfgwb_dat_q <= 'b0;
-        end else if (bus_is_cfg) begin
-            if (!o_cfgwb_cyc && !i_cfgwb_stall && (cfg_req_read || cfg_req_write)) begin
-                o_cfgwb_cyc <= 'b1;
-                o_cfgwb_stb <= 'b1;
-                o_cfgwb_adr <= addr_count[CFGWBADDRBITS-1:0];
-                if (cfg_req_write) begin
-                    o_cfgwb_dat <= i_spidata;
-                    o_cfgwb_we  <= 'b1;
-                end else if (cfg_req_read) begin
-                    o_cfgwb_we  <= 'b0;
+        end else if (o_cfgwb_cyc && cfg_cyc_read && i_spirst) begin
+            // CS release ends the frame: drop a read fetched ahead for it
+            o_cfgwb_cyc <= 'b0;
+        end else if (o_cfgwb_cyc && (i_cfgwb_ack || i_cfgwb_err)) begin
+            // a read error reads as 0
+            o_cfgwb_cyc <= 'b0;
+            if (cfg_cyc_read && !addr_latch) begin
+                if (cfg_late || cfg_shift) begin
+                    cfgwb_dat_q    <= cfg_ack_dat;
+                    cfg_late       <= 'b0;
+                end else begin
+                    cfgwb_dat_next <= cfg_ack_dat;
+                    cfg_next_vld   <= 'b1;
                 end
-            end else if (o_cfgwb_cyc && i_cfgwb_ack) begin
-                o_cfgwb_cyc <= 'b0;
-                cfgwb_dat_q <= i_cfgwb_dat;
+            end
+        end else if (bus_is_cfg && !o_cfgwb_cyc && !i_cfgwb_stall && (cfg_req_read || cfg_req_write)) begin
+            o_cfgwb_cyc  <= 'b1;
+            o_cfgwb_stb  <= 'b1;
+            o_cfgwb_adr  <= cmd_is_wait ? `R_NBUSSTAT : addr_count[CFGWBADDRBITS-1:0];
+            cfg_cyc_read <= !cfg_req_write;
+            if (cfg_req_write) begin
+                o_cfgwb_dat <= i_spidata;
+                o_cfgwb_we  <= 'b1;
             end
         end
     end
@@ -153,13 +236,16 @@ module ctrl #(
     always @(*) memwb_req = memwb_write_req || memwb_read_req;
 
     // pipeline management
-    // Ack FIFO
+    // Ack FIFO. Reads are issued ahead of the SPI shift-out until the FIFO
+    // plus in-flight requests would overflow it, so PIPEDEPTH words can be
+    // prefetched during the stall phase and while earlier words shift out.
+    localparam PIPEBITS = $clog2(PIPEDEPTH);
     wire pipe_fifo_full, pipe_fifo_empty;
-    wire [4:0] pipe_fifo_filled;
+    wire [PIPEBITS:0] pipe_fifo_filled;
     reg  pipe_fifo_wr;
     wire pipe_fifo_rd;
     reg  [MEMWBDATABITS-1:0] pipe_fifo_wr_data;
-    fsfifo #(.WIDTH(MEMWBDATABITS), .DEPTH(16)) pipe_fifo (
+    fsfifo #(.WIDTH(MEMWBDATABITS), .DEPTH(PIPEDEPTH)) pipe_fifo (
         .clk_i(i_clk), .reset_i(i_sysrst || i_spirst),
         .full_o(pipe_fifo_full), .empty_o(pipe_fifo_empty),
         .filled_o(pipe_fifo_filled),
@@ -167,14 +253,24 @@ module ctrl #(
         .rd_i(pipe_fifo_rd), .rd_data_o(pipe_fifo_rd_data)
     );
 
-    assign pipe_fifo_rd = i_spistbrrq;
+    // A word that was not in the FIFO on its read request (READ has no stall
+    // phase to fetch the first one) is read out of it when it arrives.
+    reg pipe_late;
+    always @(posedge i_clk)
+        if (i_sysrst || i_spirst)
+            pipe_late <= 'b0;
+        else if (i_spistbrrq)
+            pipe_late <= pipe_fifo_empty && (i_spistate == `SPI_STATE_READ_DATA);
+        else if (!pipe_fifo_empty)
+            pipe_late <= 'b0;
+    assign pipe_fifo_rd = i_spistbrrq || (pipe_late && !pipe_fifo_empty);
 
-    // Read acks go to a 16-deep FIFO. FIFO filled + pending reqs must be <= 16 or data will be lost
-    reg  [4:0] pipe_inflight;
-    wire [4:0] pipe_total = pipe_fifo_filled + pipe_inflight + (pipe_fifo_wr?'b1:'b0);
+    // Read acks go to a PIPEDEPTH-deep FIFO. FIFO filled + pending reqs must be <= PIPEDEPTH or data will be lost
+    reg  [PIPEBITS:0] pipe_inflight;
+    wire [PIPEBITS:0] pipe_total = pipe_fifo_filled + pipe_inflight + (pipe_fifo_wr?'b1:'b0);
     wire inflight_empty = pipe_inflight == 'b0;
-    wire pipeline_full = pipe_total[4];
-    wire pipeline_almost_full = &pipe_total[3:0];
+    wire pipeline_full = pipe_total[PIPEBITS];
+    wire pipeline_almost_full = &pipe_total[PIPEBITS-1:0];
 
     // track inflight requests
     wire pipe_valid_wr = o_memwb_stb;
@@ -201,7 +297,7 @@ module ctrl #(
     // read request generation
     always @(posedge i_clk) begin
         memwb_read_req <= 'b0;
-        if (!bus_is_cfg && !pipeline_full && !(pipeline_almost_full && (stb_d || o_memwb_stb))) begin
+        if (!bus_is_cfg && !cmd_is_diff && !pipeline_full && !(pipeline_almost_full && (stb_d || o_memwb_stb))) begin
             if (!cmd_is_write && ((i_spistate == `SPI_STATE_READ_DATA) || (i_spistate == `SPI_STATE_STALL)) && !i_spirst) begin
                 memwb_read_req <= 'b1;
             end else if (i_spistbrrq)
@@ -213,6 +309,10 @@ module ctrl #(
     // Wishbone control
 
     always @(*) o_memwb_adr = memaddr;
+    // reads prefetch consecutive words until CS is released: an open-ended
+    // incrementing burst that ends by dropping cyc
+    always @(*) o_memwb_cti = cmd_is_write ? `WB_CTI_CLASSIC : `WB_CTI_INC;
+    assign o_memwb_bte = `WB_BTE_LINEAR;
     always @(posedge i_clk) begin
         pipe_fifo_wr      <= 'b0;
         pipe_fifo_wr_data <= 'b0;
@@ -228,7 +328,8 @@ module ctrl #(
                 pipe_fifo_wr_data <= i_memwb_dat;
             end
 
-            if (memwb_read_req && i_spirst) begin
+            // CS release ends the read burst, and aborts reads still queued
+            if (i_spirst && !cmd_is_write) begin
                 o_memwb_cyc <= 'b0;
                 o_memwb_dat <= 'b0;
             end else if (memwb_req && !i_memwb_stall) begin
@@ -2,6 +2,11 @@
  *
  * Parallel NOR bus with wishbone interface.
  *
+ * CFG accesses to an address that is not a nor_bus register get cfgwb_err_o
+ * for one clock, with the ack for addresses inside the nor_bus block. The
+ * error is not sticky (it was until reset): a read past the last register,
+ * such as a CFG burst fetching ahead, does not fail the accesses after it.
+ *
  */
 
 `include "busmap.vh"
@@ -13,7 +18,8 @@ module nor_bus #(
     parameter MEMWBADDRBITS = `NORADDRBITS,
     parameter MEMWBDATABITS = `NORDATABITS,
     parameter CFGWBADDRBITS = `CFGWBADDRBITS,
-    parameter CFGWBDATABITS = `CFGWBDATABITS
+    parameter CFGWBDATABITS = `CFGWBDATABITS,
+    parameter NORCHIPS      = `NOR_CHIPS
 ) (
     // system
     input                          sys_rst_i,
@@ -26,6 +32,8 @@ module nor_bus #(
     input                          memwb_we_i,
     input                          memwb_stb_i,
     input                          memwb_cyc_i,
+    input                    [2:0] memwb_cti_i,
+    input                    [1:0] memwb_bte_i,
     output                         memwb_err_o,
     output reg                     memwb_ack_o,
     output reg [MEMWBDATABITS-1:0] memwb_dat_o,
@@ -44,17 +52,22 @@ module nor_bus #(
     output                         cfgwb_stall_o,
 
     // NOR interface
-    input                          nor_ry_i,
+    input      [NORCHIPS-1:0]      nor_ry_i,
     input      [MEMWBDATABITS-1:0] nor_data_i,
     output reg [MEMWBDATABITS-1:0] nor_data_o,
     output reg [MEMWBADDRBITS-1:0] nor_addr_o,
-    output reg                     nor_ce_o,
+    output reg [NORCHIPS-1:0]      nor_ce_o,
     output reg                     nor_we_o,
     output reg                     nor_oe_o,
-    output reg                     nor_data_oe // 0 = input, 1 = output
+    output reg                     nor_data_oe, // 0 = input, 1 = output
+
+    // performance counter events, one clock each
+    output                         perf_rd_o,   // random read cycle
+    output                         perf_rdpg_o, // page mode read cycle
+    output                         perf_wr_o    // write cycle
 );
 
-    localparam REQBITS = MEMWBADDRBITS + MEMWBDATABITS + 1;
+    localparam REQBITS = MEMWBADDRBITS + MEMWBDATABITS + 6;
 
     reg cyc_read;
     always @(posedge sys_clk_i)
@@ -74,7 +87,7 @@ module nor_bus #(
     reg  [REQBITS-1:0] req_data0;
 
     wire               queue_wr = memwb_cyc_i && memwb_stb_i;
-    wire [REQBITS-1:0] queue_wr_data = { memwb_we_i, memwb_dat_i, memwb_adr_i };
+    wire [REQBITS-1:0] queue_wr_data = { memwb_cti_i, memwb_bte_i, memwb_we_i, memwb_dat_i, memwb_adr_i };
     wire               queue_full, queue_empty;
     queue2 #(.WIDTH(REQBITS)) inqueue (
         .i_clk(sys_clk_i), .i_rst(mod_reset),
@@ -88,7 +101,8 @@ module nor_bus #(
 
     nor_bus_driver #(
         .MEMWBADDRBITS(MEMWBADDRBITS), .MEMWBDATABITS(MEMWBDATABITS),
-        .CFGWBADDRBITS(CFGWBADDRBITS), .CFGWBDATABITS(CFGWBDATABITS)
+        .CFGWBADDRBITS(CFGWBADDRBITS), .CFGWBDATABITS(CFGWBDATABITS),
+        .NORCHIPS(NORCHIPS)
     ) nor_bus_driver (
         // wb
         //.rst_i(mod_reset), .clk_i(wb_clk_i), .addr_i(req_adr), .data_i(req_dat), .req_i(nor_req),
@@ -106,7 +120,9 @@ module nor_bus #(
         // nor
         .nor_ry_i(nor_ry_i), .nor_data_i(nor_data_i), .nor_data_o(nor_data_o),
         .nor_addr_o(nor_addr_o), .nor_ce_o(nor_ce_o), .nor_we_o(nor_we_o),
-        .nor_oe_o(nor_oe_o), .nor_data_oe(nor_data_oe)
+        .nor_oe_o(nor_oe_o), .nor_data_oe(nor_data_oe),
+        // perf
+        .perf_rd_o(perf_rd_o), .perf_rdpg_o(perf_rdpg_o), .perf_wr_o(perf_wr_o)
     );
 endmodule
 
@@ -115,6 +131,7 @@ module nor_bus_driver #(
     parameter MEMWBDATABITS = `NORDATABITS,
     parameter CFGWBADDRBITS = `CFGWBADDRBITS,
     parameter CFGWBDATABITS = `CFGWBDATABITS,
+    parameter NORCHIPS      = `NOR_CHIPS,
     parameter COUNTERBITS   = 8
 ) (
     // pseudo-wishbone interface
@@ -140,14 +157,19 @@ module nor_bus_driver #(
     output reg                     cfgwb_stall_o,
 
     // NOR interface
-    input                          nor_ry_i,
+    input      [NORCHIPS-1:0]      nor_ry_i,
     input      [MEMWBDATABITS-1:0] nor_data_i,
     output reg [MEMWBDATABITS-1:0] nor_data_o,
     output reg [MEMWBADDRBITS-1:0] nor_addr_o,
-    output reg                     nor_ce_o,
+    output reg [NORCHIPS-1:0]      nor_ce_o,
     output reg                     nor_we_o,
     output reg                     nor_oe_o,
-    output reg                     nor_data_oe // 0 = input, 1 = output
+    output reg                     nor_data_oe, // 0 = input, 1 = output
+
+    // performance counter events
+    output reg                     perf_rd_o,
+    output reg                     perf_rdpg_o,
+    output reg                     perf_wr_o
 );
 
     // registers
@@ -155,24 +177,30 @@ module nor_bus_driver #(
     reg [`CFGWBDATABITS-1:0] r_nbuswait0;
     reg [`CFGWBDATABITS-1:0] r_nbuswait1;
     // register bits
-    wire       r_nbusctrl_pgen          = (r_nbusctrl  & `R_NBUSCTRL_PGEN_MASK)          >> `R_NBUSCTRL_PGEN_SHIFT;
-    wire [7:0] r_nbuswait0_write_wait   = (r_nbuswait0 & `R_NBUSWAIT0_WRITE_WAIT_MASK)   >> `R_NBUSWAIT0_WRITE_WAIT_SHIFT;
-    wire [7:0] r_nbuswait0_readdly_wait = (r_nbuswait0 & `R_NBUSWAIT0_READDLY_WAIT_MASK) >> `R_NBUSWAIT0_READDLY_WAIT_SHIFT;
-    wire [7:0] r_nbuswait1_read_wait    = (r_nbuswait1 & `R_NBUSWAIT1_READ_WAIT_MASK)    >> `R_NBUSWAIT1_READ_WAIT_SHIFT;
-    wire [7:0] r_nbuswait1_readpg_wait  = (r_nbuswait1 & `R_NBUSWAIT1_READPG_WAIT_MASK)  >> `R_NBUSWAIT1_READPG_WAIT_SHIFT;
+    wire       r_nbusctrl_pgen          = r_nbusctrl[`R_NBUSCTRL_PGEN_SHIFT];
+    wire       r_nbusctrl_ilv           = r_nbusctrl[`R_NBUSCTRL_ILV_SHIFT];
+    wire [1:0] r_nbusctrl_vote          = r_nbusctrl[`R_NBUSCTRL_VOTE_SHIFT +: 2];
+    wire [7:0] r_nbuswait0_write_wait   = r_nbuswait0[`R_NBUSWAIT0_WRITE_WAIT_SHIFT +: 8];
+    wire [7:0] r_nbuswait0_readdly_wait = r_nbuswait0[`R_NBUSWAIT0_READDLY_WAIT_SHIFT +: 8];
+    wire [7:0] r_nbuswait1_read_wait    = r_nbuswait1[`R_NBUSWAIT1_READ_WAIT_SHIFT +: 8];
+    wire [7:0] r_nbuswait1_readpg_wait  = r_nbuswait1[`R_NBUSWAIT1_READPG_WAIT_SHIFT +: 8];
+    // status (see NOR status below)
+    wire                     ry;
+    reg                      r_done;
+    reg               [31:0] r_busy;
+    reg               [15:0] r_voteerr;
     // cfg read/write
     wire [`CFGWBADDRBITS-1:0] cfgwb_adr_mod = cfgwb_adr_i & `CFGWBMODMASK;
     always @(posedge clk_i) begin
         cfgwb_ack_o   <= 'b0;
         cfgwb_dat_o   <= 'b0;
         cfgwb_stall_o <= 'b0;
+        cfgwb_err_o   <= 'b0;
         if (cfgwb_rst_i) begin
             // regs
             r_nbusctrl  <= `R_NBUSCTRL_RST_VAL;
             r_nbuswait0 <= `R_NBUSWAIT0_RST_VAL;
             r_nbuswait1 <= `R_NBUSWAIT1_RST_VAL;
-            // wb
-            cfgwb_err_o <= 'b0;
         end if (cfgwb_cyc_i && cfgwb_stb_i) begin
             if (cfgwb_adr_mod == `NBUSADDRBASE) begin
                 cfgwb_ack_o <= 'b1;
@@ -181,6 +209,8 @@ module nor_bus_driver #(
                         `R_NBUSCTRL:  r_nbusctrl  <= cfgwb_dat_i;
                         `R_NBUSWAIT0: r_nbuswait0 <= cfgwb_dat_i;
                         `R_NBUSWAIT1: r_nbuswait1 <= cfgwb_dat_i;
+                        `R_NBUSSTAT:  ; // DONE write 1 to clear, below
+                        `R_NBUSVOTEERR: ; // clears, below
                         default:      cfgwb_err_o <= 'b1;
                     endcase
                 end else begin
@@ -188,6 +218,11 @@ module nor_bus_driver #(
                         `R_NBUSCTRL:  cfgwb_dat_o <= r_nbusctrl;
                         `R_NBUSWAIT0: cfgwb_dat_o <= r_nbuswait0;
                         `R_NBUSWAIT1: cfgwb_dat_o <= r_nbuswait1;
+                        `R_NBUSSTAT:  cfgwb_dat_o <= (ry     ? `R_NBUSSTAT_RY_MASK   : 16'h0) |
+                                                     (r_done ? `R_NBUSSTAT_DONE_MASK : 16'h0);
+                        `R_NBUSBUSYL: cfgwb_dat_o <= r_busy[15:0];
+                        `R_NBUSBUSYH: cfgwb_dat_o <= r_busy[31:16];
+                        `R_NBUSVOTEERR: cfgwb_dat_o <= r_voteerr;
                         default:      cfgwb_err_o <= 'b1;
                     endcase
                 end
@@ -198,24 +233,76 @@ module nor_bus_driver #(
     end
 
     // unpack reqs
-    localparam REQBITS = MEMWBADDRBITS + MEMWBDATABITS + 1;
+    localparam REQBITS = MEMWBADDRBITS + MEMWBDATABITS + 6;
+    wire               [2:0] req_cti;
+    wire               [1:0] req_bte;
     wire                     req_we;
     wire [MEMWBADDRBITS-1:0] req_addr;
     wire [MEMWBDATABITS-1:0] req_data;
-    assign { req_we, req_data, req_addr } = req_i;
+    assign { req_cti, req_bte, req_we, req_data, req_addr } = req_i;
+    wire               [2:0] req_next_cti;
+    wire               [1:0] req_next_bte;
     wire                     req_next_we;
     wire [MEMWBADDRBITS-1:0] req_next_addr;
     wire [MEMWBDATABITS-1:0] req_next_data;
-    assign { req_next_we, req_next_data, req_next_addr } = req_next_i;
+    assign { req_next_cti, req_next_bte, req_next_we, req_next_data, req_next_addr } = req_next_i;
+
+    // chip select decode
+    // The address space is split over NORCHIPS devices, either in banks by the
+    // top address bits or interleaved page by page (R_NBUSCTRL.ILV) so that
+    // consecutive pages alternate devices. The chip bits are removed from the
+    // device address. The bus never waits for RY, so a program or erase on one
+    // device overlaps any access to the others.
+    localparam CHIPBITS = NORCHIPS > 1 ? $clog2(NORCHIPS) : 1;
+    localparam PAGEBITS = 3;
+
+    function [CHIPBITS-1:0] chip_of(input [MEMWBADDRBITS-1:0] addr, input ilv);
+        if (NORCHIPS == 1) chip_of = 'b0;
+        else if (ilv)      chip_of = addr[PAGEBITS +: CHIPBITS];
+        else               chip_of = addr[MEMWBADDRBITS-1 -: CHIPBITS];
+    endfunction
+
+    function [MEMWBADDRBITS-1:0] chip_addr(input [MEMWBADDRBITS-1:0] addr, input ilv);
+        if (NORCHIPS == 1) chip_addr = addr;
+        else if (ilv)      chip_addr = ((addr >> (PAGEBITS + CHIPBITS)) << PAGEBITS) | (addr & ((1 << PAGEBITS) - 1));
+        else               chip_addr = addr & ({MEMWBADDRBITS{1'b1}} >> CHIPBITS);
+    endfunction
 
     // transaction chaining logic
     // Reads may be chained. CE and OE are asserted throughout, only address changes.
-    // Writes are never chained. Reads and writes are never chained.
+    // Writes are never chained. Reads and writes are never chained. Reads on
+    // different chips are never chained.
     wire [MEMWBADDRBITS-1:0] req_addr_pg      = req_addr      >> 3;
     wire [MEMWBADDRBITS-1:0] req_next_addr_pg = req_next_addr >> 3;
-    wire next_read = req_valid_i[1] && !req_next_we && !req_we;
+    wire next_read = req_valid_i[1] && !req_next_we && !req_we &&
+                     (chip_of(req_addr, r_nbusctrl_ilv) == chip_of(req_next_addr, r_nbusctrl_ilv));
     wire next_read_page = next_read && (req_addr_pg == req_next_addr_pg);
 
+    // incrementing bursts
+    // A read with CTI = incrementing announces the address of the next one, so
+    // it goes out on the bus as this word is acked instead of after the
+    // request has passed the queue, and the next wait is two clocks shorter
+    // for the same address to data time. That word is acked once its request
+    // arrives; a request that does not continue the burst ends the transaction
+    // unacked and starts over.
+    function [MEMWBADDRBITS-1:0] burst_inc(input [MEMWBADDRBITS-1:0] addr, input [1:0] bte);
+        case (bte)
+            `WB_BTE_WRAP4:  burst_inc = {addr[MEMWBADDRBITS-1:2], addr[1:0] + 2'd1};
+            `WB_BTE_WRAP8:  burst_inc = {addr[MEMWBADDRBITS-1:3], addr[2:0] + 3'd1};
+            `WB_BTE_WRAP16: burst_inc = {addr[MEMWBADDRBITS-1:4], addr[3:0] + 4'd1};
+            default:        burst_inc = addr + 1'b1;
+        endcase
+    endfunction
+
+    wire [MEMWBADDRBITS-1:0] burst_addr = burst_inc(req_addr, req_bte);
+    wire burst_next = !req_we && (req_cti == `WB_CTI_INC) &&
+                      (chip_of(req_addr, r_nbusctrl_ilv) == chip_of(burst_addr, r_nbusctrl_ilv));
+    wire burst_page = (burst_addr >> 3) == req_addr_pg;
+    reg                      bst;      // bus shows bst_addr ahead of its request
+    reg  [MEMWBADDRBITS-1:0] bst_addr;
+    wire bst_wait = bst && !req_valid_i[0];
+    wire bst_miss = bst && req_valid_i[0] && (req_we || (req_addr != bst_addr));
+
     // local
     reg [2:0] state, next_state;
 
@@ -235,17 +322,20 @@ module nor_bus_driver #(
     always @(posedge clk_i) counter_rst <= counter_stb;
     upcounter #(.BITS(COUNTERBITS)) wait_counter (
         .i_clk(clk_i), .i_rst(rst_i),
-        .i_load(counter_rst), .i_en(1'b1),
+        .i_load(counter_rst), .i_en(~&counter), // saturates while a burst waits for its request
         .i_load_val('b0), .o_count(counter)
     );
+    // read waits, shortened when the address went out early
+    wire [COUNTERBITS-1:0] read_wait   = bst ? (r_nbuswait1_read_wait   > 2 ? r_nbuswait1_read_wait   - 2 : 0) : r_nbuswait1_read_wait;
+    wire [COUNTERBITS-1:0] readpg_wait = bst ? (r_nbuswait1_readpg_wait > 2 ? r_nbuswait1_readpg_wait - 2 : 0) : r_nbuswait1_readpg_wait;
     // counter strobe
     always @(*) begin
         counter_stb = 'b1;
         if (busy_o) case(state)
             NOR_WRITE:   counter_stb = counter == r_nbuswait0_write_wait;
             NOR_READDLY: counter_stb = counter == r_nbuswait0_readdly_wait;
-            NOR_READ:    counter_stb = counter == r_nbuswait1_read_wait;
-            NOR_READPG:  counter_stb = counter == r_nbuswait1_readpg_wait;
+            NOR_READ:    counter_stb = counter >= read_wait   && !counter_rst && !bst_wait;
+            NOR_READPG:  counter_stb = counter >= readpg_wait && !counter_rst && !bst_wait;
             NOR_TXN_END: counter_stb = counter == END_WAIT_COUNT;
             default:     counter_stb = 'b1;
         endcase
@@ -255,8 +345,11 @@ module nor_bus_driver #(
         NOR_IDLE:    next_state = req_valid_i[0] ? (req_we         ? NOR_WRITE  : NOR_READDLY) : NOR_IDLE;
         NOR_WRITE:   next_state = NOR_TXN_END;
         NOR_READDLY: next_state = NOR_READ;
-        NOR_READ:    next_state = next_read      ? (next_read_page ? NOR_READPG : NOR_READ)    : NOR_TXN_END;
-        NOR_READPG:  next_state = next_read      ? (next_read_page ? NOR_READPG : NOR_READ)    : NOR_TXN_END;
+        NOR_READ,
+        NOR_READPG:  next_state = bst_miss       ? NOR_TXN_END :
+                                  vote_more      ? NOR_READPG  :
+                                  burst_next     ? (burst_page     ? NOR_READPG : NOR_READ)    :
+                                  next_read      ? (next_read_page ? NOR_READPG : NOR_READ)    : NOR_TXN_END;
         NOR_TXN_END: next_state = NOR_IDLE;
         default:     next_state = NOR_IDLE;
     endcase
@@ -268,20 +361,117 @@ module nor_bus_driver #(
             state <= next_state;
     end
 
+    // majority vote
+    // With R_NBUSCTRL.VOTE = n every word read is sampled 2n+1 times and acked
+    // with the bitwise majority of the samples. The first sample has the usual
+    // read timing. For each repeat the address steps to the other word of its
+    // pair for one clock and back, and the sample is taken a page read wait
+    // after the return. That is a page mode access: the device drives the word
+    // again from the page latched by the first read, without sensing the array
+    // again, so the vote rejects errors on the output path, not in the cells.
+    // VOTEERR counts the words whose samples were not all equal (saturating,
+    // write to clear).
+    localparam VOTEBITS = 3;
+    wire                              read_state = (state == NOR_READ) || (state == NOR_READPG);
+    wire                              vote_on    = r_nbusctrl_vote != 'b0;
+    reg              [VOTEBITS-1:0]   vote_left;  // samples after the next one
+    reg  [VOTEBITS*MEMWBDATABITS-1:0] vote_cnt;   // ones per bit
+    reg  [VOTEBITS*MEMWBDATABITS-1:0] vote_cnt_d; // including this sample
+    reg         [MEMWBDATABITS-1:0]   vote_first;
+    reg         [MEMWBDATABITS-1:0]   vote_maj;
+    reg                               vote_diff;
+    reg                               vote_tgl;   // repeat: address to the pair word
+    wire                              vote_more  = vote_left != 'b0;
+    wire                              vote_start = vote_left == {r_nbusctrl_vote, 1'b0};
+    wire                              sample     = counter_stb && read_state && !bst_miss;
+    wire                              vote_diff_d = vote_diff || (!vote_start && (nor_data_i != vote_first));
+
+    integer b;
+    always @(*)
+        for (b = 0; b < MEMWBDATABITS; b = b + 1) begin
+            vote_cnt_d[VOTEBITS*b +: VOTEBITS] = vote_cnt[VOTEBITS*b +: VOTEBITS] + nor_data_i[b];
+            vote_maj[b] = vote_cnt_d[VOTEBITS*b +: VOTEBITS] > {1'b0, r_nbusctrl_vote};
+        end
+
+    always @(posedge clk_i) begin
+        vote_tgl <= sample && vote_more;
+        if (rst_i || !read_state || (counter_stb && (bst_miss || !vote_more))) begin
+            vote_left <= {r_nbusctrl_vote, 1'b0};
+            vote_cnt  <= 'b0;
+            vote_diff <= 'b0;
+        end else if (sample) begin
+            vote_left <= vote_left - 1'b1;
+            vote_cnt  <= vote_cnt_d;
+            vote_diff <= vote_diff_d;
+        end
+        if (sample && vote_start)
+            vote_first <= nor_data_i;
+    end
+
+    wire voteerr_clr = cfgwb_cyc_i && cfgwb_stb_i && cfgwb_we_i && (cfgwb_adr_i == `R_NBUSVOTEERR);
+    always @(posedge clk_i)
+        if (cfgwb_rst_i || voteerr_clr)
+            r_voteerr <= 'b0;
+        else if (sample && !vote_more && vote_on && vote_diff_d && ~&r_voteerr)
+            r_voteerr <= r_voteerr + 1'b1;
+
+    // NOR status
+    // ry is the RY of all chips. DONE is set when it rises, i.e. a program or
+    // erase completed, and cleared by every NOR write cycle (the next command)
+    // and by writing it 1, so a host that waits for DONE after its last
+    // command cycle cannot see the ready state from before the device went
+    // busy. BUSY counts the clocks RY is low, from the start of the last busy
+    // period, saturating.
+    sync2ps #(.R(1)) sync_ry (.clk(clk_i), .rst(cfgwb_rst_i), .d(&nor_ry_i), .q(ry));
+    reg  ry_q;
+    wire done_clr = cfgwb_cyc_i && cfgwb_stb_i && cfgwb_we_i && (cfgwb_adr_i == `R_NBUSSTAT) &&
+                    cfgwb_dat_i[`R_NBUSSTAT_DONE_SHIFT];
+    always @(posedge clk_i) begin
+        ry_q <= ry;
+        if (cfgwb_rst_i) begin
+            ry_q   <= 'b1;
+            r_done <= 'b0;
+            r_busy <= 'b0;
+        end else begin
+            if (done_clr || (state == NOR_WRITE))
+                r_done <= 'b0;
+            else if (ry && !ry_q)
+                r_done <= 'b1;
+            if (!ry && ry_q)
+                r_busy <= 'b1;
+            else if (!ry && ~&r_busy)
+                r_busy <= r_busy + 1'b1;
+        end
+    end
+
     reg                      nor_data_oe_d, nor_ce_d, nor_we_d, nor_oe_d;
     reg                      ack_d;
     reg  [MEMWBDATABITS-1:0] data_d;
     reg  [MEMWBDATABITS-1:0] nor_data_d;
     reg  [MEMWBADDRBITS-1:0] nor_addr_d;
+    wire      [NORCHIPS-1:0] nor_chip_d = 1 << chip_of(nor_addr_d, r_nbusctrl_ilv);
 
     always @(*) nor_data_oe_d = !nor_we_d;
     always @(*) busy_o      = state != NOR_IDLE;
-    always @(*) ack_d       = counter_stb && ( (state == NOR_WRITE) || (state == NOR_READ) || (state == NOR_READPG) );
-    always @(*) data_d      = nor_data_i;
+    always @(*) ack_d       = counter_stb && ( (state == NOR_WRITE) || (read_state && !bst_miss && !vote_more) );
+    always @(*) data_d      = vote_on ? vote_maj : nor_data_i;
 
     always @(*) begin
         nor_data_d = req_valid_i[0] ? req_data : 'b0;
-        nor_addr_d = req_valid_i[0] ? req_addr : 'b0;
+        nor_addr_d = (ack_d && burst_next) ? burst_addr :
+                     bst                   ? bst_addr   :
+                     req_valid_i[0]        ? req_addr   : 'b0;
+        if (vote_tgl)
+            nor_addr_d[0] = !nor_addr_d[0];
+    end
+
+    always @(posedge clk_i) begin
+        if (rst_i || !((state == NOR_READ) || (state == NOR_READPG)))
+            bst <= 'b0;
+        else if (counter_stb)
+            bst <= ack_d && burst_next;
+        if (ack_d && burst_next)
+            bst_addr <= burst_addr;
     end
 
     always @(*) begin
@@ -296,11 +486,18 @@ module nor_bus_driver #(
         ack_o <= ack_d;
         data_o <= data_d;
         nor_data_o <= nor_data_d;
-        nor_addr_o <= nor_addr_d;
-        nor_ce_o <= nor_ce_d;
+        nor_addr_o <= chip_addr(nor_addr_d, r_nbusctrl_ilv);
+        nor_ce_o <= nor_ce_d ? {NORCHIPS{1'b1}} : ~nor_chip_d;
         nor_we_o <= nor_we_d;
         nor_oe_o <= nor_oe_d;
     end
 
+    // perf events: every bus cycle, vote repeats included
+    always @(posedge clk_i) begin
+        perf_rd_o   <= sample && (state == NOR_READ);
+        perf_rdpg_o <= sample && (state == NOR_READPG);
+        perf_wr_o   <= counter_stb && (state == NOR_WRITE);
+    end
+
 endmodule
 
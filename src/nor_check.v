@@ -0,0 +1,290 @@
+/** nor_check.v
+ *
+ * In-bridge NOR range check engine.
+ *
+ * Reads a range of NOR words over the memory wishbone bus at full nor_bus
+ * (page mode) speed and reduces it to a single result, so the host only has
+ * to fetch a few CFG registers instead of streaming the whole range back.
+ *
+ * Modes (R_NCHKCTRL.MODE):
+ *     CRC    CRC-32 (IEEE 802.3, reflected, same as zlib.crc32) over the words
+ *            as little-endian bytes. Result is the final CRC.
+ *     BLANK  Stops at the first word that is not 16'hFFFF. STAT.FOUND is set
+ *            and the result is the offending NOR address.
+ *     DIFF   Compares every word against the pattern in R_NCHKPAT{A,B,M}
+ *            and queues an (address, data) record for each mismatch, then an
+ *            end record with the mismatch count, for the host to stream out
+ *            with DIFF_READ (see cmd_defs.vh). STAT.FOUND is set if there was
+ *            a mismatch, the result is the count and STAT.DONE is set once
+ *            the end record is queued. Reads pause while the record FIFO
+ *            could not take the records of the reads in flight.
+ *
+ * The range is set by R_NCHKADDR{L,H} (start) and R_NCHKLEN{L,H} (word
+ * count). Writing R_NCHKCTRL with START set begins the check; STAT.BUSY is
+ * held until it completes and STAT.DONE is set afterwards. While busy the
+ * engine owns the memory wishbone bus (see busy_o).
+ *
+ */
+
+`include "busmap.vh"
+`include "cmd_defs.vh"
+
+`default_nettype none
+`timescale 1ns/10ps
+
+module nor_check #(
+    parameter MEMWBADDRBITS = `NORADDRBITS,
+    parameter MEMWBDATABITS = `NORDATABITS,
+    parameter CFGWBADDRBITS = `CFGWBADDRBITS,
+    parameter CFGWBDATABITS = `CFGWBDATABITS,
+    parameter DIFFDEPTH     = 16 // DIFF records queued
+) (
+    // system
+    input                          sys_rst_i,
+    input                          sys_clk_i,
+
+    // cfg wishbone interface
+    input                          cfgwb_rst_i,
+    input      [CFGWBADDRBITS-1:0] cfgwb_adr_i,
+    input      [CFGWBDATABITS-1:0] cfgwb_dat_i,
+    input                          cfgwb_we_i,
+    input                          cfgwb_stb_i,
+    input                          cfgwb_cyc_i,
+    output reg                     cfgwb_err_o,
+    output reg                     cfgwb_ack_o,
+    output reg [CFGWBDATABITS-1:0] cfgwb_dat_o,
+    output                         cfgwb_stall_o,
+
+    // memory wishbone interface (master)
+    output reg                     memwb_cyc_o,
+    output                         memwb_stb_o,
+    output                         memwb_we_o,
+    output                   [2:0] memwb_cti_o,
+    output                   [1:0] memwb_bte_o,
+    output     [MEMWBADDRBITS-1:0] memwb_adr_o,
+    output     [MEMWBDATABITS-1:0] memwb_dat_o,
+    input                          memwb_err_i,
+    input                          memwb_ack_i,
+    input                          memwb_stall_i,
+    input      [MEMWBDATABITS-1:0] memwb_dat_i,
+
+    // engine owns the memory bus
+    output                         busy_o,
+
+    // DIFF record stream (DIFF_READ frames, see ctrl.v)
+    input                          diff_rd_i,  // load the next stream word into diff_dat_o
+    input                          diff_end_i, // frame end: diff_dat_o was not shifted out
+    output reg [MEMWBDATABITS-1:0] diff_dat_o
+);
+
+    localparam LENBITS  = MEMWBADDRBITS + 1;
+    localparam DIFFBITS = $clog2(DIFFDEPTH);
+
+    // CRC-32, one 16-bit word (two little-endian bytes, LSB first) per call
+    function [31:0] crc32_word(input [31:0] crc, input [15:0] data);
+        integer i;
+        begin
+            crc32_word = crc;
+            for (i = 0; i < 16; i = i + 1)
+                crc32_word = (crc32_word >> 1) ^ ((crc32_word[0] ^ data[i]) ? 32'hEDB88320 : 32'h0);
+        end
+    endfunction
+
+    // registers
+    reg  [1:0] r_mode;
+    reg [31:0] r_addr;
+    reg [31:0] r_len;
+    reg [31:0] r_res;
+    reg [15:0] r_pata, r_patb, r_patm;
+    reg        r_done, r_found;
+
+    wire start = cfgwb_cyc_i && cfgwb_stb_i && cfgwb_we_i && (cfgwb_adr_i == `R_NCHKCTRL) &&
+                 cfgwb_dat_i[`R_NCHKCTRL_START_SHIFT] && !busy_o;
+
+    // cfg read/write
+    assign cfgwb_stall_o = 'b0;
+    always @(posedge sys_clk_i) begin
+        cfgwb_ack_o <= 'b0;
+        cfgwb_dat_o <= 'b0;
+        cfgwb_err_o <= 'b0;
+        if (cfgwb_rst_i) begin
+            r_mode      <= `R_NCHKCTRL_MODE_CRC;
+            r_addr      <= 'b0;
+            r_len       <= 'b0;
+            r_pata      <= `R_NCHKPATA_RST_VAL;
+            r_patb      <= `R_NCHKPATB_RST_VAL;
+            r_patm      <= `R_NCHKPATM_RST_VAL;
+        end else if (cfgwb_cyc_i && cfgwb_stb_i) begin
+            cfgwb_ack_o <= 'b1;
+            if (cfgwb_we_i) begin
+                case (cfgwb_adr_i)
+                    `R_NCHKCTRL:  if (!busy_o) r_mode <= cfgwb_dat_i[`R_NCHKCTRL_MODE_SHIFT +: 2];
+                    `R_NCHKADDRL: r_addr[15:0]  <= cfgwb_dat_i;
+                    `R_NCHKADDRH: r_addr[31:16] <= cfgwb_dat_i;
+                    `R_NCHKLENL:  r_len[15:0]   <= cfgwb_dat_i;
+                    `R_NCHKLENH:  r_len[31:16]  <= cfgwb_dat_i;
+                    `R_NCHKPATA:  r_pata        <= cfgwb_dat_i;
+                    `R_NCHKPATB:  r_patb        <= cfgwb_dat_i;
+                    `R_NCHKPATM:  r_patm        <= cfgwb_dat_i;
+                    default:      cfgwb_err_o   <= 'b1;
+                endcase
+            end else begin
+                case (cfgwb_adr_i)
+                    `R_NCHKCTRL:  cfgwb_dat_o <= {{(CFGWBDATABITS-2){1'b0}}, r_mode} << `R_NCHKCTRL_MODE_SHIFT;
+                    `R_NCHKSTAT:  cfgwb_dat_o <= ((busy_o || diff_term) ? `R_NCHKSTAT_BUSY_MASK  : 16'h0) |
+                                                 (r_done                ? `R_NCHKSTAT_DONE_MASK  : 16'h0) |
+                                                 (r_found               ? `R_NCHKSTAT_FOUND_MASK : 16'h0);
+                    `R_NCHKADDRL: cfgwb_dat_o <= r_addr[15:0];
+                    `R_NCHKADDRH: cfgwb_dat_o <= r_addr[31:16];
+                    `R_NCHKLENL:  cfgwb_dat_o <= r_len[15:0];
+                    `R_NCHKLENH:  cfgwb_dat_o <= r_len[31:16];
+                    `R_NCHKRESL:  cfgwb_dat_o <= r_res[15:0];
+                    `R_NCHKRESH:  cfgwb_dat_o <= r_res[31:16];
+                    `R_NCHKPATA:  cfgwb_dat_o <= r_pata;
+                    `R_NCHKPATB:  cfgwb_dat_o <= r_patb;
+                    `R_NCHKPATM:  cfgwb_dat_o <= r_patm;
+                    default:      cfgwb_err_o <= 'b1;
+                endcase
+            end
+        end
+    end
+
+    // engine
+    reg [MEMWBADDRBITS-1:0] req_addr, ack_addr;
+    reg       [LENBITS-1:0] req_left, ack_left;
+    reg              [31:0] crc;
+    wire             [31:0] crc_next = crc32_word(crc, memwb_dat_i);
+    wire                    ack_blank = memwb_dat_i == {(MEMWBDATABITS){1'b1}};
+    wire                    is_diff   = r_mode == `R_NCHKCTRL_MODE_DIFF;
+    wire [MEMWBDATABITS-1:0] ack_exp  = (^(ack_addr[15:0] & r_patm)) ? r_patb : r_pata;
+    wire                    ack_diff  = is_diff && (memwb_dat_i != ack_exp);
+
+    // DIFF record FIFO, one entry per record (block RAM, registered read).
+    // The stream side reads it a word at a time; the word last loaded into
+    // diff_dat_o is taken back if the frame ends before it was shifted out,
+    // so its entry stays allocated until then.
+    reg [3*MEMWBDATABITS-1:0] diff_mem [0:DIFFDEPTH-1];
+    reg [3*MEMWBDATABITS-1:0] diff_q;    // entry at diff_rd
+    reg        [DIFFBITS:0]   diff_wr, diff_wr_q, diff_rd;
+    reg               [1:0]   diff_ph;   // next word of the entry at diff_rd
+    reg                       diff_held; // diff_dat_o came from the FIFO
+    reg                       diff_term; // end record to queue
+    wire       [DIFFBITS:0]   diff_cm    = diff_rd - (diff_held && diff_ph == 'b0);
+    wire       [DIFFBITS:0]   diff_room  = DIFFDEPTH - (diff_wr - diff_cm);
+    wire                      diff_empty = diff_wr_q == diff_rd; // diff_q lags a write by a clock
+    wire      [LENBITS-1:0]   inflight   = ack_left - req_left;
+    wire                      diff_push_end = diff_term && (diff_room != 'b0);
+    wire                      diff_push_rec = memwb_cyc_o && !diff_term && memwb_ack_i && !memwb_err_i && ack_diff;
+    // r_done before the end record is queued: aborted on a bus error
+    wire [MEMWBDATABITS-1:0]  rec_tag    = diff_term ? (`DIFF_TAG_END | (r_done ? `DIFF_END_ERR_MASK : 16'h0000)) :
+                                                       (`DIFF_TAG_REC | {{(MEMWBDATABITS+16-MEMWBADDRBITS){1'b0}}, ack_addr[MEMWBADDRBITS-1:16]});
+    wire [3*MEMWBDATABITS-1:0] diff_rec  = diff_term ? {rec_tag, r_res[31:16], r_res[15:0]} :
+                                                       {rec_tag, ack_addr[15:0], memwb_dat_i};
+
+    always @(posedge sys_clk_i) begin
+        if (diff_push_rec || diff_push_end)
+            diff_mem[diff_wr[DIFFBITS-1:0]] <= diff_rec;
+        diff_q    <= diff_mem[diff_rd[DIFFBITS-1:0]];
+        diff_wr_q <= (sys_rst_i || start) ? 'b0 : diff_wr;
+    end
+
+    assign busy_o      = memwb_cyc_o;
+    assign memwb_we_o  = 'b0;
+    assign memwb_dat_o = 'b0;
+    assign memwb_adr_o = req_addr;
+    assign memwb_cti_o = (req_left == 'b1) ? `WB_CTI_END : `WB_CTI_INC;
+    assign memwb_bte_o = `WB_BTE_LINEAR;
+    assign memwb_stb_o = memwb_cyc_o && (req_left != 'b0) && !memwb_stall_i && (!is_diff || ({{(LENBITS-DIFFBITS-1){1'b0}}, diff_room} > inflight));
+
+    always @(posedge sys_clk_i) begin
+        if (sys_rst_i) begin
+            memwb_cyc_o <= 'b0;
+            r_done      <= 'b0;
+            r_found     <= 'b0;
+            r_res       <= 'b0;
+            diff_wr     <= 'b0;
+            diff_term   <= 'b0;
+        end else if (start) begin
+            req_addr    <= r_addr[MEMWBADDRBITS-1:0];
+            ack_addr    <= r_addr[MEMWBADDRBITS-1:0];
+            req_left    <= r_len[LENBITS-1:0];
+            ack_left    <= r_len[LENBITS-1:0];
+            crc         <= 32'hFFFFFFFF;
+            r_done      <= (r_len[LENBITS-1:0] == 'b0) && !is_diff;
+            r_found     <= 'b0;
+            r_res       <= 'b0;
+            memwb_cyc_o <= r_len[LENBITS-1:0] != 'b0;
+            diff_wr     <= 'b0;
+            diff_term   <= (r_len[LENBITS-1:0] == 'b0) && is_diff;
+        end else if (diff_term) begin
+            if (diff_push_end) begin
+                diff_wr   <= diff_wr + 'b1;
+                diff_term <= 'b0;
+                r_done    <= 'b1;
+            end
+        end else if (memwb_cyc_o) begin
+            if (memwb_stb_o) begin
+                req_addr <= req_addr + 'b1;
+                req_left <= req_left - 'b1;
+            end
+            if (memwb_err_i) begin
+                // give up, nothing sensible to report (DIFF: an end record
+                // with ERR set)
+                memwb_cyc_o <= 'b0;
+                r_done      <= 'b1;
+                diff_term   <= is_diff;
+            end else if (memwb_ack_i) begin
+                ack_addr <= ack_addr + 'b1;
+                ack_left <= ack_left - 'b1;
+                crc      <= crc_next;
+                if (diff_push_rec) begin
+                    diff_wr <= diff_wr + 'b1;
+                    r_found <= 'b1;
+                    r_res   <= r_res + 'b1;
+                end
+                if (r_mode == `R_NCHKCTRL_MODE_BLANK && !ack_blank) begin
+                    // dropping cyc aborts any reads still queued in nor_bus
+                    memwb_cyc_o <= 'b0;
+                    r_done      <= 'b1;
+                    r_found     <= 'b1;
+                    r_res       <= {{(32-MEMWBADDRBITS){1'b0}}, ack_addr};
+                end else if (ack_left == 'b1) begin
+                    memwb_cyc_o <= 'b0;
+                    if (is_diff)
+                        diff_term <= 'b1;
+                    else begin
+                        r_done  <= 'b1;
+                        r_res   <= (r_mode == `R_NCHKCTRL_MODE_CRC) ? ~crc_next : 'b0;
+                    end
+                end
+            end
+        end
+    end
+
+    // DIFF stream side
+    always @(posedge sys_clk_i)
+        if (sys_rst_i || start) begin
+            diff_rd    <= 'b0;
+            diff_ph    <= 'b0;
+            diff_held  <= 'b0;
+            diff_dat_o <= 'b0;
+        end else if (diff_rd_i) begin
+            diff_held  <= !diff_empty;
+            diff_dat_o <= 'b0;
+            if (!diff_empty) begin
+                // word diff_ph of the entry, the first one in the top bits
+                diff_dat_o <= (diff_ph == 'd0) ? diff_q[2*MEMWBDATABITS +: MEMWBDATABITS] :
+                              (diff_ph == 'd1) ? diff_q[MEMWBDATABITS +: MEMWBDATABITS] :
+                                                 diff_q[0 +: MEMWBDATABITS];
+                diff_ph    <= (diff_ph == 'd2) ? 'b0 : diff_ph + 'b1;
+                if (diff_ph == 'd2)
+                    diff_rd <= diff_rd + 'b1;
+            end
+        end else if (diff_end_i && diff_held) begin
+            diff_held <= 'b0;
+            diff_ph   <= (diff_ph == 'b0) ? 'd2 : diff_ph - 'b1;
+            if (diff_ph == 'b0)
+                diff_rd <= diff_rd - 'b1;
+        end
+
+endmodule
@@ -0,0 +1,136 @@
+/** perf.v
+ *
+ * Performance counters.
+ *
+ * PERF_COUNTERS free-running 32-bit event counters (PERF_CNT_* in busmap.vh):
+ * bridge clocks, QSPI frames by command, NOR read cycles (random and page
+ * mode, majority-vote repeats included), NOR write cycles, memory wishbone
+ * stall clocks and clocks with the NOR busy (RY low). Counters wrap.
+ *
+ * Writing R_PERFCTRL with SNAP set copies every counter to its snapshot at
+ * once; the snapshots are what R_PERFCNT reads return, counter i at
+ * R_PERFCNT + 2*i (low half) and + 2*i + 1 (high half), so all of them can
+ * be read in one CFG read burst and are consistent with each other. CLR
+ * clears the counters, after the snapshot if both are set. The counters
+ * hold while STOP is set.
+ *
+ */
+
+`include "busmap.vh"
+`include "cmd_defs.vh"
+
+`default_nettype none
+`timescale 1ns/10ps
+
+module perf_counters #(
+    parameter CFGWBADDRBITS = `CFGWBADDRBITS,
+    parameter CFGWBDATABITS = `CFGWBDATABITS,
+    parameter SPICMDBITS    = `SPI_CMD_BITS
+) (
+    // system
+    input                          sys_clk_i,
+
+    // cfg wishbone interface
+    input                          cfgwb_rst_i,
+    input      [CFGWBADDRBITS-1:0] cfgwb_adr_i,
+    input      [CFGWBDATABITS-1:0] cfgwb_dat_i,
+    input                          cfgwb_we_i,
+    input                          cfgwb_stb_i,
+    input                          cfgwb_cyc_i,
+    output reg                     cfgwb_err_o,
+    output reg                     cfgwb_ack_o,
+    output reg [CFGWBDATABITS-1:0] cfgwb_dat_o,
+    output                         cfgwb_stall_o,
+
+    // events
+    input                          frame_i,  // QSPI command received
+    input         [SPICMDBITS-1:0] cmd_i,    // its opcode
+    input                          nor_rd_i,
+    input                          nor_rdpg_i,
+    input                          nor_wr_i,
+    input                          mem_stall_i,
+    input                          nor_ry_i  // RY of all chips, unsynchronized
+);
+
+    localparam N = `PERF_COUNTERS;
+
+    reg  [CFGWBDATABITS-1:0] r_perfctrl;
+    wire                     r_perfctrl_stop = r_perfctrl[`R_PERFCTRL_STOP_SHIFT];
+
+    wire ry;
+    sync2ps #(.R(1)) sync_ry (.clk(sys_clk_i), .rst(cfgwb_rst_i), .d(nor_ry_i), .q(ry));
+
+    // events, one bit per counter
+    reg [N-1:0] ev;
+    always @(*) begin
+        ev = 'b0;
+        ev[`PERF_CNT_CLK] = 'b1;
+        if (frame_i) case (cmd_i)
+            `SPI_COMMAND_READ:       ev[`PERF_CNT_READ]       = 'b1;
+            `SPI_COMMAND_FAST_READ:  ev[`PERF_CNT_FAST_READ]  = 'b1;
+            `SPI_COMMAND_WRITE_THRU: ev[`PERF_CNT_WRITE_THRU] = 'b1;
+            `SPI_COMMAND_WAIT_READY: ev[`PERF_CNT_WAIT_READY] = 'b1;
+            `SPI_COMMAND_DIFF_READ:  ev[`PERF_CNT_DIFF_READ]  = 'b1;
+            `SPI_COMMAND_LOOPBACK:   ev[`PERF_CNT_LOOPBACK]   = 'b1;
+            default:                 ev[`PERF_CNT_OTHER]      = 'b1;
+        endcase
+        ev[`PERF_CNT_NOR_RD]    = nor_rd_i;
+        ev[`PERF_CNT_NOR_RDPG]  = nor_rdpg_i;
+        ev[`PERF_CNT_NOR_WR]    = nor_wr_i;
+        ev[`PERF_CNT_MEM_STALL] = mem_stall_i;
+        ev[`PERF_CNT_RY_BUSY]   = !ry;
+    end
+
+    // counters and snapshots
+    wire ctrl_wr = cfgwb_cyc_i && cfgwb_stb_i && cfgwb_we_i && (cfgwb_adr_i == `R_PERFCTRL);
+    wire snap    = ctrl_wr && cfgwb_dat_i[`R_PERFCTRL_SNAP_SHIFT];
+    wire clr     = ctrl_wr && cfgwb_dat_i[`R_PERFCTRL_CLR_SHIFT];
+
+    reg [32*N-1:0] cnt;
+    reg [32*N-1:0] snap_q;
+    genvar i;
+    generate
+        for (i = 0; i < N; i = i + 1) begin : counter
+            always @(posedge sys_clk_i) begin
+                if (cfgwb_rst_i || clr)
+                    cnt[32*i+:32] <= 'b0;
+                else if (ev[i] && !r_perfctrl_stop)
+                    cnt[32*i+:32] <= cnt[32*i+:32] + 1'b1;
+                if (cfgwb_rst_i)
+                    snap_q[32*i+:32] <= 'b0;
+                else if (snap)
+                    snap_q[32*i+:32] <= cnt[32*i+:32];
+            end
+        end
+    endgenerate
+
+    // cfg read/write
+    wire [CFGWBADDRBITS-1:0] cnt_off = cfgwb_adr_i - `R_PERFCNT;
+    wire                     cnt_sel = (cfgwb_adr_i >= `R_PERFCNT) && (cnt_off < 2*N);
+    wire              [31:0] cnt_rd  = snap_q[32*cnt_off[CFGWBADDRBITS-1:1]+:32];
+
+    assign cfgwb_stall_o = 'b0;
+    always @(posedge sys_clk_i) begin
+        cfgwb_ack_o <= 'b0;
+        cfgwb_dat_o <= 'b0;
+        cfgwb_err_o <= 'b0;
+        if (cfgwb_rst_i) begin
+            r_perfctrl <= 'b0;
+        end else if (cfgwb_cyc_i && cfgwb_stb_i) begin
+            cfgwb_ack_o <= 'b1;
+            if (cfgwb_we_i) begin
+                case (cfgwb_adr_i)
+                    `R_PERFCTRL: r_perfctrl  <= cfgwb_dat_i & `R_PERFCTRL_STOP_MASK;
+                    default:     cfgwb_err_o <= 'b1;
+                endcase
+            end else if (cfgwb_adr_i == `R_PERFCTRL) begin
+                cfgwb_dat_o <= r_perfctrl;
+            end else if (cnt_sel) begin
+                cfgwb_dat_o <= cnt_off[0] ? cnt_rd[31:16] : cnt_rd[15:0];
+            end else begin
+                cfgwb_err_o <= 'b1;
+            end
+        end
+    end
+
+endmodule
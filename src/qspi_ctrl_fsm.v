@@ -20,7 +20,8 @@ module qspi_ctrl_fsm #(
     parameter SPIADDRBITS   = `SPI_ADDR_BITS,
     parameter SPIWAITCYCLES = `SPI_WAIT_CYC,
     parameter SPIDATABITS   = `SPI_DATA_BITS,
-    parameter IOREG_BITS    = 32
+    parameter IOREG_BITS    = 32,
+    parameter PIPEDEPTH     = `PIPE_DEPTH
 ) (
     input reset_i, // synchronous to local clock
     input clk_i, // local clock
@@ -36,6 +37,13 @@ module qspi_ctrl_fsm #(
     // controller requests
     output reg                        vt_mode,
     output reg                        passthrough_en_o,
+    // nor_check DIFF record stream
+    output                            diff_rd_o,
+    output                            diff_end_o,
+    input         [MEMWBDATABITS-1:0] diff_dat_i,
+    // performance counter events
+    output                            perf_frame_o, // command received
+    output           [SPICMDBITS-1:0] perf_cmd_o,
     // debug
     output                            d_wstb,
 
@@ -43,6 +51,8 @@ module qspi_ctrl_fsm #(
     output reg                        memwb_cyc_o,
     output reg                        memwb_stb_o,
     output reg                        memwb_we_o,
+    output                      [2:0] memwb_cti_o,
+    output                      [1:0] memwb_bte_o,
     output reg    [MEMWBADDRBITS-1:0] memwb_adr_o,
     output reg    [MEMWBDATABITS-1:0] memwb_dat_o,
     input                             memwb_err_i,
@@ -55,7 +65,7 @@ module qspi_ctrl_fsm #(
     output reg    [CFGWBADDRBITS-1:0] cfgwb_adr_o,
     output reg    [CFGWBDATABITS-1:0] cfgwb_dat_o,
     output reg                        cfgwb_we_o,
-    output reg                        cfgwb_stb_o, // TODO: one stb per peripheral
+    output reg                        cfgwb_stb_o,
     output reg                        cfgwb_cyc_o,
     input                             cfgwb_err_i,
     input                             cfgwb_ack_i,
@@ -77,6 +87,9 @@ module qspi_ctrl_fsm #(
 
     assign d_wstb = spistbcmd | spistbadr | spistbrrq | spistbwrq;
 
+    assign perf_frame_o = spistbcmd;
+    assign perf_cmd_o   = spicmd;
+
     qspi_if qspi_if (
         .i_clk(clk_i), .i_rst(reset_i),
         // spi phy
@@ -89,7 +102,9 @@ module qspi_ctrl_fsm #(
         .i_spidata(spidata_ctrl)
     );
 
-    ctrl ctrl (
+    ctrl #(
+        .PIPEDEPTH(PIPEDEPTH)
+    ) ctrl (
         .i_clk(clk_i), .i_sysrst(reset_i),
         // spi
         .i_spirst(spirst), .i_spistbcmd(spistbcmd), .i_spistbadr(spistbadr),
@@ -98,6 +113,7 @@ module qspi_ctrl_fsm #(
         .o_spidata(spidata_ctrl),
         // memory wishbone
         .o_memwb_cyc(memwb_cyc_o), .o_memwb_stb(memwb_stb_o), .o_memwb_we(memwb_we_o),
+        .o_memwb_cti(memwb_cti_o), .o_memwb_bte(memwb_bte_o),
         .o_memwb_adr(memwb_adr_o), .o_memwb_dat(memwb_dat_o),
         .i_memwb_err(memwb_err_i), .i_memwb_ack(memwb_ack_i), .i_memwb_stall(memwb_stall_i),
         .i_memwb_dat(memwb_dat_i),
@@ -107,8 +123,69 @@ module qspi_ctrl_fsm #(
         .o_cfgwb_adr(cfgwb_adr_o), .o_cfgwb_dat(cfgwb_dat_o),
         .i_cfgwb_err(cfgwb_err_i), .i_cfgwb_ack(cfgwb_ack_i), .i_cfgwb_stall(cfgwb_stall_i),
         .i_cfgwb_dat(cfgwb_dat_i),
+        // diff stream
+        .o_diff_rd(diff_rd_o), .o_diff_end(diff_end_o), .i_diff_dat(diff_dat_i),
         // other
         .o_vtmode(vt_mode), .o_passthrough_en(passthrough_en_o)
     );
 
 endmodule
+
+/* qspi_regs
+ * QSPI configuration registers (CFG space at QSPIADDRBASE).
+ *
+ * R_QSPICTRL.SDLY selects falling edge input sampling in xspi_phy_slave
+ * (sdly_o). The PHY uses it unsynchronized in the SCK domain, so it must be
+ * written as the last word of a frame.
+ */
+module qspi_regs #(
+    parameter CFGWBADDRBITS = `CFGWBADDRBITS,
+    parameter CFGWBDATABITS = `CFGWBDATABITS
+) (
+    // system
+    input                          sys_clk_i,
+
+    // cfg wishbone interface
+    input                          cfgwb_rst_i,
+    input      [CFGWBADDRBITS-1:0] cfgwb_adr_i,
+    input      [CFGWBDATABITS-1:0] cfgwb_dat_i,
+    input                          cfgwb_we_i,
+    input                          cfgwb_stb_i,
+    input                          cfgwb_cyc_i,
+    output reg                     cfgwb_err_o,
+    output reg                     cfgwb_ack_o,
+    output reg [CFGWBDATABITS-1:0] cfgwb_dat_o,
+    output                         cfgwb_stall_o,
+
+    // phy control
+    output                         sdly_o
+);
+
+    reg [CFGWBDATABITS-1:0] r_qspictrl;
+
+    assign sdly_o = r_qspictrl[`R_QSPICTRL_SDLY_SHIFT];
+
+    assign cfgwb_stall_o = 'b0;
+    always @(posedge sys_clk_i) begin
+        cfgwb_ack_o <= 'b0;
+        cfgwb_dat_o <= 'b0;
+        cfgwb_err_o <= 'b0;
+        if (cfgwb_rst_i) begin
+            r_qspictrl <= `R_QSPICTRL_RST_VAL;
+        end else if (cfgwb_cyc_i && cfgwb_stb_i) begin
+            cfgwb_ack_o <= 'b1;
+            if (cfgwb_we_i) begin
+                case (cfgwb_adr_i)
+                    `R_QSPICTRL: r_qspictrl  <= cfgwb_dat_i & `R_QSPICTRL_SDLY_MASK;
+                    default:     cfgwb_err_o <= 'b1;
+                endcase
+            end else begin
+                case (cfgwb_adr_i)
+                    `R_QSPICTRL: cfgwb_dat_o <= r_qspictrl;
+                    default:     cfgwb_err_o <= 'b1;
+                endcase
+            end
+        end
+    end
+
+endmodule
@@ -134,7 +134,10 @@ module qspi_if #(
             `SPI_STATE_ADDR: case (o_spicmd)
                 `SPI_COMMAND_READ:       spi_state_next = `SPI_STATE_READ_DATA;
                 `SPI_COMMAND_FAST_READ:  spi_state_next = `SPI_STATE_STALL;
+                `SPI_COMMAND_WAIT_READY: spi_state_next = `SPI_STATE_STALL;
+                `SPI_COMMAND_DIFF_READ:  spi_state_next = `SPI_STATE_STALL;
                 `SPI_COMMAND_WRITE_THRU: spi_state_next = `SPI_STATE_WRITE_DATA;
+                `SPI_COMMAND_LOOPBACK:   spi_state_next = `SPI_STATE_READ_DATA;
                 default:                 spi_state_next = `SPI_STATE_CMD;
             endcase
             `SPI_STATE_STALL:            spi_state_next = `SPI_STATE_READ_DATA;
@@ -11,8 +11,10 @@
 `timescale 1ns/10ps
 
 module top #(
-    parameter ADDRBITS = 26,
-    parameter DATABITS = 16
+    parameter ADDRBITS  = 26,
+    parameter DATABITS  = 16,
+    parameter PIPEDEPTH = `PIPE_DEPTH,
+    parameter NORCHIPS  = `NOR_CHIPS
 ) (
     input reset_i, clk_i,
 
@@ -24,11 +26,11 @@ module top #(
     input                     pad_spi_sce_i,
 
     // NOR interface
-    input                     nor_ry_i,
+    input      [NORCHIPS-1:0] nor_ry_i,
     input      [DATABITS-1:0] nor_data_i,
     output reg [DATABITS-1:0] nor_data_o,
     output reg [ADDRBITS-1:0] nor_addr_o,
-    output reg                nor_ce_o,
+    output reg [NORCHIPS-1:0] nor_ce_o,
     output                    nor_we_o,
     output reg                nor_oe_o,
     output reg                nor_data_oe, // 0 = input, 1 = output
@@ -55,20 +57,77 @@ module top #(
 
     // wb connecting qspi and nor controller
     wire memwb_cyc, memwb_stb, memwb_we, memwb_err, memwb_ack, memwb_stall;
+    wire [2:0] memwb_cti;
+    wire [1:0] memwb_bte;
     wire [ADDRBITS-1:0] memwb_adr;
     wire [DATABITS-1:0] memwb_dat_i; // MOSI
     wire [DATABITS-1:0] memwb_dat_o; // MISO
 
+    // memory wb masters: qspi controller and nor_check engine
+    wire memwb_ctrl_cyc, memwb_ctrl_stb, memwb_ctrl_we;
+    wire [2:0] memwb_ctrl_cti;
+    wire [1:0] memwb_ctrl_bte;
+    wire [ADDRBITS-1:0] memwb_ctrl_adr;
+    wire [DATABITS-1:0] memwb_ctrl_dat;
+    wire memwb_chk_cyc, memwb_chk_stb, memwb_chk_we;
+    wire [2:0] memwb_chk_cti;
+    wire [1:0] memwb_chk_bte;
+    wire [ADDRBITS-1:0] memwb_chk_adr;
+    wire [DATABITS-1:0] memwb_chk_dat;
+    wire chk_busy;
+    wire chk_diff_rd, chk_diff_end;
+    wire [DATABITS-1:0] chk_diff_dat;
+
+    // nor_check owns the bus while it runs, the controller sees a stall.
+    // Its start is not gated on the controller's memory bus being idle: only
+    // ctrl can issue the CFG write that starts it, and ctrl's memory cycles
+    // belong to memory frames (a read burst ends with CS, a write's single
+    // cycle well before the next frame's command and address are in).
+    assign memwb_cyc   = chk_busy ? memwb_chk_cyc : memwb_ctrl_cyc;
+    assign memwb_stb   = chk_busy ? memwb_chk_stb : memwb_ctrl_stb;
+    assign memwb_we    = chk_busy ? memwb_chk_we  : memwb_ctrl_we;
+    assign memwb_cti   = chk_busy ? memwb_chk_cti : memwb_ctrl_cti;
+    assign memwb_bte   = chk_busy ? memwb_chk_bte : memwb_ctrl_bte;
+    assign memwb_adr   = chk_busy ? memwb_chk_adr : memwb_ctrl_adr;
+    assign memwb_dat_i = chk_busy ? memwb_chk_dat : memwb_ctrl_dat;
+
     // configuration wb
     wire cfgwb_cyc, cfgwb_stb, cfgwb_we, cfgwb_err, cfgwb_ack, cfgwb_stall, cfgwb_rst;
     wire [`CFGWBADDRBITS-1:0] cfgwb_adr;
     wire [`CFGWBDATABITS-1:0] cfgwb_dat_i; // MOSI
     // each slave must have its own data bus
-    wire [`CFGWBDATABITS-1:0] cfgwb_dat_nor_bus_o; // MISO from nor_bus
-    wire [`CFGWBDATABITS-1:0] cfgwb_dat_o = cfgwb_dat_nor_bus_o; // MISO
+    wire [`CFGWBDATABITS-1:0] cfgwb_dat_qspi_o;      // MISO from qspi_regs
+    wire [`CFGWBDATABITS-1:0] cfgwb_dat_nor_bus_o;   // MISO from nor_bus
+    wire [`CFGWBDATABITS-1:0] cfgwb_dat_nor_check_o; // MISO from nor_check
+    wire [`CFGWBDATABITS-1:0] cfgwb_dat_perf_o;      // MISO from perf_counters
+    // slaves drive zero when not acking a read
+    wire [`CFGWBDATABITS-1:0] cfgwb_dat_o = cfgwb_dat_qspi_o | cfgwb_dat_nor_bus_o | cfgwb_dat_nor_check_o | cfgwb_dat_perf_o; // MISO
+    wire cfgwb_ack_qspi, cfgwb_err_qspi, cfgwb_stall_qspi;
+    wire cfgwb_ack_nor_bus, cfgwb_err_nor_bus, cfgwb_stall_nor_bus;
+    wire cfgwb_ack_nor_check, cfgwb_err_nor_check, cfgwb_stall_nor_check;
+    wire cfgwb_ack_perf, cfgwb_err_perf, cfgwb_stall_perf;
+    reg  cfgwb_err_unmapped;
+    assign cfgwb_ack   = cfgwb_ack_qspi   | cfgwb_ack_nor_bus   | cfgwb_ack_nor_check   | cfgwb_ack_perf;
+    assign cfgwb_err   = cfgwb_err_qspi   | cfgwb_err_nor_bus   | cfgwb_err_nor_check   | cfgwb_err_perf | cfgwb_err_unmapped;
+    assign cfgwb_stall = cfgwb_stall_qspi | cfgwb_stall_nor_bus | cfgwb_stall_nor_check | cfgwb_stall_perf;
+
+    // cfg address decode, one stb per peripheral
+    wire [`CFGWBADDRBITS-1:0] cfgwb_adr_mod = cfgwb_adr & `CFGWBMODMASK;
+    wire cfgwb_sel_qspi      = cfgwb_adr_mod == `QSPIADDRBASE;
+    wire cfgwb_sel_nor_bus   = cfgwb_adr_mod == `NBUSADDRBASE;
+    wire cfgwb_sel_nor_check = cfgwb_adr_mod == `NCHKADDRBASE;
+    wire cfgwb_sel_perf      = cfgwb_adr_mod == `PERFADDRBASE;
+    always @(posedge clk_i)
+        cfgwb_err_unmapped <= !reset_i && cfgwb_cyc && cfgwb_stb &&
+                              !(cfgwb_sel_qspi || cfgwb_sel_nor_bus || cfgwb_sel_nor_check || cfgwb_sel_perf);
+
+    // performance counter events
+    wire                      perf_frame, perf_nor_rd, perf_nor_rdpg, perf_nor_wr;
+    wire [`SPI_CMD_BITS-1:0]  perf_cmd;
 
     reg         txndir, txndone;
     reg   [7:0] txnbc;
+    wire        spi_sdly;
     wire [31:0] txndata_mosi;
     reg  [31:0] txndata_miso;
 
@@ -104,7 +163,8 @@ module top #(
     ) xspi_slave (
         .sck_i(spi_sck), .sce_i(spi_sce), .sio_oe(spi_io_oe), .sio_i(spi_io_i), .sio_o(spi_io_o),
         .txnbc_i(txnbc), .txndir_i(txndir), .txndata_i(txndata_mosi),
-        .txndata_o(txndata_miso), .txndone_o(txndone)
+        .txndata_o(txndata_miso), .txndone_o(txndone),
+        .sdly_i(spi_sdly)
     );
 
     qspi_ctrl_fsm #(
@@ -116,7 +176,8 @@ module top #(
         .SPIADDRBITS(`SPI_ADDR_BITS),
         .SPIWAITCYCLES(`SPI_WAIT_CYC),
         .SPIDATABITS(`SPI_DATA_BITS),
-        .IOREG_BITS(32)
+        .IOREG_BITS(32),
+        .PIPEDEPTH(PIPEDEPTH)
     ) qspi_ctrl (
         // general
         .reset_i(reset_i), .clk_i(clk_i),
@@ -126,9 +187,12 @@ module top #(
         // control
         .vt_mode(vt_mode), .d_wstb(dbg_txndone),
         .passthrough_en_o(passthrough_en_o),
+        .diff_rd_o(chk_diff_rd), .diff_end_o(chk_diff_end), .diff_dat_i(chk_diff_dat),
+        .perf_frame_o(perf_frame), .perf_cmd_o(perf_cmd),
         // mem wb
-        .memwb_cyc_o(memwb_cyc), .memwb_stb_o(memwb_stb), .memwb_we_o(memwb_we), .memwb_err_i(memwb_err),
-        .memwb_adr_o(memwb_adr), .memwb_dat_o(memwb_dat_i), .memwb_ack_i(memwb_ack), .memwb_stall_i(memwb_stall),
+        .memwb_cyc_o(memwb_ctrl_cyc), .memwb_stb_o(memwb_ctrl_stb), .memwb_we_o(memwb_ctrl_we), .memwb_err_i(memwb_err && !chk_busy),
+        .memwb_cti_o(memwb_ctrl_cti), .memwb_bte_o(memwb_ctrl_bte),
+        .memwb_adr_o(memwb_ctrl_adr), .memwb_dat_o(memwb_ctrl_dat), .memwb_ack_i(memwb_ack && !chk_busy), .memwb_stall_i(memwb_stall || chk_busy),
         .memwb_dat_i(memwb_dat_o),
         // cfg wb
         .cfgwb_rst_o(cfgwb_rst),
@@ -138,9 +202,25 @@ module top #(
         .cfgwb_ack_i(cfgwb_ack), .cfgwb_dat_i(cfgwb_dat_o), .cfgwb_stall_i(cfgwb_stall)
     );
 
+    qspi_regs #(
+        .CFGWBADDRBITS(`CFGWBADDRBITS), .CFGWBDATABITS(`CFGWBDATABITS)
+    ) qspiregs (
+        // system
+        .sys_clk_i(clk_i),
+        // cfg wb
+        .cfgwb_rst_i(cfgwb_rst),
+        .cfgwb_adr_i(cfgwb_adr), .cfgwb_dat_i(cfgwb_dat_i),
+        .cfgwb_we_i(cfgwb_we), .cfgwb_stb_i(cfgwb_stb && cfgwb_sel_qspi), .cfgwb_cyc_i(cfgwb_cyc),
+        .cfgwb_err_o(cfgwb_err_qspi),
+        .cfgwb_ack_o(cfgwb_ack_qspi), .cfgwb_dat_o(cfgwb_dat_qspi_o), .cfgwb_stall_o(cfgwb_stall_qspi),
+        // phy
+        .sdly_o(spi_sdly)
+    );
+
     nor_bus #(
         .MEMWBADDRBITS(`NORADDRBITS), .MEMWBDATABITS(`NORDATABITS),
-        .CFGWBADDRBITS(`CFGWBADDRBITS), .CFGWBDATABITS(`CFGWBDATABITS)
+        .CFGWBADDRBITS(`CFGWBADDRBITS), .CFGWBDATABITS(`CFGWBDATABITS),
+        .NORCHIPS(NORCHIPS)
     ) norbus (
         // system
         .sys_rst_i(reset_i), .sys_clk_i(clk_i),
@@ -148,19 +228,63 @@ module top #(
         .memwb_rst_i(reset_i),
         .memwb_adr_i(memwb_adr), .memwb_dat_i(memwb_dat_i),
         .memwb_we_i(memwb_we), .memwb_stb_i(memwb_stb), .memwb_cyc_i(memwb_cyc),
+        .memwb_cti_i(memwb_cti), .memwb_bte_i(memwb_bte),
         .memwb_err_o(memwb_err),
         .memwb_ack_o(memwb_ack), .memwb_dat_o(memwb_dat_o), .memwb_stall_o(memwb_stall),
         // cfg wb
         .cfgwb_rst_i(cfgwb_rst),
         .cfgwb_adr_i(cfgwb_adr), .cfgwb_dat_i(cfgwb_dat_i),
-        .cfgwb_we_i(cfgwb_we), .cfgwb_stb_i(cfgwb_stb), .cfgwb_cyc_i(cfgwb_cyc),
-        .cfgwb_err_o(cfgwb_err),
-        .cfgwb_ack_o(cfgwb_ack), .cfgwb_dat_o(cfgwb_dat_nor_bus_o), .cfgwb_stall_o(cfgwb_stall),
+        .cfgwb_we_i(cfgwb_we), .cfgwb_stb_i(cfgwb_stb && cfgwb_sel_nor_bus), .cfgwb_cyc_i(cfgwb_cyc),
+        .cfgwb_err_o(cfgwb_err_nor_bus),
+        .cfgwb_ack_o(cfgwb_ack_nor_bus), .cfgwb_dat_o(cfgwb_dat_nor_bus_o), .cfgwb_stall_o(cfgwb_stall_nor_bus),
         // nor
         .nor_ry_i(nor_ry_i), .nor_data_i(nor_data_i),
         .nor_data_o(nor_data_o), .nor_addr_o(nor_addr_o),
         .nor_ce_o(nor_ce_o), .nor_we_o(nor_we_int), .nor_oe_o(nor_oe_o),
-        .nor_data_oe(nor_data_oe)
+        .nor_data_oe(nor_data_oe),
+        // perf
+        .perf_rd_o(perf_nor_rd), .perf_rdpg_o(perf_nor_rdpg), .perf_wr_o(perf_nor_wr)
+    );
+
+    nor_check #(
+        .MEMWBADDRBITS(`NORADDRBITS), .MEMWBDATABITS(`NORDATABITS),
+        .CFGWBADDRBITS(`CFGWBADDRBITS), .CFGWBDATABITS(`CFGWBDATABITS)
+    ) norcheck (
+        // system
+        .sys_rst_i(reset_i), .sys_clk_i(clk_i),
+        // cfg wb
+        .cfgwb_rst_i(cfgwb_rst),
+        .cfgwb_adr_i(cfgwb_adr), .cfgwb_dat_i(cfgwb_dat_i),
+        .cfgwb_we_i(cfgwb_we), .cfgwb_stb_i(cfgwb_stb && cfgwb_sel_nor_check), .cfgwb_cyc_i(cfgwb_cyc),
+        .cfgwb_err_o(cfgwb_err_nor_check),
+        .cfgwb_ack_o(cfgwb_ack_nor_check), .cfgwb_dat_o(cfgwb_dat_nor_check_o), .cfgwb_stall_o(cfgwb_stall_nor_check),
+        // mem wb
+        .memwb_cyc_o(memwb_chk_cyc), .memwb_stb_o(memwb_chk_stb), .memwb_we_o(memwb_chk_we),
+        .memwb_cti_o(memwb_chk_cti), .memwb_bte_o(memwb_chk_bte),
+        .memwb_adr_o(memwb_chk_adr), .memwb_dat_o(memwb_chk_dat),
+        .memwb_err_i(memwb_err), .memwb_ack_i(memwb_ack && chk_busy), .memwb_stall_i(memwb_stall),
+        .memwb_dat_i(memwb_dat_o),
+        // control
+        .busy_o(chk_busy),
+        .diff_rd_i(chk_diff_rd), .diff_end_i(chk_diff_end), .diff_dat_o(chk_diff_dat)
+    );
+
+    perf_counters #(
+        .CFGWBADDRBITS(`CFGWBADDRBITS), .CFGWBDATABITS(`CFGWBDATABITS),
+        .SPICMDBITS(`SPI_CMD_BITS)
+    ) perf (
+        // system
+        .sys_clk_i(clk_i),
+        // cfg wb
+        .cfgwb_rst_i(cfgwb_rst),
+        .cfgwb_adr_i(cfgwb_adr), .cfgwb_dat_i(cfgwb_dat_i),
+        .cfgwb_we_i(cfgwb_we), .cfgwb_stb_i(cfgwb_stb && cfgwb_sel_perf), .cfgwb_cyc_i(cfgwb_cyc),
+        .cfgwb_err_o(cfgwb_err_perf),
+        .cfgwb_ack_o(cfgwb_ack_perf), .cfgwb_dat_o(cfgwb_dat_perf_o), .cfgwb_stall_o(cfgwb_stall_perf),
+        // events
+        .frame_i(perf_frame), .cmd_i(perf_cmd),
+        .nor_rd_i(perf_nor_rd), .nor_rdpg_i(perf_nor_rdpg), .nor_wr_i(perf_nor_wr),
+        .mem_stall_i(memwb_cyc && memwb_stall), .nor_ry_i(&nor_ry_i)
     );
 
 endmodule
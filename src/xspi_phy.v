@@ -60,6 +60,12 @@ endmodule
  *
  * Only supports SPI with CPOL = CPHA (data changes on falling edge, latched on rising).
  *
+ * With sdly_i set, sio_i is sampled on the falling edge of sck_i instead of
+ * the rising edge (half a cycle later) and txndone_o follows half a cycle
+ * later as well. This gives more input margin for late data at the cost of
+ * less time to provide the next read word. sdly_i must only change while
+ * sce_i is low.
+ *
  * NOTE: !sce_i is the only reset
  * 
  * Parameters:
@@ -82,8 +88,11 @@ module xspi_phy_slave #(
     input      [CYCLE_COUNT_BITS-1:0] txnbc_i,   // transaction bit count
     input                             txndir_i,  // transaction direction, 0 = read, 1 = write
     input             [WORD_SIZE-1:0] txndata_i,
-    output reg        [WORD_SIZE-1:0] txndata_o,
-    output reg                        txndone_o  // high for one cycle when data has been received
+    output            [WORD_SIZE-1:0] txndata_o,
+    output                            txndone_o, // high for one cycle when data has been received
+
+    // sample delay: 0 = sample on rising edge, 1 = sample on falling edge
+    input                             sdly_i
 );
 
     localparam WORD_SIZE_BITS = $clog2(WORD_SIZE);
@@ -94,6 +103,8 @@ module xspi_phy_slave #(
     //wire                  [2:0] bc_odd_mask; // mask low bits for extra cycle check
     wire                        sce_i_b; // negative sce so we can trigger on posedge for reset
     wire                        cycle_stb;
+    reg                         txndone_pe, txndone_ne;
+    reg         [WORD_SIZE-1:0] txndata_pe, txndata_ne;
 
     assign sce_i_b = !sce_i;
     assign outdata_index = txn_cycles - cycle_counter; // index of SPI word in data word
@@ -115,7 +126,7 @@ module xspi_phy_slave #(
     always @(negedge sck_i or negedge sce_i)
         if (!sce_i) begin
             cycle_counter <= 'b0;
-        end else if (txndone_o) begin
+        end else if (txndone_pe) begin
             cycle_counter <= 'b0;
         end else begin
             cycle_counter <= cycle_counter + 'b1;
@@ -123,8 +134,15 @@ module xspi_phy_slave #(
 
     // signal done on POSITIVE edge
     always @(posedge sck_i or posedge sce_i_b)
-        if (sce_i_b) txndone_o <= 1'b0;
-        else         txndone_o <= cycle_stb;
+        if (sce_i_b) txndone_pe <= 1'b0;
+        else         txndone_pe <= cycle_stb;
+
+    // delayed done for falling edge sampling
+    always @(negedge sck_i or posedge sce_i_b)
+        if (sce_i_b) txndone_ne <= 1'b0;
+        else         txndone_ne <= txndone_pe;
+
+    assign txndone_o = sdly_i ? txndone_ne : txndone_pe;
 
     // SPI
 
@@ -132,9 +150,15 @@ module xspi_phy_slave #(
     always @(*) sio_o = txndata_i[4*outdata_index[WORD_SIZE_BITS-1:0]+:4];
 
     always @(posedge sck_i) begin
-        txndata_o <= { txndata_o[WORD_SIZE-5:0], sio_i[3:0] };
+        txndata_pe <= { txndata_pe[WORD_SIZE-5:0], sio_i[3:0] };
     end
 
+    always @(negedge sck_i) begin
+        txndata_ne <= { txndata_ne[WORD_SIZE-5:0], sio_i[3:0] };
+    end
+
+    assign txndata_o = sdly_i ? txndata_ne : txndata_pe;
+
 `ifdef FORMAL
     // SPI inputs are synchronous to sck_i.
     // txn inputs are ~synchronous to txndone_o.
@@ -150,6 +174,9 @@ module xspi_phy_slave #(
     initial f_sck_past_valid = 0;
     always @(negedge sck_i) f_sck_past_valid = 1;
 
+    // properties below are for rising edge sampling
+    always @(*) assume(!sdly_i);
+
     // reset assumptions
     initial assume(!sce_i);
     always @(*) if (!f_sck_past_valid) assume(!sce_i);